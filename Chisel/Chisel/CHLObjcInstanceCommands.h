@@ -3,6 +3,8 @@
 // This source code is licensed under the MIT license found in the
 // LICENSE file in the root directory of this source tree.
 
+#include <stdint.h>
+
 @class NSPredicate;
 
 #if defined(__cplusplus)
@@ -13,6 +15,45 @@ extern "C" {
 // The predicate format is anything supported by NSPredicate.
 void PrintInstances(const char *type, const char *pred);
 
+// An allocation that appears to be an Objective-C instance. The fields are fixed width so the
+// debugger can read records straight out of memory.
+typedef struct {
+  uint64_t address;
+  uint64_t cls;
+  uint64_t size;
+} CHLInstanceRecord;
+
+typedef struct {
+  uint64_t count;
+  CHLInstanceRecord records[];
+} CHLInstanceCensus;
+
+// Debugger interface for taking a census of the heap. Returns a malloc'd census of every viable
+// Objective-C instance, in heap order. The caller frees it.
+CHLInstanceCensus *CHLCopyInstanceCensus(void);
+
+// The instances of one class: their count and their total malloc size.
+typedef struct {
+  uint64_t cls;
+  uint64_t count;
+  uint64_t size;
+} CHLClassRecord;
+
+typedef struct {
+  uint64_t count;
+  CHLClassRecord records[];
+} CHLClassCensus;
+
+// Debugger interface for taking a census of the heap grouped by class. Returns a malloc'd census
+// with one record per class that has viable instances. The caller frees it.
+CHLClassCensus *CHLCopyClassCensus(void);
+
+// Debugger interface for filtering the instances of a census. Evaluates the predicate on each
+// instance whose class is one of `classes`, and returns a malloc'd string with one line per match,
+// in the format PrintInstances uses. The caller frees it.
+char *CHLCopyMatchingInstances(const CHLInstanceCensus *census, const uint64_t *classes,
+                               uint64_t classCount, const char *pred);
+
 #if defined(__cplusplus)
 }
 #endif
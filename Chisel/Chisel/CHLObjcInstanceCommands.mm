@@ -6,6 +6,9 @@
 #import "CHLObjcInstanceCommands.h"
 
 #include <objc/runtime.h>
+#include <string>
+#include <unordered_map>
+#include <unordered_set>
 #include <vector>
 
 #import <CoreFoundation/CoreFoundation.h>
@@ -71,12 +74,27 @@ static bool predicatePrecheck(id obj, const std::unordered_set<Class> &classSet)
   return args.isValid;
 }
 
-static void printObject(id obj, NSSet *keyPaths) {
-  printf("<%s: %p", object_getClassName(obj), obj);
+static void appendObject(std::string &output, id obj, NSSet *keyPaths) {
+  char address[32];
+  snprintf(address, sizeof(address), "%p", obj);
+  output += "<";
+  output += object_getClassName(obj);
+  output += ": ";
+  output += address;
   for (NSString *keyPath in keyPaths) {
-    printf("; %s = %s", keyPath.UTF8String, [[obj valueForKeyPath:keyPath] description].UTF8String);
+    const char *value = [[obj valueForKeyPath:keyPath] description].UTF8String;
+    output += "; ";
+    output += keyPath.UTF8String;
+    output += " = ";
+    output += value ?: "(null)";
   }
-  printf(">\n");
+  output += ">\n";
+}
+
+static void printObject(id obj, NSSet *keyPaths) {
+  std::string output;
+  appendObject(output, obj, keyPaths);
+  fputs(output.c_str(), stdout);
 }
 
 static bool objectIsMatch(NSPredicate *predicate, id obj, const std::unordered_set<Class> &classSet)
@@ -210,3 +228,87 @@ void PrintInstances(const char *type, const char *pred)
     printf("%d matches\n", matches);
   }
 }
+
+CHLInstanceCensus *CHLCopyInstanceCensus(void)
+{
+  auto instances = CHLScanObjcInstances(CHLObjcClassSet());
+
+  auto census = (CHLInstanceCensus *)malloc(sizeof(CHLInstanceCensus) +
+                                            instances.size() * sizeof(CHLInstanceRecord));
+  if (census == nullptr) {
+    return nullptr;
+  }
+
+  census->count = instances.size();
+  for (size_t i = 0; i < instances.size(); ++i) {
+    id obj = instances[i];
+    census->records[i] = {
+      (uint64_t)obj,
+      (uint64_t)object_getClass(obj),
+      (uint64_t)malloc_size(obj),
+    };
+  }
+  return census;
+}
+
+CHLClassCensus *CHLCopyClassCensus(void)
+{
+  auto instances = CHLScanObjcInstances(CHLObjcClassSet());
+
+  std::unordered_map<Class, CHLClassRecord> classRecords;
+  for (id obj : instances) {
+    Class cls = object_getClass(obj);
+    auto &record = classRecords[cls];
+    record.cls = (uint64_t)cls;
+    record.count += 1;
+    record.size += malloc_size(obj);
+  }
+
+  auto census = (CHLClassCensus *)malloc(sizeof(CHLClassCensus) +
+                                         classRecords.size() * sizeof(CHLClassRecord));
+  if (census == nullptr) {
+    return nullptr;
+  }
+
+  census->count = 0;
+  for (const auto &entry : classRecords) {
+    census->records[census->count++] = entry.second;
+  }
+  return census;
+}
+
+static char *copyString(const std::string &string)
+{
+  return strdup(string.c_str());
+}
+
+char *CHLCopyMatchingInstances(const CHLInstanceCensus *census, const uint64_t *classes,
+                               uint64_t classCount, const char *pred)
+{
+  NSPredicate *predicate = nil;
+  if (pred != nullptr && *pred != '\0') {
+    @try {
+      predicate = [NSPredicate predicateWithFormat:@(pred)];
+    } @catch (NSException *e) {
+      return copyString(std::string("Error: Invalid predicate; ") + [e reason].UTF8String + "\n");
+    }
+  }
+
+  const std::unordered_set<Class> objcClasses = CHLObjcClassSet();
+  const std::unordered_set<uint64_t> matchClasses{classes, classes + classCount};
+  NSSet *keyPaths = CHLVariableKeyPaths(predicate);
+
+  std::string output;
+  for (uint64_t i = 0; i < census->count; ++i) {
+    const auto &record = census->records[i];
+    if (matchClasses.find(record.cls) == matchClasses.end()) {
+      continue;
+    }
+
+    id obj = reinterpret_cast<id>(record.address);
+    if (objectIsMatch(predicate, obj, objcClasses)) {
+      appendObject(output, obj, keyPaths);
+    }
+  }
+  return copyString(output);
+}
@@ -0,0 +1,157 @@
+#!/usr/bin/python
+
+# Copyright (c) Facebook, Inc. and its affiliates. All Rights Reserved
+#
+# This source code is licensed under the MIT license found in the
+# LICENSE file in the root directory of this source tree.
+
+"""
+Counts the expressions evaluated by the type checks `visualize` and `copy`
+make, one expression at a time and batched with fb.batch(), against a stub
+`lldb` module that records every EvaluateExpression call.
+
+Run from the repository root:
+    python benchmarks/expression_batch.py
+"""
+
+import json
+import os
+import re
+import sys
+import types
+
+
+class StubError:
+    type = 0
+    value = 0
+    success = True
+
+    def Success(self):
+        return True
+
+    def Fail(self):
+        return False
+
+
+class StubValue:
+    def __init__(self, value):
+        self.value = value
+        self.error = StubError()
+
+    def GetError(self):
+        return self.error
+
+    def GetValue(self):
+        return self.value
+
+    def GetObjectDescription(self):
+        return self.value
+
+
+class StubFrame:
+    """
+    Answers every expression with a plausible value: batches and RETURN
+    expressions get a JSON array with one result per queued expression, which
+    the stub process hands back when the result is read.
+    """
+
+    def __init__(self):
+        self.expressionCount = 0
+        self.results = {}
+
+    def EvaluateExpression(self, expression, options):
+        self.expressionCount += 1
+        if "RETURN(" not in expression:
+            return StubValue("0x1" if "(id)" in expression else "1")
+        count = len(re.findall(r"@try", expression))
+        address = 0x1000 + len(self.results)
+        self.results[address] = json.dumps({"return": [True] * count})
+        return StubValue(hex(address))
+
+
+class StubProcess:
+    def __init__(self, frame):
+        self.frame = frame
+
+    def IsValid(self):
+        return True
+
+    def GetProcessID(self):
+        return 1
+
+    def GetStopID(self):
+        return 1
+
+    def GetSelectedThread(self):
+        return self
+
+    def GetSelectedFrame(self):
+        return self.frame
+
+    def ReadCStringFromMemory(self, address, size, error):
+        return self.frame.results[address]
+
+
+class StubTarget:
+    def __init__(self, process):
+        self.process = process
+
+    def GetProcess(self):
+        return self.process
+
+
+def installStubLLDB():
+    frame = StubFrame()
+    target = StubTarget(StubProcess(frame))
+    lldb = types.ModuleType("lldb")
+    lldb.debugger = types.SimpleNamespace(GetSelectedTarget=lambda: target)
+    lldb.SBError = StubError
+    lldb.SBExpressionOptions = lambda: types.SimpleNamespace(
+        SetLanguage=lambda *a: None,
+        SetTrapExceptions=lambda *a: None,
+        SetTimeoutInMicroSeconds=lambda *a: None,
+        SetTryAllThreads=lambda *a: None,
+    )
+    lldb.eLanguageTypeObjC = 0
+    lldb.eLanguageTypeObjC_plus_plus = 0
+    lldb.eErrorTypeExpression = -1
+    lldb.eExpressionParseError = -1
+    sys.modules["lldb"] = lldb
+    return frame
+
+
+CLASS_NAMES = ["UIImage", "UIColor", "UIView", "CALayer", "NSURL", "NSData"]
+
+
+def main():
+    frame = installStubLLDB()
+    sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+    import fbchisellldbbase as fb
+    import fbchisellldbobjecthelpers as objectHelpers
+
+    objects = ["(id)0x{:x}".format(0x100 + index) for index in range(20)]
+
+    start = frame.expressionCount
+    for obj in objects:
+        for className in CLASS_NAMES:
+            objectHelpers.isKindOfClass(obj, className)
+    unbatched = frame.expressionCount - start
+
+    start = frame.expressionCount
+    with fb.batch() as batch:
+        futures = [
+            objectHelpers.isKindOfClass(obj, className, batch=batch)
+            for obj in objects
+            for className in CLASS_NAMES
+        ]
+    assert all(future.result() for future in futures)
+    batched = frame.expressionCount - start
+
+    checks = len(objects) * len(CLASS_NAMES)
+    print("{} isKindOfClass checks".format(checks))
+    print("  one at a time: {} expressions".format(unbatched))
+    print("  batched:       {} expressions".format(batched))
+
+
+if __name__ == "__main__":
+    main()
@@ -5,11 +5,14 @@
 # This source code is licensed under the MIT license found in the
 # LICENSE file in the root directory of this source tree.
 
+import collections
+import json
 import os
 import re
 
 import fbchisellldbbase as fb
-import fbchisellldbobjecthelpers as objHelpers
+import fbchisellldbcache as cache
+import fbchisellldboutputhelpers as output
 
 
 # This is the key corresponding to accessibility label in
@@ -22,6 +25,7 @@ def lldbcommands():
         FBPrintAccessibilityLabels(),
         FBPrintAccessibilityIdentifiers(),
         FBFindViewByAccessibilityLabelCommand(),
+        FBAccessibilityAuditCommand(),
     ]
 
 
@@ -42,9 +46,25 @@ class FBPrintAccessibilityLabels(fb.FBCommand):
             )
         ]
 
+    def options(self):
+        return [
+            fb.FBCommandArgument(
+                arg="json",
+                short="-j",
+                long="--json",
+                type="BOOL",
+                boolean=True,
+                default=False,
+                help="Print the accessibility tree as JSON, for offline audits.",
+            ),
+            output.outputOption(),
+        ]
+
     def run(self, arguments, options):
         forceStartAccessibilityServer()
-        printAccessibilityHierarchy(arguments[0])
+        printAccessibilityHierarchy(
+            arguments[0], asJSON=options.json, result=self.result, path=options.out
+        )
 
 
 class FBPrintAccessibilityIdentifiers(fb.FBCommand):
@@ -64,9 +84,25 @@ class FBPrintAccessibilityIdentifiers(fb.FBCommand):
             )
         ]
 
-    def run(self, arguments, option):
+    def options(self):
+        return [
+            fb.FBCommandArgument(
+                arg="json",
+                short="-j",
+                long="--json",
+                type="BOOL",
+                boolean=True,
+                default=False,
+                help="Print the accessibility tree as JSON, for offline audits.",
+            ),
+            output.outputOption(),
+        ]
+
+    def run(self, arguments, options):
         forceStartAccessibilityServer()
-        printAccessibilityIdentifiersHierarchy(arguments[0])
+        printAccessibilityIdentifiersHierarchy(
+            arguments[0], asJSON=options.json, result=self.result, path=options.out
+        )
 
 
 class FBFindViewByAccessibilityLabelCommand(fb.FBCommand):
@@ -88,53 +124,96 @@ class FBFindViewByAccessibilityLabelCommand(fb.FBCommand):
             )
         ]
 
-    def accessibilityGrepHierarchy(self, view, needle):
-        a11yLabel = accessibilityLabel(view)
-        # if we don't have any accessibility string - we should have some children
-        if int(a11yLabel.GetValue(), 16) == 0:
-            # We call private method that gives back all visible accessibility children
-            # for view iOS 10 and higher
-            if fb.evaluateBooleanExpression(
-                "[UIView respondsToSelector:@selector(_accessibilityElementsAndContainersDescendingFromViews:options:sorted:)]"
+    def run(self, arguments, options):
+        forceStartAccessibilityServer()
+        root = accessibilityTree(
+            "(id)[[UIApplication sharedApplication] keyWindow]", descendants=True
+        )
+        if root is None:
+            return
+
+        first = None
+        for element, _ in accessibilityElements(root, identifiers=False):
+            if element.label is None or not re.match(
+                r".*" + arguments[0] + ".*", element.label, re.IGNORECASE
             ):
-                accessibilityElements = fb.evaluateObjectExpression(
-                    "[UIView _accessibilityElementsAndContainersDescendingFromViews:@[(id)%s] options:0 sorted:NO]"
-                    % view
-                )
-            else:
-                accessibilityElements = fb.evaluateObjectExpression(
-                    "[[[UIApplication sharedApplication] keyWindow] _accessibilityElementsInContainer:0 topLevel:%s includeKB:0]"
-                    % view
-                )
-            accessibilityElementsCount = fb.evaluateIntegerExpression(
-                "[%s count]" % accessibilityElements
-            )
-            for index in range(0, accessibilityElementsCount):
-                subview = fb.evaluateObjectExpression(
-                    "[%s objectAtIndex:%i]" % (accessibilityElements, index)
-                )
-                self.accessibilityGrepHierarchy(subview, needle)
-        elif re.match(
-            r".*" + needle + ".*", a11yLabel.GetObjectDescription(), re.IGNORECASE
-        ):
-            classDesc = objHelpers.className(view)
+                continue
             print(
-                "({} {}) {}".format(classDesc, view, a11yLabel.GetObjectDescription())
+                "({} {}) {}".format(element.className, element.address, element.label)
             )
 
             # First element that is found is copied to clipboard
-            if not self.foundElement:
-                self.foundElement = True
-                cmd = 'echo %s | tr -d "\n" | pbcopy' % view
+            if first is None:
+                first = element.address
+                cmd = 'echo %s | tr -d "\n" | pbcopy' % first
                 os.system(cmd)
 
+
+class FBAccessibilityAuditCommand(fb.FBCommand):
+    def name(self):
+        return "a11yaudit"
+
+    def description(self):
+        return (
+            "Audit the accessibility elements in the hierarchy of <aView>. Reports "
+            "elements missing a label or an identifier, duplicated identifiers, "
+            "tappable elements smaller than the minimum size and overlapping "
+            "tappable elements."
+        )
+
+    def args(self):
+        return [
+            fb.FBCommandArgument(
+                arg="aView",
+                type="UIView*",
+                help="The view to audit the hierarchy of.",
+                default="(id)[[UIApplication sharedApplication] keyWindow]",
+            )
+        ]
+
+    def options(self):
+        return [
+            fb.FBCommandArgument(
+                arg="minimumSize",
+                short="-s",
+                long="--min-size",
+                type="float",
+                default=MINIMUM_TAP_TARGET_SIZE,
+                help="Minimum width and height of tappable elements, in points. "
+                "Defaults to {:g}.".format(MINIMUM_TAP_TARGET_SIZE),
+            ),
+            fb.FBCommandArgument(
+                arg="json",
+                short="-j",
+                long="--json",
+                type="BOOL",
+                boolean=True,
+                default=False,
+                help="Print the issues as JSON.",
+            ),
+            output.outputOption(),
+        ]
+
     def run(self, arguments, options):
+        try:
+            minimumSize = float(options.minimumSize)
+        except ValueError:
+            self.result.SetError("Invalid size: {}".format(options.minimumSize))
+            return
+
         forceStartAccessibilityServer()
-        rootView = fb.evaluateObjectExpression(
-            "[[UIApplication sharedApplication] keyWindow]"
-        )
-        self.foundElement = False
-        self.accessibilityGrepHierarchy(rootView, arguments[0])
+        root = accessibilityTree(arguments[0])
+        if root is None:
+            return
+
+        issues = auditAccessibility(root, minimumSize)
+        if options.json:
+            lines = json.dumps(
+                [issue._asdict() for issue in issues], indent=2
+            ).splitlines()
+        else:
+            lines = accessibilityAuditLines(issues)
+        output.writeLines(lines, self.result, options.out)
 
 
 def isRunningInSimulator():
@@ -153,7 +232,13 @@ def isRunningInSimulator():
     )
 
 
+# Remembers, for the life of the process, that the accessibility server runs.
+_accessibilityServer = cache.FBStopCache("accessibilityServer", perStop=False)
+
+
 def forceStartAccessibilityServer():
+    if _accessibilityServer.peek("started"):
+        return
     # We try to start accessibility server only if we don't have needed method active
     if not fb.evaluateBooleanExpression(
         "[UIView instancesRespondToSelector:@selector(_accessibilityElementsInContainer:)]"
@@ -167,93 +252,334 @@ def forceStartAccessibilityServer():
             fb.evaluateEffect(
                 "[[[UIApplication sharedApplication] _accessibilityBundlePrincipalClass] _accessibilityStartServer]"
             )
+    _accessibilityServer.put("started", True)
 
 
-def accessibilityLabel(view):
-    # using Apple private API to get real value of accessibility string for element.
-    return fb.evaluateExpressionValue(
-        "(id)[%s accessibilityAttributeValue:%i]" % (view, ACCESSIBILITY_LABEL_KEY),
-        False,
-    )
-
+# Upper bound on the number of elements in a snapshot, in case an element lists
+# one of its ancestors as a child.
+MAX_ACCESSIBILITY_ELEMENTS = 20000
 
-def accessibilityIdentifier(view):
-    return fb.evaluateExpressionValue(
-        "(id)[{} accessibilityIdentifier]".format(view), False
+# Walks the accessibility elements under root and returns, for each one, the
+# class, label, identifier, isAccessibilityElement, traits, frame and index of
+# its parent, in depth first order, and whether the walk stopped at
+# MAX_ACCESSIBILITY_ELEMENTS. The APIs available to list children are checked
+# once per walk.
+#
+# With `descendants` (used by fa11y), only elements without a label are
+# expanded, and the children of a view are all the accessibility elements and
+# containers descending from it, as listed by
+# _accessibilityElementsAndContainersDescendingFromViews:options:sorted:
+# (iOS 10 and later).
+ACCESSIBILITY_TREE = fb.FBExpressionTemplate(
+    "accessibilityTree",
+    "char *",
+    [("id", "root"), ("BOOL", "descendants")],
+    """
+    BOOL hasAccessibilityElements = (BOOL)[UIView instancesRespondToSelector:@selector(accessibilityElements)];
+    BOOL hasDescendants = (BOOL)[UIView respondsToSelector:@selector(_accessibilityElementsAndContainersDescendingFromViews:options:sorted:)];
+    id keyWindow = (id)[(id)[UIApplication sharedApplication] keyWindow];
+    NSMutableArray *nodes = (NSMutableArray *)[NSMutableArray array];
+    NSMutableSet *visited = (NSMutableSet *)[NSMutableSet set];
+    NSMutableArray *stack = (NSMutableArray *)[NSMutableArray arrayWithObject:@[root, @(-1)]];
+    while ((NSUInteger)[stack count] > 0 && (NSUInteger)[nodes count] < %d) {
+        NSArray *entry = (NSArray *)[stack lastObject];
+        [stack removeLastObject];
+        id element = entry[0];
+        NSString *address = (NSString *)[NSString stringWithFormat:@"0x%%lx", (unsigned long)element];
+        if ((BOOL)[visited containsObject:address]) {
+            continue;
+        }
+        [visited addObject:address];
+
+        NSMutableDictionary *node = (NSMutableDictionary *)[NSMutableDictionary dictionary];
+        node[@"address"] = address;
+        node[@"class"] = (NSString *)NSStringFromClass((Class)[element class]);
+        node[@"parent"] = entry[1];
+        // using Apple private API to get real value of accessibility string for element.
+        id label = (BOOL)[element respondsToSelector:@selector(accessibilityAttributeValue:)] ? (id)[element accessibilityAttributeValue:%d] : (id)[element accessibilityLabel];
+        id identifier = (BOOL)[element respondsToSelector:@selector(accessibilityIdentifier)] ? (id)[element accessibilityIdentifier] : nil;
+        node[@"label"] = label ? (id)[label description] : (id)[NSNull null];
+        node[@"identifier"] = identifier ? (id)[identifier description] : (id)[NSNull null];
+        node[@"isElement"] = @((BOOL)[element isAccessibilityElement]);
+        node[@"traits"] = @((unsigned long long)[element accessibilityTraits]);
+        CGRect frame = (CGRect)[element accessibilityFrame];
+        node[@"frame"] = @[@(frame.origin.x), @(frame.origin.y), @(frame.size.width), @(frame.size.height)];
+        NSNumber *index = @((NSUInteger)[nodes count]);
+        [nodes addObject:node];
+
+        NSArray *elements = nil;
+        if (descendants) {
+            if (label) {
+                continue;
+            }
+            if (hasDescendants) {
+                elements = (NSArray *)[UIView _accessibilityElementsAndContainersDescendingFromViews:@[element] options:0 sorted:NO];
+            } else {
+                elements = (NSArray *)[keyWindow _accessibilityElementsInContainer:0 topLevel:element includeKB:0];
+            }
+        } else {
+            if (hasAccessibilityElements) {
+                elements = (NSArray *)[element accessibilityElements];
+            }
+            if (!elements) {
+                if ((BOOL)[element respondsToSelector:@selector(_accessibleSubviews)]) {
+                    elements = (NSArray *)[element _accessibleSubviews];
+                } else if ((BOOL)[element isKindOfClass:[UIView class]]) {
+                    elements = (NSArray *)[keyWindow _accessibilityElementsInContainer:0 topLevel:element includeKB:0];
+                }
+            }
+        }
+        for (NSInteger i = (NSInteger)[elements count] - 1; i >= 0; i--) {
+            [stack addObject:@[(id)[elements objectAtIndex:i], index]];
+        }
+    }
+    return RETURN(@{@"nodes": nodes, @"truncated": @((NSUInteger)[stack count] > 0)});
+    """ % (MAX_ACCESSIBILITY_ELEMENTS, ACCESSIBILITY_LABEL_KEY),
+)
+
+
+class AccessibilityElement:
+    """
+    An element captured by accessibilityTree. `frame` is a tuple of (x, y,
+    width, height) in screen coordinates, `label` and `identifier` are None
+    when the element has none.
+    """
+
+    __slots__ = (
+        "address",
+        "className",
+        "label",
+        "identifier",
+        "isElement",
+        "traits",
+        "frame",
+        "children",
     )
 
-
-def accessibilityElements(view):
-    if fb.evaluateBooleanExpression(
-        "[UIView instancesRespondToSelector:@selector(accessibilityElements)]"
-    ):
-        a11yElements = fb.evaluateExpression(
-            "(id)[%s accessibilityElements]" % view, False
+    def __init__(self, node):
+        self.address = node["address"]
+        self.className = node["class"]
+        self.label = node["label"]
+        self.identifier = node["identifier"]
+        self.isElement = node["isElement"]
+        self.traits = node["traits"]
+        self.frame = tuple(node["frame"])
+        self.children = []
+
+    def toDict(self):
+        return {
+            "address": self.address,
+            "class": self.className,
+            "label": self.label,
+            "identifier": self.identifier,
+            "isElement": self.isElement,
+            "traits": self.traits,
+            "frame": list(self.frame),
+            "children": [child.toDict() for child in self.children],
+        }
+
+
+# Returns the root AccessibilityElement of the accessibility tree of view,
+# fetched in a single expression, or None if the expression failed. See
+# ACCESSIBILITY_TREE for `descendants`.
+def accessibilityTree(view, descendants=False):
+    tree = ACCESSIBILITY_TREE.evaluateJSON(view, "YES" if descendants else "NO")
+    if not tree or not tree["nodes"]:
+        return None
+    nodes = tree["nodes"]
+    if tree["truncated"]:
+        print(
+            "Warning: stopped after {} accessibility elements, the rest of the "
+            "tree is left out.".format(len(nodes))
         )
-        if int(a11yElements, 16) != 0:
-            return a11yElements
-    if fb.evaluateBooleanExpression(
-        "[%s respondsToSelector:@selector(_accessibleSubviews)]" % view
-    ):
-        return fb.evaluateExpression("(id)[%s _accessibleSubviews]" % (view), False)
+    elements = []
+    for node in nodes:
+        element = AccessibilityElement(node)
+        if node["parent"] >= 0:
+            elements[node["parent"]].children.append(element)
+        elements.append(element)
+    return elements[0]
+
+
+# Yields (element, depth) for the elements shown by pa11y (or pa11yi, when
+# `identifiers` is true): the children of an element are only visited when it
+# has no label (or identifier).
+def accessibilityElements(root, identifiers=False):
+    stack = [(root, 0)]
+    while stack:
+        element, depth = stack.pop()
+        yield element, depth
+        value = element.identifier if identifiers else element.label
+        if value is None:
+            stack.extend((child, depth + 1) for child in reversed(element.children))
+
+
+def accessibilityHierarchyLines(root, identifiers=False):
+    for element, depth in accessibilityElements(root, identifiers):
+        indentString = "   | " * depth
+        value = element.identifier if identifiers else element.label
+        # if we don't have any accessibility string - we should have some children
+        if value is None:
+            yield indentString + "{} {}".format(element.className, element.address)
+        else:
+            yield indentString + "({} {}) {}".format(
+                element.className, element.address, value
+            )
+
+
+def printAccessibilityHierarchy(
+    view, identifiers=False, asJSON=False, result=None, path=None
+):
+    root = accessibilityTree(view)
+    if root is None:
+        return
+    if asJSON:
+        lines = json.dumps(root.toDict(), indent=2).splitlines()
     else:
-        return fb.evaluateObjectExpression(
-            "[[[UIApplication sharedApplication] keyWindow] _accessibilityElementsInContainer:0 topLevel:%s includeKB:0]"
-            % view
-        )
+        lines = accessibilityHierarchyLines(root, identifiers)
+    output.writeLines(lines, result, path)
 
 
-def printAccessibilityHierarchy(view, indent=0):
-    a11yLabel = accessibilityLabel(view)
-    classDesc = objHelpers.className(view)
-    indentString = "   | " * indent
+def printAccessibilityIdentifiersHierarchy(view, asJSON=False, result=None, path=None):
+    printAccessibilityHierarchy(view, True, asJSON, result, path)
 
-    # if we don't have any accessibility string - we should have some children
-    if int(a11yLabel.GetValue(), 16) == 0:
-        print(indentString + ("{} {}".format(classDesc, view)))
-        # We call private method that gives back all visible accessibility children
-        # for view
-        a11yElements = accessibilityElements(view)
-        accessibilityElementsCount = int(
-            fb.evaluateExpression("(int)[%s count]" % a11yElements)
-        )
-        for index in range(0, accessibilityElementsCount):
-            subview = fb.evaluateObjectExpression(
-                "[%s objectAtIndex:%i]" % (a11yElements, index)
-            )
-            printAccessibilityHierarchy(subview, indent + 1)
-    else:
-        print(
-            indentString
-            + ("({} {}) {}".format(classDesc, view, a11yLabel.GetObjectDescription()))
-        )
+
+# Apple's minimum recommended size for tap targets, in points.
+MINIMUM_TAP_TARGET_SIZE = 44.0
+
+# UIAccessibilityTraits of elements that respond to taps: button, link,
+# keyboard key, search field and adjustable.
+TAPPABLE_TRAITS = 0x1 | 0x2 | 0x20 | 0x400 | 0x1000
+
+AccessibilityIssue = collections.namedtuple(
+    "AccessibilityIssue", ["issue", "elements", "detail"]
+)
+
+AUDIT_ISSUES = (
+    "missing label",
+    "missing identifier",
+    "duplicate identifier",
+    "small tap target",
+    "overlapping tap targets",
+)
 
 
-def printAccessibilityIdentifiersHierarchy(view, indent=0):
-    a11yIdentifier = accessibilityIdentifier(view)
-    classDesc = objHelpers.className(view)
-    indentString = "   | " * indent
+def _frameDescription(frame):
+    return "({:g}, {:g}; {:g}, {:g})".format(*frame)
 
-    # if we don't have any accessibility identifier - we should have some children
-    if int(a11yIdentifier.GetValue(), 16) == 0:
-        print(indentString + ("{} {}".format(classDesc, view)))
-        # We call private method that gives back all visible accessibility children
-        # for view
-        a11yElements = accessibilityElements(view)
-        accessibilityElementsCount = int(
-            fb.evaluateExpression("(int)[%s count]" % a11yElements)
+
+def _elementDescription(element):
+    return "{} {}".format(element.className, element.address)
+
+
+def _intersectionArea(frame, other):
+    width = min(frame[0] + frame[2], other[0] + other[2]) - max(frame[0], other[0])
+    height = min(frame[1] + frame[3], other[1] + other[3]) - max(frame[1], other[1])
+    return width * height if width > 0 and height > 0 else 0
+
+
+# Checks every element of an accessibility tree in one pass, and returns the
+# AccessibilityIssue found, grouped in the order of AUDIT_ISSUES.
+def auditAccessibility(root, minimumSize=MINIMUM_TAP_TARGET_SIZE):
+    issues = collections.defaultdict(list)
+    elementsByIdentifier = collections.OrderedDict()
+    tappable = []
+
+    # Walk the tree keeping the ancestors of each element, nested tappable
+    # elements aren't overlapping targets.
+    stack = [(root, ())]
+    while stack:
+        element, ancestors = stack.pop()
+        stack.extend(
+            (child, ancestors + (element.address,))
+            for child in reversed(element.children)
         )
-        for index in range(0, accessibilityElementsCount):
-            subview = fb.evaluateObjectExpression(
-                "[%s objectAtIndex:%i]" % (a11yElements, index)
+
+        if element.identifier:
+            elementsByIdentifier.setdefault(element.identifier, []).append(element)
+        if not element.isElement:
+            continue
+
+        frame = element.frame
+        if not element.label:
+            issues["missing label"].append(
+                AccessibilityIssue(
+                    "missing label",
+                    [element.address],
+                    "{} {}".format(
+                        _elementDescription(element), _frameDescription(frame)
+                    ),
+                )
             )
-            printAccessibilityIdentifiersHierarchy(subview, indent + 1)
-    else:
-        print(
-            indentString
-            + (
-                "({} {}) {}".format(
-                    classDesc, view, a11yIdentifier.GetObjectDescription()
+        elif not element.identifier:
+            issues["missing identifier"].append(
+                AccessibilityIssue(
+                    "missing identifier",
+                    [element.address],
+                    "{} label: '{}'".format(
+                        _elementDescription(element), element.label
+                    ),
                 )
             )
-        )
+
+        if element.traits & TAPPABLE_TRAITS and frame[2] > 0 and frame[3] > 0:
+            tappable.append((element, ancestors))
+            if frame[2] < minimumSize or frame[3] < minimumSize:
+                issues["small tap target"].append(
+                    AccessibilityIssue(
+                        "small tap target",
+                        [element.address],
+                        "{} size: {:g}x{:g}".format(
+                            _elementDescription(element), frame[2], frame[3]
+                        ),
+                    )
+                )
+
+    for identifier, elements in elementsByIdentifier.items():
+        if len(elements) > 1:
+            issues["duplicate identifier"].append(
+                AccessibilityIssue(
+                    "duplicate identifier",
+                    [element.address for element in elements],
+                    "'{}' used by {} elements".format(identifier, len(elements)),
+                )
+            )
+
+    # Sorted by x, only the elements starting before the end of an element can
+    # overlap it.
+    tappable.sort(key=lambda entry: entry[0].frame[0])
+    for index, (element, ancestors) in enumerate(tappable):
+        frame = element.frame
+        for other, otherAncestors in tappable[index + 1 :]:
+            if other.frame[0] >= frame[0] + frame[2]:
+                break
+            if element.address in otherAncestors or other.address in ancestors:
+                continue
+            area = _intersectionArea(frame, other.frame)
+            if area > 0:
+                issues["overlapping tap targets"].append(
+                    AccessibilityIssue(
+                        "overlapping tap targets",
+                        [element.address, other.address],
+                        "{} and {} overlap by {:g} square points".format(
+                            _elementDescription(element),
+                            _elementDescription(other),
+                            area,
+                        ),
+                    )
+                )
+
+    return [issue for kind in AUDIT_ISSUES for issue in issues[kind]]
+
+
+def accessibilityAuditLines(issues):
+    width = max(len(kind) for kind in AUDIT_ISSUES)
+    counts = collections.Counter(issue.issue for issue in issues)
+    for issue in issues:
+        yield "{:<{}}  {}".format(issue.issue, width, issue.detail)
+    if issues:
+        yield ""
+    yield "{} issues: {}".format(
+        len(issues),
+        ", ".join("{} {}".format(counts[kind], kind) for kind in AUDIT_ISSUES),
+    )
@@ -48,27 +48,45 @@ class FBPrintAutolayoutTrace(fb.FBCommand):
         print(fb.describeObject("[{} {}]".format(view, traceCall)))
 
 
-def setBorderOnAmbiguousViewRecursive(view, width, color):
+# Sets the border of the layer of each of the views.
+SET_BORDERS = fb.FBExpressionTemplate(
+    "setBorders",
+    "void",
+    [("NSArray *", "views"), ("CGFloat", "width"), ("CGColorRef", "color")],
+    """
+    for (id view in views) {
+        id layer = (id)[view layer];
+        [layer setBorderWidth:width];
+        [layer setBorderColor:color];
+    }
+    """,
+)
+
+
+# Borders the ambiguous views in the hierarchy of view, found in one snapshot
+# of the hierarchy and bordered in one more expression.
+def setBorderOnAmbiguousViews(view, width, color):
     if not fb.evaluateBooleanExpression(
         "[(id)%s isKindOfClass:(Class)[UIView class]]" % view
     ):
         return
 
-    isAmbiguous = fb.evaluateBooleanExpression("(BOOL)[%s hasAmbiguousLayout]" % view)
-    if isAmbiguous:
-        layer = viewHelpers.convertToLayer(view)
-        fb.evaluateEffect("[%s setBorderWidth:(CGFloat)%s]" % (layer, width))
-        fb.evaluateEffect(
-            "[%s setBorderColor:(CGColorRef)[(id)[UIColor %sColor] CGColor]]"
-            % (layer, color)
-        )
+    tree = viewHelpers.snapshotViewHierarchy(
+        view,
+        properties={
+            "ambiguous": "[NSNumber numberWithBool:(BOOL)[__view hasAmbiguousLayout]]"
+        },
+    )
+    if tree is None:
+        return
 
-    subviews = fb.evaluateExpression("(id)[%s subviews]" % view)
-    subviewsCount = int(fb.evaluateExpression("(int)[(id)%s count]" % subviews))
-    if subviewsCount > 0:
-        for i in range(0, subviewsCount):
-            subview = fb.evaluateExpression("(id)[%s objectAtIndex:%i]" % (subviews, i))
-            setBorderOnAmbiguousViewRecursive(subview, width, color)
+    views = [node.address for node in tree if node.properties["ambiguous"]]
+    if views:
+        SET_BORDERS.value(
+            "@[{}]".format(", ".join("(id){}".format(address) for address in views)),
+            width,
+            "(CGColorRef)[(id)[UIColor %sColor] CGColor]" % color,
+        )
 
 
 class FBAutolayoutBorderAmbiguous(fb.FBCommand):
@@ -102,7 +120,7 @@ class FBAutolayoutBorderAmbiguous(fb.FBCommand):
         keyWindow = fb.evaluateExpression(
             "(id)[[UIApplication sharedApplication] keyWindow]"
         )
-        setBorderOnAmbiguousViewRecursive(keyWindow, options.width, options.color)
+        setBorderOnAmbiguousViews(keyWindow, options.width, options.color)
         lldb.debugger.HandleCommand("caflush")
 
 
@@ -117,5 +135,5 @@ class FBAutolayoutUnborderAmbiguous(fb.FBCommand):
         keyWindow = fb.evaluateExpression(
             "(id)[[UIApplication sharedApplication] keyWindow]"
         )
-        setBorderOnAmbiguousViewRecursive(keyWindow, 0, "red")
+        setBorderOnAmbiguousViews(keyWindow, 0, "red")
         lldb.debugger.HandleCommand("caflush")
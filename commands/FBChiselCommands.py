@@ -0,0 +1,349 @@
+#!/usr/bin/python
+
+# Copyright (c) Facebook, Inc. and its affiliates. All Rights Reserved
+#
+# This source code is licensed under the MIT license found in the
+# LICENSE file in the root directory of this source tree.
+
+import collections
+import json
+import os
+import re
+
+import fbchisellldbbase as fb
+import fbchisellldbcache as cache
+import fbchisellldbmemoryhelpers as memory
+import fbchisellldbprofile as profile
+
+
+def lldbcommands():
+    return [FBChiselCacheCommand(), FBChiselStartupCommand(), FBChiselProfileCommand()]
+
+
+class FBChiselCacheCommand(fb.FBCommand):
+    def name(self):
+        return "chiselcache"
+
+    def description(self):
+        return (
+            "Show or clear the caches Chisel keeps of runtime lookups.\n"
+            "\n"
+            "Cached values are dropped whenever the process resumes or is relaunched.\n"
+            "Expression templates, which are compiled once per process, are listed with "
+            "how many times they were compiled and called.\n"
+            "\n"
+            "Actions:\n"
+            "- stats: print the size, hits and misses of every cache,\n"
+            "- clear: drop every cached value,\n"
+            "- reset: reset the hit and miss counters."
+        )
+
+    def args(self):
+        return [
+            fb.FBCommandArgument(
+                arg="action",
+                type="string",
+                help="One of stats, clear or reset.",
+                default="stats",
+            )
+        ]
+
+    def run(self, arguments, options):
+        action = arguments[0]
+        if action == "clear":
+            cache.invalidateAll()
+        elif action == "reset":
+            for stopCache in cache.caches.values():
+                stopCache.resetCounters()
+            for template in fb.templates.values():
+                template.resetCounters()
+        elif action != "stats":
+            print("Unknown action: {}. Use stats, clear or reset.".format(action))
+            return
+
+        printCacheStats()
+        printTemplateStats()
+
+
+def printTemplateStats():
+    if not fb.templates:
+        return
+    print(
+        "\n{:<24} {:>9} {:>8} {:>10}".format("Template", "Compiles", "Calls", "Inlined")
+    )
+    for template in fb.templates.values():
+        print(
+            "{:<24} {:>9} {:>8} {:>10}".format(
+                template.name, template.compiles, template.calls, template.fallbacks
+            )
+        )
+
+
+def printCacheStats():
+    print(
+        "{:<24} {:>13} {:>8} {:>8} {:>7} {:>9} {:>13}".format(
+            "Cache", "Entries", "Hits", "Misses", "Hit %", "Evicted", "Invalidated"
+        )
+    )
+    for stopCache in cache.caches.values():
+        lookups = stopCache.hits + stopCache.misses
+        hitRate = 100.0 * stopCache.hits / lookups if lookups else 0.0
+        print(
+            "{:<24} {:>13} {:>8} {:>8} {:>7.1f} {:>9} {:>13}".format(
+                stopCache.name,
+                "{}/{}".format(len(stopCache.entries), stopCache.maxSize),
+                stopCache.hits,
+                stopCache.misses,
+                hitRate,
+                stopCache.evictions,
+                stopCache.invalidations,
+            )
+        )
+
+
+class FBChiselStartupCommand(fb.FBCommand):
+    def name(self):
+        return "chiselstartup"
+
+    def description(self):
+        return (
+            "Show how long Chisel spent loading each of its command modules.\n"
+            "\n"
+            "Modules listed in the command manifest are registered without being "
+            "imported; their import cost is only paid, and reported here, when "
+            "one of their commands first runs. Set CHISEL_EAGER_LOAD=1 to import "
+            "every module at startup instead."
+        )
+
+    def run(self, arguments, options):
+        printStartupReport()
+
+
+def formatMilliseconds(seconds):
+    return "-" if seconds is None else "{:.1f}".format(seconds * 1000)
+
+
+def printStartupReport():
+    loads = sorted(
+        profile.moduleLoads,
+        key=lambda load: (load.importSeconds or 0) + load.registerSeconds,
+        reverse=True,
+    )
+    print(
+        "{:<28} {:>8} {:>11} {:>13} {:>10}".format(
+            "Module", "Commands", "Import ms", "Register ms", "Mode"
+        )
+    )
+    for load in loads:
+        if load.lazy:
+            mode = "lazy, used" if load.imported else "lazy"
+        else:
+            mode = "eager"
+        print(
+            "{:<28} {:>8} {:>11} {:>13} {:>10}".format(
+                load.moduleName,
+                load.commandCount,
+                formatMilliseconds(load.importSeconds),
+                formatMilliseconds(load.registerSeconds),
+                mode,
+            )
+        )
+
+    startupSeconds = sum(
+        load.registerSeconds + (0 if load.lazy else load.importSeconds)
+        for load in loads
+    )
+    deferredSeconds = sum(load.importSeconds or 0 for load in loads if load.lazy)
+    print(
+        "\nStartup: {} ms for {} modules, {} of them lazy. "
+        "Deferred imports so far: {} ms.".format(
+            formatMilliseconds(startupSeconds),
+            len(loads),
+            sum(1 for load in loads if load.lazy),
+            formatMilliseconds(deferredSeconds),
+        )
+    )
+
+
+class FBChiselProfileCommand(fb.FBCommand):
+    def name(self):
+        return "chiselprofile"
+
+    def description(self):
+        return (
+            "Show where Chisel commands spend their time.\n"
+            "\n"
+            "Every command run records its wall time, the number and duration of the "
+            "expressions it evaluated, and the bytes it read from the process. The last "
+            "{} runs and {} expressions are kept.\n"
+            "\n"
+            "Actions:\n"
+            "- top: the commands with the most total time,\n"
+            "- slowest: the slowest expressions,\n"
+            "- histogram: the distribution of command run times,\n"
+            "- export: write the runs as JSON lines to --output,\n"
+            "- clear: forget every run.\n"
+            "\n"
+            "Set CHISEL_PROFILE_LOG to a path to append every run to it as JSON lines."
+        ).format(profile.COMMAND_HISTORY_SIZE, profile.EXPRESSION_HISTORY_SIZE)
+
+    def options(self):
+        return [
+            fb.FBCommandArgument(
+                short="-n",
+                long="--limit",
+                arg="limit",
+                type="int",
+                default=10,
+                help="Number of rows to print.",
+            ),
+            fb.FBCommandArgument(
+                short="-c",
+                long="--command",
+                arg="command",
+                type="string",
+                default=None,
+                help="Only include runs of this command.",
+            ),
+            fb.FBCommandArgument(
+                short="-o",
+                long="--output",
+                arg="output",
+                type="string",
+                default=None,
+                help="The file to export to.",
+            ),
+        ]
+
+    def args(self):
+        return [
+            fb.FBCommandArgument(
+                arg="action",
+                type="string",
+                help="One of top, slowest, histogram, export or clear.",
+                default="top",
+            )
+        ]
+
+    def run(self, arguments, options):
+        action = arguments[0]
+        limit = int(options.limit)
+        runs = [
+            run
+            for run in profile.commandRuns
+            # Leave out the run of chiselprofile itself.
+            if run.name != self.name()
+            and (options.command is None or run.name == options.command)
+        ]
+
+        if action == "top":
+            printTopCommands(runs, limit)
+        elif action == "slowest":
+            printSlowestExpressions(options.command, limit)
+        elif action == "histogram":
+            printRunHistogram(runs)
+        elif action == "export":
+            if not options.output:
+                print("Use --output to choose the file to export to.")
+                return
+            path = os.path.expanduser(options.output)
+            with open(path, "w") as output:
+                for run in runs:
+                    output.write(json.dumps(run.toDict()) + "\n")
+            print("Exported {} runs to {}".format(len(runs), path))
+        elif action == "clear":
+            profile.clear()
+        else:
+            print(
+                "Unknown action: {}. Use top, slowest, histogram, export or "
+                "clear.".format(action)
+            )
+
+
+def printTopCommands(runs, limit):
+    if not runs:
+        print("No commands have run yet.")
+        return
+
+    byName = {}
+    for run in runs:
+        byName.setdefault(run.name, []).append(run)
+
+    totals = sorted(
+        byName.items(),
+        key=lambda item: sum(run.seconds for run in item[1]),
+        reverse=True,
+    )
+    print(
+        "{:<20} {:>5} {:>10} {:>9} {:>9} {:>7} {:>10} {:>8}".format(
+            "Command",
+            "Runs",
+            "Total ms",
+            "Mean ms",
+            "Max ms",
+            "Exprs",
+            "Read",
+            "Python",
+        )
+    )
+    for name, commandRuns in totals[:limit]:
+        total = sum(run.seconds for run in commandRuns)
+        python = sum(run.pythonSeconds for run in commandRuns)
+        print(
+            "{:<20} {:>5} {:>10.1f} {:>9.1f} {:>9.1f} {:>7} {:>10} {:>7.0f}%".format(
+                name,
+                len(commandRuns),
+                total * 1000,
+                total * 1000 / len(commandRuns),
+                max(run.seconds for run in commandRuns) * 1000,
+                sum(run.expressionCount for run in commandRuns),
+                memory.formatByteCount(sum(run.readBytes for run in commandRuns)),
+                100 * python / total if total else 0,
+            )
+        )
+
+
+def printSlowestExpressions(command, limit):
+    expressions = [
+        expression
+        for expression in profile.expressionRuns
+        if command is None or expression.command == command
+    ]
+    if not expressions:
+        print("No expressions have been evaluated yet.")
+        return
+
+    print("{:>9}  {:<16} {}".format("ms", "Command", "Expression"))
+    expressions.sort(key=lambda expression: expression.seconds, reverse=True)
+    for expression in expressions[:limit]:
+        text = re.sub(r"\s+", " ", expression.expression).strip()
+        if len(text) > 80:
+            text = text[:77] + "..."
+        print(
+            "{:>9.1f}  {:<16} {}".format(
+                expression.seconds * 1000, expression.command or "-", text
+            )
+        )
+
+
+def printRunHistogram(runs):
+    if not runs:
+        print("No commands have run yet.")
+        return
+
+    # Buckets double in size: under 1ms, 1-2ms, 2-4ms, ...
+    buckets = collections.Counter()
+    for run in runs:
+        milliseconds = run.seconds * 1000
+        bucket = 0
+        while milliseconds >= 2**bucket:
+            bucket += 1
+        buckets[bucket] += 1
+
+    largest = max(buckets.values())
+    for bucket in range(0, max(buckets) + 1):
+        low = 0 if bucket == 0 else 2 ** (bucket - 1)
+        label = "{}-{} ms".format(low, 2**bucket)
+        count = buckets[bucket]
+        bar = "#" * int(round(40.0 * count / largest))
+        print("{:>16} {:>6} {}".format(label, count, bar).rstrip())
@@ -12,25 +12,25 @@ import os
 import time
 
 import fbchisellldbbase as fb
+import fbchisellldbmemoryhelpers as memory
 import fbchisellldbobjecthelpers as objectHelpers
-import lldb
 
 
 def lldbcommands():
     return [FBCopyCommand()]
 
 
-def _copyFromURL(url, preferredFilename, noOpen):
+def _copyFromURL(url, preferredFilename, noOpen, resume=False):
     data = fb.evaluateObjectExpression(
         "(id)[NSData dataWithContentsOfURL:(id){}]".format(url)
     )
     defaultFilename = fb.describeObject(
         "(id)[[{} pathComponents] lastObject]".format(url)
     )
-    _copyFromData(data, defaultFilename, preferredFilename, noOpen)
+    _copyFromData(data, defaultFilename, preferredFilename, noOpen, resume)
 
 
-def _copyFromData(data, defaultFilename, preferredFilename, noOpen):
+def _copyFromData(data, defaultFilename, preferredFilename, noOpen, resume=False):
     directory = "/tmp/chisel_copy/"
 
     path = directory + (preferredFilename or defaultFilename)
@@ -43,42 +43,39 @@ def _copyFromData(data, defaultFilename, preferredFilename, noOpen):
         else:
             raise
 
-    startAddress = fb.evaluateExpression("(void *)[(id)" + data + " bytes]")
-    length = fb.evaluateExpression("(NSUInteger)[(id)" + data + " length]")
-
-    address = int(startAddress, 16)
-    length = int(length)
-
-    if not (address or length):
-        print("Could not get data.")
+    try:
+        if not memory.copyDataToFile(data, path, resume):
+            print("Could not get data.")
+            return
+    except memory.FBMemoryReadError as error:
+        print(error)
+        print(
+            "Run copy again with --resume --filename {} to complete the partial "
+            "copy at {}.".format(os.path.basename(path), path)
+        )
         return
 
-    process = lldb.debugger.GetSelectedTarget().GetProcess()
-    error = lldb.SBError()
-    mem = process.ReadMemory(address, length, error)
-
-    if error is not None and str(error) != "success":
-        print(error)
-    else:
-        with open(path, "wb") as file:
-            file.write(mem)
-            file.close()
-        print(path)
-        if not noOpen:
-            os.system("open " + path)
+    print(path)
+    if not noOpen:
+        os.system("open " + path)
 
 
-def _copy(target, preferredFilename, noOpen):
+def _copy(target, preferredFilename, noOpen, resume=False):
     target = "(" + target + ")"
 
-    if objectHelpers.isKindOfClass(target, "NSURL"):
-        _copyFromURL(target, preferredFilename, noOpen)
-    elif objectHelpers.isKindOfClass(target, "NSData"):
+    with fb.batch() as batch:
+        isURL = objectHelpers.isKindOfClass(target, "NSURL", batch=batch)
+        isData = objectHelpers.isKindOfClass(target, "NSData", batch=batch)
+
+    if isURL.result():
+        _copyFromURL(target, preferredFilename, noOpen, resume)
+    elif isData.result():
         _copyFromData(
             target,
             time.strftime("%Y-%m-%d-%H-%M-%S", time.gmtime()) + ".data",
             preferredFilename,
             noOpen,
+            resume,
         )
     else:
         print(
@@ -111,6 +108,14 @@ class FBCopyCommand(fb.FBCommand):
                 default=False,
                 help="Do not open the file.",
             ),
+            fb.FBCommandArgument(
+                short="-r",
+                long="--resume",
+                arg="resume",
+                boolean=True,
+                default=False,
+                help="Complete a partial copy left at the output path by a failed read.",
+            ),
         ]
 
     def args(self):
@@ -119,4 +124,4 @@ class FBCopyCommand(fb.FBCommand):
         ]
 
     def run(self, arguments, options):
-        _copy(arguments[0], options.filename, options.noOpen)
+        _copy(arguments[0], options.filename, options.noOpen, options.resume)
@@ -8,11 +8,13 @@
 # Can be removed when Python 2 support is removed.
 from __future__ import print_function
 
-import os
+import collections
+import json
 import re
-import sys
 
 import fbchisellldbbase as fb
+import fbchisellldbheaphelpers as heap
+import fbchisellldbmemoryhelpers as memory
 import fbchisellldbobjcruntimehelpers as objc
 import lldb
 
@@ -27,6 +29,7 @@ def lldbcommands():
         FBMethodBreakpointEnableCommand(),
         FBMethodBreakpointDisableCommand(),
         FBHeapFromCommand(),
+        FBHeapCensusCommand(),
         FBSequenceCommand(),
     ]
 
@@ -420,15 +423,41 @@ class FBFindInstancesCommand(fb.FBCommand):
     NSPredicate, see its documentaiton for more details. Basic NSPredicate
     expressions have relatively predicatable syntax. There are some exceptions
     as seen above, see https://github.com/facebook/chisel/wiki/findinstances.
+
+    The heap is scanned once per stop, and later searches in the same stop
+    filter that census. Use --refresh to scan again, for example after running
+    code that allocates.
     """
 
+    def options(self):
+        return [
+            fb.FBCommandArgument(
+                short="-r",
+                long="--refresh",
+                arg="refresh",
+                boolean=True,
+                default=False,
+                help="Scan the heap again instead of using this stop's census.",
+            )
+        ]
+
     def lex(self, commandLine):
         # Can't use default shlex splitting because it strips quotes, which results
-        # in invalid NSPredicate syntax. Split the input into type and rest (query).
-        return commandLine.split(" ", 1)
+        # in invalid NSPredicate syntax. Split the input into flags, type and rest
+        # (query). The `--` keeps a query starting with `-` from being parsed as
+        # an option.
+        flags = []
+        rest = commandLine.strip()
+        while rest.startswith("-"):
+            flag, _, rest = rest.partition(" ")
+            rest = rest.strip()
+            if flag == "--":
+                break
+            flags.append(flag)
+        return flags + ["--"] + rest.split(" ", 1)
 
     def run(self, arguments, options):
-        if not self.loadChiselIfNecessary():
+        if not heap.loadChiselIfNecessary():
             return
 
         if len(arguments) == 0 or not arguments[0].strip():
@@ -439,56 +468,50 @@ class FBFindInstancesCommand(fb.FBCommand):
 
         query = arguments[0]
         predicate = arguments[1].strip()
-        # Escape double quotes and backslashes.
-        predicate = re.sub('([\\"])', r"\\\1", predicate)
-        call = '(void)PrintInstances("{}", "{}")'.format(query, predicate)
-        fb.evaluateExpressionValue(call)
-
-    def loadChiselIfNecessary(self):
-        target = lldb.debugger.GetSelectedTarget()
-        symbol_contexts = target.FindSymbols("PrintInstances", lldb.eSymbolTypeCode)
-        if any(ctx.symbol.IsValid() for ctx in symbol_contexts):
-            return True
 
-        path = self.chiselLibraryPath()
-        if not os.path.exists(path):
-            print("Chisel library missing: " + path)
-            return False
+        if not heap.hasInstanceCensus():
+            # Escape double quotes and backslashes.
+            predicate = re.sub('([\\"])', r"\\\1", predicate)
+            call = '(void)PrintInstances("{}", "{}")'.format(query, predicate)
+            fb.evaluateExpressionValue(call)
+            return
 
-        module = fb.evaluateExpressionValue('(void*)dlopen("{}", 2)'.format(path))
-        if module.unsigned != 0 or target.module["Chisel"]:
-            return True
+        census, scanned = heap.instanceCensus(refresh=options.refresh)
+        if census is None:
+            return
 
-        # `errno` is a macro that expands to a call to __error(). In development,
-        # lldb was not getting a correct value for `errno`, so `__error()` is used.
-        errno = fb.evaluateExpressionValue("*(int*)__error()").value
-        error = fb.evaluateExpressionValue("(char*)dlerror()")
-        if errno == 50:
-            # KERN_CODESIGN_ERROR from <mach/kern_return.h>
-            print("Error loading Chisel: Code signing failure; Must re-run codesign")
-        elif error.unsigned != 0:
-            print("Error loading Chisel: " + error.summary)
-        elif errno != 0:
-            error = fb.evaluateExpressionValue("(char*)strerror({})".format(errno))
-            if error.unsigned != 0:
-                print("Error loading Chisel: " + error.summary)
-            else:
-                print("Error loading Chisel (errno {})".format(errno))
+        classes = heap.classesMatchingType(census, query)
+        if not classes and not heap.isKnownType(query.lstrip("*")):
+            print("Unknown type: {}".format(query.lstrip("*")))
+            return
+
+        if predicate and classes:
+            lines = heap.matchingInstanceDescriptions(census, classes, predicate)
         else:
-            print("Unknown error loading Chisel")
+            lines = [
+                "<{}: 0x{:x}>".format(census.className(cls), address)
+                for address, cls, _ in census.recordsOfClasses(classes)
+            ]
 
-        return False
+        for line in lines:
+            print(line)
 
-    def chiselLibraryPath(self):
-        # script os.environ['CHISEL_LIBRARY_PATH'] = '/path/to/custom/Chisel'
-        path = os.getenv("CHISEL_LIBRARY_PATH")
-        if path and os.path.exists(path):
-            return path
+        matches = sum(1 for line in lines if line.startswith("<"))
+        if matches > 1:
+            print("{} matches".format(matches))
 
-        source_path = sys.modules[__name__].__file__
-        source_dir = os.path.dirname(source_path)
-        # ugh: ../.. is to back out of commands/, then back out of libexec/
-        return os.path.join(source_dir, "..", "..", "lib", "Chisel.framework", "Chisel")
+        if scanned:
+            summary = "Scanned {} instances of {} classes in {:.2f}s."
+        else:
+            summary = (
+                "Searched this stop's census of {} instances of {} classes "
+                "(scanned in {:.2f}s, use --refresh to rescan)."
+            )
+        print(
+            summary.format(
+                len(census.records), len(census.instanceClasses), census.scanSeconds
+            )
+        )
 
 
 class FBHeapFromCommand(fb.FBCommand):
@@ -498,6 +521,41 @@ class FBHeapFromCommand(fb.FBCommand):
     def description(self):
         return "Show all nested heap pointers contained within a given variable."
 
+    def options(self):
+        return [
+            fb.FBCommandArgument(
+                short="-d",
+                long="--depth",
+                arg="depth",
+                type="int",
+                default=None,
+                help="Maximum depth of the variable's structure to walk.",
+            ),
+            fb.FBCommandArgument(
+                short="-l",
+                long="--limit",
+                arg="limit",
+                type="int",
+                default=None,
+                help="Maximum number of candidate pointers to classify.",
+            ),
+            fb.FBCommandArgument(
+                short="-j",
+                long="--json",
+                arg="json",
+                boolean=True,
+                default=False,
+                help="Print the heap pointers as JSON.",
+            ),
+        ]
+
+    def args(self):
+        return [
+            fb.FBCommandArgument(
+                arg="variable", type="string", help="The variable to inspect."
+            )
+        ]
+
     def run(self, arguments, options):
         # This command is like `expression --synthetic-type false`,
         # except only showing nested heap references.
@@ -506,42 +564,239 @@ class FBHeapFromCommand(fb.FBCommand):
             self.result.SetError('No variable named "{}"'.format(arguments[0]))
             return
 
+        maxDepth = int(options.depth) if options.depth is not None else None
+        limit = int(options.limit) if options.limit is not None else None
+
         # Use the actual underlying structure of the variable,
         # not the human friendly (synthetic) one.
-        root = var.GetNonSyntheticValue()
-
-        # Traversal of SBValue tree to get leaf nodes, which is where heap
-        # pointers will be.
-        leafs = []
-        queue = [root]
-        while queue:
-            node = queue.pop(0)
-            if node.num_children == 0:
-                leafs.append(node)
+        pointers, truncated = heapPointerCandidates(
+            var.GetNonSyntheticValue(), maxDepth, limit
+        )
+
+        allocations = memory.classifyHeapAddresses(list(pointers), self.context.frame)
+        if allocations is None:
+            self.result.SetError(
+                "Could not classify the pointers of {}".format(arguments[0])
+            )
+            return
+
+        if options.json:
+            print(
+                json.dumps(
+                    [
+                        {
+                            "address": "0x{:x}".format(allocation.address),
+                            "path": pointers[allocation.address],
+                            "size": allocation.size,
+                            "zone": allocation.zone,
+                        }
+                        for allocation in allocations
+                    ],
+                    indent=2,
+                ),
+                file=self.result,
+            )
+        else:
+            for allocation in allocations:
+                print(
+                    "0x{addr:x} {path} ({size} bytes, {zone})".format(
+                        addr=allocation.address,
+                        path=pointers[allocation.address],
+                        size=allocation.size,
+                        zone=allocation.zone or "unknown zone",
+                    ),
+                    file=self.result,
+                )
+            if not allocations:
+                print("No heap addresses found", file=self.result)
+
+        if truncated:
+            note = "Stopped after {} candidate pointers, use --limit to see more."
+            if options.json:
+                self.result.AppendWarning(note.format(limit))
             else:
-                queue += [node.GetChildAtIndex(i) for i in range(node.num_children)]
+                print(note.format(limit), file=self.result)
 
-        pointers = {}
-        for node in leafs:
+
+def heapPointerCandidates(root, maxDepth=None, limit=None):
+    """
+    Walks the SBValue tree breadth first and returns the addresses of its
+    leaves that look like pointers, mapped to their paths, and whether the
+    walk stopped at `limit` candidates.
+    """
+    pointers = {}
+    visited = set()
+    queue = collections.deque([(root, 0)])
+    while queue:
+        node, depth = queue.popleft()
+
+        # Pointers make the tree a graph, which can loop back on itself.
+        key = (node.load_addr, node.GetTypeName())
+        if key in visited:
+            continue
+        visited.add(key)
+
+        if node.num_children == 0:
             # Assumption: an addr that has no value means a pointer.
-            if node.addr and not node.value:
+            if node.addr and not node.value and node.load_addr not in pointers:
+                if limit is not None and len(pointers) >= limit:
+                    return pointers, True
                 pointers[node.load_addr] = node.path
+        elif maxDepth is None or depth < maxDepth:
+            queue.extend(
+                (node.GetChildAtIndex(i), depth + 1) for i in range(node.num_children)
+            )
+    return pointers, False
+
+
+# The censuses of the last two stops heapcensus ran at. The older one is the
+# baseline for --diff.
+_censusHistory = collections.deque(maxlen=2)
 
-        options = lldb.SBExpressionOptions()
-        options.SetLanguage(lldb.eLanguageTypeC)
+CENSUS_SORT_KEYS = {
+    "count": lambda row: row.count,
+    "size": lambda row: row.size,
+    "avg": lambda row: row.averageSize,
+    "name": lambda row: row.name,
+}
 
-        def isHeap(addr):
-            lookup = "(int)malloc_size({})".format(addr)
-            return self.context.frame.EvaluateExpression(lookup, options).unsigned != 0
 
-        allocations = (addr for addr in pointers if isHeap(addr))
-        for addr in allocations:
+class FBHeapCensusCommand(fb.FBCommand):
+    def name(self):
+        return "heapcensus"
+
+    def description(self):
+        return (
+            "Count the live Objective-C instances on the heap, grouped by class.\n"
+            "\n"
+            "The census is taken once per stop (findinstances shares it). With --diff, "
+            "the census is compared to the one taken at the previous stop heapcensus ran "
+            "at, and only classes whose counts or sizes changed are shown. Classes that "
+            "keep growing across stops are leak candidates."
+        )
+
+    def options(self):
+        return [
+            fb.FBCommandArgument(
+                short="-s",
+                long="--sort",
+                arg="sort",
+                type="string",
+                default="size",
+                help="Sort by count, size, avg or name.",
+            ),
+            fb.FBCommandArgument(
+                short="-l",
+                long="--limit",
+                arg="limit",
+                type="int",
+                default=50,
+                help="Maximum number of classes to print, 0 for all.",
+            ),
+            fb.FBCommandArgument(
+                short="-d",
+                long="--diff",
+                arg="diff",
+                boolean=True,
+                default=False,
+                help="Compare to the census of the previous stop.",
+            ),
+            fb.FBCommandArgument(
+                short="-r",
+                long="--refresh",
+                arg="refresh",
+                boolean=True,
+                default=False,
+                help="Scan the heap again instead of using this stop's census.",
+            ),
+        ]
+
+    def run(self, arguments, options):
+        if options.sort not in CENSUS_SORT_KEYS:
             print(
-                "0x{addr:x} {path}".format(addr=addr, path=pointers[addr]),
-                file=self.result,
+                "Unknown sort key: {}. Use one of {}.".format(
+                    options.sort, ", ".join(CENSUS_SORT_KEYS)
+                )
             )
-        if not allocations:
-            print("No heap addresses found", file=self.result)
+            return
+
+        if not heap.loadChiselIfNecessary():
+            return
+        if not heap.hasClassCensus():
+            print("The loaded Chisel library is too old for heapcensus, rebuild it.")
+            return
+
+        census, scanned = heap.classCensus(refresh=options.refresh)
+        if census is None:
+            return
+
+        if _censusHistory and _censusHistory[-1].stopKey == census.stopKey:
+            _censusHistory[-1] = census
+        else:
+            _censusHistory.append(census)
+
+        limit = int(options.limit)
+        if options.diff:
+            if len(_censusHistory) < 2:
+                print("There is no census of an earlier stop to compare to.")
+                return
+            printCensusDiff(_censusHistory[0], census, options.sort, limit)
+        else:
+            printCensus(census, options.sort, limit)
+
+        print(
+            "\n{} {} instances of {} classes, {:,} bytes{}.".format(
+                "Scanned" if scanned else "This stop's census has",
+                census.instanceCount,
+                len(census.rows),
+                census.totalSize,
+                " in {:.2f}s".format(census.scanSeconds) if scanned else "",
+            )
+        )
+
+
+def sortedCensusRows(rows, sort, limit):
+    # Names sort ascending, everything else largest first.
+    rows = sorted(rows, key=CENSUS_SORT_KEYS[sort], reverse=(sort != "name"))
+    return rows[:limit] if limit > 0 else rows
+
+
+def printCensus(census, sort, limit):
+    print("{:>10} {:>14} {:>10}  {}".format("Count", "Bytes", "Avg", "Class"))
+    for row in sortedCensusRows(census.rows.values(), sort, limit):
+        print(
+            "{:>10,} {:>14,} {:>10.1f}  {}".format(
+                row.count, row.size, row.averageSize, row.name
+            )
+        )
+
+
+def printCensusDiff(before, after, sort, limit):
+    deltas = []
+    for name in set(before.rows) | set(after.rows):
+        old = before.rows.get(name) or heap.FBClassCensusRow(name, 0, 0)
+        new = after.rows.get(name) or heap.FBClassCensusRow(name, 0, 0)
+        if old.count != new.count or old.size != new.size:
+            deltas.append(
+                heap.FBClassCensusRow(name, new.count - old.count, new.size - old.size)
+            )
+
+    if not deltas:
+        print("No classes changed since the previous census.")
+        return
+
+    print(
+        "{:>10} {:>14} {:>10} {:>14}  {}".format(
+            "+Count", "+Bytes", "Count", "Bytes", "Class"
+        )
+    )
+    for delta in sortedCensusRows(deltas, sort, limit):
+        current = after.rows.get(delta.name) or heap.FBClassCensusRow(delta.name, 0, 0)
+        print(
+            "{:>+10,} {:>+14,} {:>10,} {:>14,}  {}".format(
+                delta.count, delta.size, current.count, current.size, delta.name
+            )
+        )
 
 
 class FBSequenceCommand(fb.FBCommand):
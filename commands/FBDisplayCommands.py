@@ -107,9 +107,7 @@ class FBDrawBorderCommand(fb.FBCommand):
 
         if viewHelpers.isView(obj):
             prevLevel = 0
-            for view, level in viewHelpers.subviewsOfView(obj):
-                if level > depth:
-                    break
+            for view, level in viewHelpers.subviewsOfView(obj, maxDepth=depth):
                 if prevLevel != level:
                     color = self.nextColorAfterColor(color)
                     prevLevel = level
@@ -165,9 +163,7 @@ class FBRemoveBorderCommand(fb.FBCommand):
         obj = args[0]
         depth = int(options.depth)
         if viewHelpers.isView(obj):
-            for view, level in viewHelpers.subviewsOfView(obj):
-                if level > depth:
-                    break
+            for view, _ in viewHelpers.subviewsOfView(obj, maxDepth=depth):
                 layer = viewHelpers.convertToLayer(view)
                 setUnborder(layer)
         else:
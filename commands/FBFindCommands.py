@@ -6,16 +6,21 @@
 # LICENSE file in the root directory of this source tree.
 
 import os
-import re
 
+import fbchisellldbargumenthelpers as argumentHelpers
 import fbchisellldbbase as fb
-import fbchisellldbobjcruntimehelpers as objc
 import fbchisellldbviewcontrollerhelpers as vcHelpers
+import fbchisellldbviewqueryhelpers as queryHelpers
 import lldb
 
 
 def lldbcommands():
-    return [FBFindViewControllerCommand(), FBFindViewCommand(), FBTapLoggerCommand()]
+    return [
+        FBFindViewControllerCommand(),
+        FBFindViewCommand(),
+        FBViewQueryCommand(),
+        FBTapLoggerCommand(),
+    ]
 
 
 class FBFindViewControllerCommand(fb.FBCommand):
@@ -41,6 +46,14 @@ class FBFindViewControllerCommand(fb.FBCommand):
                 type="UIView",
                 help="This function will print the View Controller that owns this view.",
             ),
+            fb.FBCommandArgument(
+                short="-l",
+                long="--limit",
+                arg="limit",
+                type="int",
+                default=None,
+                help="Stop after this many matches.",
+            ),
         ]
 
     def run(self, arguments, options):
@@ -49,13 +62,19 @@ class FBFindViewControllerCommand(fb.FBCommand):
         elif options.view:
             self.findOwningViewController(options.view)
         else:
-            output = vcHelpers.viewControllerRecursiveDescription(
-                "(id)[[[UIApplication sharedApplication] keyWindow] rootViewController]"
-            )
             searchString = (
                 options.classNameRegex if options.classNameRegex else arguments[0]
             )
-            printMatchesInViewOutputStringAndCopyFirstToClipboard(searchString, output)
+            try:
+                viewControllers = vcHelpers.findViewControllersOfClassMatching(
+                    searchString,
+                    "(id)[[[UIApplication sharedApplication] keyWindow] rootViewController]",
+                    int(options.limit) if options.limit else None,
+                )
+            except (queryHelpers.ViewQueryError, ValueError) as e:
+                print(e)
+                return
+            printViewsAndCopyFirstToClipboard(viewControllers)
 
     def findOwningViewController(self, object):
         while object:
@@ -104,27 +123,146 @@ class FBFindViewCommand(fb.FBCommand):
             )
         ]
 
+    def options(self):
+        return [
+            fb.FBCommandArgument(
+                short="-l",
+                long="--limit",
+                arg="limit",
+                type="int",
+                default=None,
+                help="Stop after this many matches.",
+            ),
+        ]
+
     def run(self, arguments, options):
-        output = fb.evaluateExpressionValue(
-            "(id)[[[UIApplication sharedApplication] keyWindow] recursiveDescription]"
-        ).GetObjectDescription()
-        printMatchesInViewOutputStringAndCopyFirstToClipboard(arguments[0], output)
-
-
-def printMatchesInViewOutputStringAndCopyFirstToClipboard(needle, haystack):
-    first = None
-    for match in re.finditer(
-        ".*<.*(" + needle + ")\\S*: (0x[0-9a-fA-F]*);.*", haystack, re.IGNORECASE
-    ):
-        view = match.groups()[-1]
-        className = fb.evaluateExpressionValue(
-            "(id)[(" + view + ") class]"
-        ).GetObjectDescription()
-        print("{} {}".format(view, className))
-        if first is None:
-            first = view
-            cmd = 'echo %s | tr -d "\n" | pbcopy' % view
-            os.system(cmd)
+        try:
+            views = queryHelpers.findViewsOfClassMatching(
+                arguments[0],
+                "(id)[[UIApplication sharedApplication] keyWindow]",
+                int(options.limit) if options.limit else None,
+            )
+        except (queryHelpers.ViewQueryError, ValueError) as e:
+            print(e)
+            return
+        printViewsAndCopyFirstToClipboard(views)
+
+
+class FBViewQueryCommand(fb.FBCommand):
+    def name(self):
+        return "vquery"
+
+    def description(self):
+        return """Find the views matching a query, and put the address of the first on the clipboard.
+
+The query is made of clauses joined by `and`, each clause is `field operator value`:
+  class, identifier (id), label (a11y), address, window: ==, != or ~ (case insensitive regex)
+  tag, alpha, depth: ==, !=, <, >, <= or >=
+  hidden: == YES or == NO
+  frame (in window coordinates): intersects x,y,width,height or contains x,y
+
+The views of every window are captured in one snapshot per window and indexed by class,
+identifier, label, tag and window. The snapshot is reused until the process resumes.
+
+Examples:
+  vquery class ~ Button and label ~ '^Log in' and hidden == NO
+  vquery id == loginField
+  vquery class == UILabel and frame intersects 0,0,375,100"""
+
+    def options(self):
+        return [
+            fb.FBCommandArgument(
+                short="-v",
+                long="--view",
+                arg="view",
+                type="UIView*",
+                default=None,
+                help="Only query the hierarchy of this view, instead of every window.",
+            ),
+            fb.FBCommandArgument(
+                short="-l",
+                long="--limit",
+                arg="limit",
+                type="int",
+                default=None,
+                help="Stop after this many matches.",
+            ),
+            fb.FBCommandArgument(
+                short="-r",
+                long="--refresh",
+                arg="refresh",
+                type="BOOL",
+                boolean=True,
+                default=False,
+                help="Take a new snapshot even if one was taken at this stop.",
+            ),
+        ]
+
+    def args(self):
+        return [fb.FBCommandArgument(arg="query", type="string", help="The query.")]
+
+    def lex(self, commandLine):
+        # Can't use default shlex splitting because it strips the quotes around
+        # query values. Split the options (and their values) from the query.
+        flags = []
+        rest = commandLine.strip()
+        while rest.startswith("-"):
+            flag, _, rest = rest.partition(" ")
+            flags.append(flag)
+            rest = rest.strip()
+            if flag in ("-v", "--view", "-l", "--limit"):
+                value, _, rest = rest.partition(" ")
+                flags.append(value)
+                rest = rest.strip()
+        return flags + ["--", rest]
+
+    def run(self, arguments, options):
+        try:
+            clauses = queryHelpers.parseQuery(arguments[0])
+            limit = int(options.limit) if options.limit else None
+        except (queryHelpers.ViewQueryError, ValueError) as e:
+            self.result.SetError("Invalid query: {}".format(e))
+            return
+
+        index = queryHelpers.viewIndex(
+            [options.view] if options.view else None, options.refresh
+        )
+        views = index.query(clauses, limit)
+        printViewsAndCopyFirstToClipboard(views, queryHelpers.describeView)
+        print("{} of {} views matched".format(len(views), len(index)))
+
+
+def printViewsAndCopyFirstToClipboard(views, describe=None):
+    for view in views:
+        if describe:
+            print(describe(view))
+        else:
+            print("{} {}".format(view.address, view.className))
+    if views:
+        cmd = 'echo %s | tr -d "\n" | pbcopy' % views[0].address
+        os.system(cmd)
+
+
+# Describes the touched view and its gesture recognizers if `event` is a touch
+# that just began, returns an empty dictionary otherwise.
+TAP_EVENT = fb.FBExpressionTemplate(
+    "tapEvent",
+    "char *",
+    [("id", "event")],
+    """
+    if ((NSInteger)[event type] != 0) {
+        return RETURN(@{});
+    }
+    id touch = [[event allTouches] anyObject];
+    if ((NSInteger)[touch phase] != 0) {
+        return RETURN(@{});
+    }
+    return RETURN(@{
+        @"gestureRecognizers": [[touch gestureRecognizers] description] ?: @"(null)",
+        @"view": [[touch view] description] ?: @"(null)"
+    });
+    """,
+)
 
 
 class FBTapLoggerCommand(fb.FBCommand):
@@ -135,18 +273,12 @@ class FBTapLoggerCommand(fb.FBCommand):
         return "Log tapped view to the console."
 
     def run(self, arguments, options):
-        parameterExpr = objc.functionPreambleExpressionForObjectParameterAtIndex(0)
-        breakpoint = lldb.debugger.GetSelectedTarget().BreakpointCreateByName(
-            "-[UIApplication sendEvent:]"
-        )
-        breakpoint.SetCondition(
-            "(int)["
-            + parameterExpr
-            + " type] == 0 && (int)[[["
-            + parameterExpr
-            + " allTouches] anyObject] phase] == 0"
-        )
-        breakpoint.SetOneShot(True)
+        target = lldb.debugger.GetSelectedTarget()
+        if argumentHelpers.abiForTarget(target) is None:
+            print("Only arm64 and x86_64 are currently supported.")
+            return
+
+        breakpoint = target.BreakpointCreateByName("-[UIApplication sendEvent:]")
 
         callback_name = taplog_callback.__qualname__
         # Import the callback so LLDB can see it
@@ -160,18 +292,34 @@ class FBTapLoggerCommand(fb.FBCommand):
 
 
 def taplog_callback(frame, bp_loc, internal_dict):
-    parameterExpr = objc.functionPreambleExpressionForObjectParameterAtIndex(0)
-    print(
-        "Gesture Recognizers:\n{}".format(
-            fb.describeObject(
-                "[[[%s allTouches] anyObject] gestureRecognizers]" % (parameterExpr)
-            )
-        )
-    )
-    print(
-        "View:\n{}".format(
-            fb.describeObject("[[[%s allTouches] anyObject] view]" % (parameterExpr))
-        )
-    )
+    # The event and its class are read straight from its register and isa, so
+    # only touch events evaluate an expression, instead of every event sent.
+    event = argumentHelpers.argumentAtIndex(frame, 2)
+    if not event or eventClassName(frame, event) != "UITouchesEvent":
+        return False
+    tap = TAP_EVENT.evaluateJSON("0x{:x}".format(event))
+    if not tap:
+        return False
+
+    breakpoint = bp_loc.GetBreakpoint()
+    breakpoint.GetTarget().BreakpointDelete(breakpoint.GetID())
+    print("Gesture Recognizers:\n{}".format(tap["gestureRecognizers"]))
+    print("View:\n{}".format(tap["view"]))
     # We don't want to proceed event (click on button for example), so we just skip it
     lldb.debugger.HandleCommand("thread return")
+
+
+# Returns the class name of the object at `address`, read by LLDB's
+# Objective-C runtime support from the object's isa without running code in
+# the process.
+def eventClassName(frame, address):
+    target = frame.GetThread().GetProcess().GetTarget()
+    process = target.GetProcess()
+    data = lldb.SBData.CreateDataFromUInt64Array(
+        process.GetByteOrder(), process.GetAddressByteSize(), [address]
+    )
+    value = target.CreateValueFromData(
+        "event", data, target.GetBasicType(lldb.eBasicTypeObjCID)
+    )
+    typeName = value.GetDynamicValue(lldb.eDynamicDontRunTarget).GetTypeName()
+    return typeName.rstrip(" *") if typeName else None
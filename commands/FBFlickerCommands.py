@@ -66,7 +66,11 @@ class FBViewSearchCommand(fb.FBCommand):
 
 class FlickerWalker:
     def __init__(self, startView):
-        self.setCurrentView(startView)
+        # Navigate a snapshot of the whole window, so moving around doesn't cost
+        # any expressions. The masks added while walking aren't part of it.
+        self.tree = viewHelpers.snapshotViewHierarchy(startView, fromRoot=True)
+        node = self.tree.nodeForAddress(startView) if self.tree else None
+        self.setCurrentView(node.address if node else startView)
 
     def run(self):
         self.keepRunning = True
@@ -96,22 +100,22 @@ class FlickerWalker:
             self.keepRunning = False
 
         elif input == "w":
-            v = superviewOfView(self.currentView)
+            v = superviewOfView(self.tree, self.currentView)
             if not v:
                 print("There is no superview. Where are you trying to go?!")
             self.setCurrentView(v, oldView)
         elif input == "s":
-            v = firstSubviewOfView(self.currentView)
+            v = firstSubviewOfView(self.tree, self.currentView)
             if not v:
                 print("\nThe view has no subviews.\n")
             self.setCurrentView(v, oldView)
         elif input == "d":
-            v = nthSiblingOfView(self.currentView, -1)
+            v = nthSiblingOfView(self.tree, self.currentView, -1)
             if v == oldView:
                 print("\nThere are no sibling views to this view.\n")
             self.setCurrentView(v, oldView)
         elif input == "a":
-            v = nthSiblingOfView(self.currentView, 1)
+            v = nthSiblingOfView(self.tree, self.currentView, 1)
             if v == oldView:
                 print("\nThere are no sibling views to this view.\n")
             self.setCurrentView(v, oldView)
@@ -135,41 +139,37 @@ class FlickerWalker:
             print(fb.describeObject(view))
 
 
-def superviewOfView(view):
-    superview = fb.evaluateObjectExpression("[" + view + " superview]")
-    if int(superview, 16) == 0:
-        return None
+def superviewOfView(tree, view):
+    node = tree.nodeForAddress(view) if tree else None
+    if node is None:
+        superview = fb.evaluateObjectExpression("[" + view + " superview]")
+        if int(superview, 16) == 0:
+            return None
+        return superview
 
-    return superview
+    parent = tree.parentOf(node)
+    return parent.address if parent else None
 
 
-def subviewsOfView(view):
-    return fb.evaluateObjectExpression("[" + view + " subviews]")
-
-
-def firstSubviewOfView(view):
-    subviews = subviewsOfView(view)
-    numViews = fb.evaluateIntegerExpression("[(id)" + subviews + " count]")
-
-    if numViews == 0:
-        return None
-    else:
+def firstSubviewOfView(tree, view):
+    node = tree.nodeForAddress(view) if tree else None
+    if node is None:
+        subviews = fb.evaluateObjectExpression("[" + view + " subviews]")
+        numViews = fb.evaluateIntegerExpression("[(id)" + subviews + " count]")
+        if numViews == 0:
+            return None
         return fb.evaluateObjectExpression("[" + subviews + " objectAtIndex:0]")
 
+    children = tree.childrenOf(node)
+    return children[0].address if children else None
 
-def nthSiblingOfView(view, n):
-    subviews = subviewsOfView(superviewOfView(view))
-    numViews = fb.evaluateIntegerExpression("[(id)" + subviews + " count]")
-
-    idx = fb.evaluateIntegerExpression(
-        "[(id)" + subviews + " indexOfObject:" + view + "]"
-    )
 
-    newIdx = idx + n
-    while newIdx < 0:
-        newIdx += numViews
-    newIdx = newIdx % numViews
+def nthSiblingOfView(tree, view, n):
+    node = tree.nodeForAddress(view) if tree else None
+    parent = tree.parentOf(node) if node else None
+    if parent is None:
+        return view
 
-    return fb.evaluateObjectExpression(
-        "[(id)" + subviews + " objectAtIndex:" + str(newIdx) + "]"
-    )
+    siblings = tree.childrenOf(parent)
+    newIdx = (siblings.index(node) + n) % len(siblings)
+    return siblings[newIdx].address
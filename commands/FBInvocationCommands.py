@@ -7,7 +7,9 @@
 
 import re
 
+import fbchisellldbargumenthelpers as argumentHelpers
 import fbchisellldbbase as fb
+import fbchisellldbprofile as profile
 import lldb
 
 
@@ -15,12 +17,27 @@ def lldbcommands():
     return [FBPrintInvocation()]
 
 
+# Matches `-[Class(Category) selector:]`, capturing the scope, class and selector.
+METHOD_SYMBOL = re.compile(r"^([-+])\s*\[(\S+?)(?:\([^)]*\))?\s+(\S+)\]$")
+
+MAX_STRING_LENGTH = 1024
+
+
 class FBPrintInvocation(fb.FBCommand):
     def name(self):
         return "pinvocation"
 
     def description(self):
-        return "Print the stack frame, receiver, and arguments of the current invocation. It will fail to print all arguments if any arguments are variadic (varargs).\n\nNOTE: Sadly this is currently only implemented on x86."
+        return (
+            "Print the stack frame, receiver, and arguments of the current "
+            "invocation. The arguments are read from the registers and the stack "
+            "following the arm64 or x86_64 calling convention, and decoded with "
+            "the method's type encoding. It will fail to print all arguments if "
+            "any arguments are variadic (varargs).\n\nNOTE: Argument registers "
+            "are only sure to hold the arguments on entry to a method (e.g. at a "
+            "symbolic breakpoint), methods further up the stack have usually "
+            "reused them."
+        )
 
     def options(self):
         return [
@@ -36,201 +53,145 @@ class FBPrintInvocation(fb.FBCommand):
 
     def run(self, arguments, options):
         target = lldb.debugger.GetSelectedTarget()
-
-        if not re.match(r".*i386.*", target.GetTriple()):
-            print("Only x86 is currently supported (32-bit iOS Simulator or Mac OS X).")
+        abi = argumentHelpers.abiForTarget(target)
+        if abi is None:
+            print("Only arm64 and x86_64 are currently supported.")
             return
 
         thread = target.GetProcess().GetSelectedThread()
-
         if options.all:
-            for frame in thread:
-                printInvocationForFrame(frame)
-                print("---------------------------------")
+            frames = list(thread)
         else:
-            frame = thread.GetSelectedFrame()
-            printInvocationForFrame(frame)
-
-
-def printInvocationForFrame(frame):
-    print(frame)
-
-    symbolName = frame.GetSymbol().GetName()
-    if not re.match(r"[-+]\s*\[.*\]", symbolName):
-        return
+            frames = [thread.GetSelectedFrame()]
+
+        invocations = [Invocation(frame, abi) for frame in frames]
+        loadInvocations(invocations)
+        for invocation in invocations:
+            for line in invocation.lines():
+                print(line)
+            if options.all:
+                print("---------------------------------")
 
-    self = findArgAtIndexFromStackFrame(frame, 0)
-    cmd = findArgAtIndexFromStackFrame(frame, 1)
 
-    commandForSignature = (
-        "[(id)"
-        + self
-        + " methodSignatureForSelector:(char *)sel_getName((SEL)"
-        + cmd
-        + ")]"
-    )
-    signatureValue = fb.evaluateExpressionValue("(id)" + commandForSignature)
-
-    if (
-        signatureValue.GetError() is not None
-        and str(signatureValue.GetError()) != "success"
-    ):
-        print(
-            "My sincerest apologies. I couldn't find a method signature for the selector."
+class Invocation:
+    """
+    The receiver and arguments of the Objective-C method running in a frame,
+    read by loadInvocations.
+    """
+
+    def __init__(self, frame, abi):
+        self.frame = frame
+        self.abi = abi
+        self.method = METHOD_SYMBOL.match(frame.GetSymbol().GetName() or "")
+        self.returnType = None
+        self.types = []
+        self.values = []
+        self.descriptions = {}
+        self.atEntry = True
+        self.error = None
+
+    def typeEncodingExpression(self):
+        scope, className, selector = self.method.groups()
+        getMethod = (
+            "class_getClassMethod" if scope == "+" else "class_getInstanceMethod"
         )
-        return
+        return (
+            "(id)[NSString stringWithUTF8String:(const char *)method_getTypeEncoding("
+            '(void *){}((Class)objc_getClass("{}"), (SEL)sel_registerName("{}")))]'
+        ).format(getMethod, className, selector)
+
+    def read(self, typeEncoding):
+        try:
+            if typeEncoding:
+                types = argumentHelpers.parseMethodTypeEncoding(typeEncoding)
+                self.returnType, self.types = types[0], types[1:]
+            else:
+                # Without a type encoding, every argument is printed as a word.
+                argumentCount = self.method.group(3).count(":")
+                self.types = argumentHelpers.parseMethodTypeEncoding(
+                    "@:" + "Q" * argumentCount
+                )
+            frameArguments = argumentHelpers.FBFrameArguments(self.frame, self.abi)
+            self.atEntry = frameArguments.atEntry
+            self.values = frameArguments.read(self.types, returnType=self.returnType)
+        except argumentHelpers.FBArgumentError as error:
+            self.error = str(error)
+
+    def objectArguments(self):
+        for index, (type, value) in enumerate(zip(self.types, self.values)):
+            if index >= 2 and type.code == "@" and value and any(value):
+                yield index, type.decode(value)
+
+    def describe(self, type, value):
+        if value is None:
+            return "unavailable"
+        decoded = type.decode(value)
+        if type.code in ":*" and int(decoded, 16):
+            string = readCString(self.frame, int(decoded, 16))
+            if string is not None:
+                return string if type.code == ":" else '{} "{}"'.format(decoded, string)
+        return decoded
+
+    def lines(self):
+        yield str(self.frame)
+        if not self.method:
+            return
+        if self.error:
+            yield self.error
+            return
+        if not self.atEntry:
+            yield (
+                "The method has started running, so its arguments may no "
+                "longer be in their registers."
+            )
 
-    signature = signatureValue.GetValue()
+        yield "self: " + self.describe(self.types[0], self.values[0])
+        yield "_cmd: " + self.describe(self.types[1], self.values[1])
 
-    arg0 = stackStartAddressInSelectedFrame(frame)
-    commandForInvocation = (
-        "[NSInvocation _invocationWithMethodSignature:(id)"
-        + signature
-        + " frame:((void *)"
-        + str(arg0)
-        + ")]"
+        argumentCount = len(self.types) - 2
+        if argumentCount > 0:
+            yield (
+                "\n{} Arguments:".format(argumentCount)
+                if argumentCount > 1
+                else "\nArgument:"
+            )
+        for index in range(2, len(self.types)):
+            type = self.types[index]
+            description = self.descriptions.get(index)
+            if description is None:
+                description = self.describe(type, self.values[index])
+            yield "{}: {}".format(type.name, description)
+
+
+def readCString(frame, address):
+    error = lldb.SBError()
+    process = frame.GetThread().GetProcess()
+    string = profile.readMemory(
+        process, address, MAX_STRING_LENGTH, error, cString=True
     )
-    invocation = fb.evaluateExpression("(id)" + commandForInvocation)
-
-    if invocation:
-        prettyPrintInvocation(frame, invocation)
-    else:
-        print(frame)
-
-
-def stackStartAddressInSelectedFrame(frame):
-    # Determine if the %ebp register has already had the
-    # stack register pushed into it (always the first instruction)
-    frameSymbol = frame.GetSymbolContext(0).GetSymbol()
-    frameStartAddress = frameSymbol.GetStartAddress().GetLoadAddress(
-        lldb.debugger.GetSelectedTarget()
+    return string if error.Success() else None
+
+
+def loadInvocations(invocations):
+    """
+    Reads the arguments of every invocation. The type encodings of all the
+    methods are fetched in one batch, and the descriptions of all the object
+    arguments in another.
+    """
+    methods = [invocation for invocation in invocations if invocation.method]
+    typeEncodings = fb.evaluateMany(
+        [invocation.typeEncodingExpression() for invocation in methods],
+        kind="string",
+        printErrors=False,
     )
-
-    currentPC = frame.GetPC()
-
-    offset = currentPC - frameStartAddress
-
-    if offset == 0:
-        return int(frame.EvaluateExpression("($esp + 4)").GetValue())
-    elif offset == 1:
-        return int(frame.EvaluateExpression("($esp + 8)").GetValue())
-    else:
-        return int(frame.EvaluateExpression("($ebp + 8)").GetValue())
-
-
-def findArgAtIndexFromStackFrame(frame, index):
-    return fb.evaluateExpression(
-        "*(int *)" + str(findArgAdressAtIndexFromStackFrame(frame, index))
-    )
-
-
-def findArgAdressAtIndexFromStackFrame(frame, index):
-    arg0 = stackStartAddressInSelectedFrame(frame)
-    arg = arg0 + 4 * index
-    return arg
-
-
-def prettyPrintInvocation(frame, invocation):
-    object = fb.evaluateExpression("(id)[(id)" + invocation + " target]")
-    description = fb.evaluateExpressionValue("(id)" + invocation).GetObjectDescription()
-    argDescriptions = description.splitlines(True)[4:]
-
-    print("NSInvocation: " + invocation)
-    print("self: " + fb.evaluateExpression("(id)" + object))
-
-    if len(argDescriptions) > 0:
-        print(
-            "\n" + str(len(argDescriptions)) + " Arguments:"
-            if len(argDescriptions) > 1
-            else "\nArgument:"
-        )
-
-        index = 2
-        for argDescription in argDescriptions:
-            s = re.sub(r"argument [0-9]+: ", "", argDescription)
-
-            address = findArgAdressAtIndexFromStackFrame(frame, index)
-
-            encoding = s.split(" ")[0]
-            description = " ".join(s.split(" ")[1:])
-
-            readableString = argumentAsString(frame, address, encoding)
-
-            if readableString:
-                print(readableString)
-            else:
-                if encoding[0] == "{":
-                    encoding = encoding[1:]
-                print(
-                    (
-                        hex(address) + ", address of " + encoding + " " + description
-                    ).strip()
-                )
-
-            index += 1
-
-
-def argumentAsString(frame, address, encoding):  # noqa C901
-    if encoding[0] == "{":
-        encoding = encoding[1:]
-
-    encodingMap = {
-        "c": "char",
-        "i": "int",
-        "s": "short",
-        "l": "long",
-        "q": "long long",
-        "C": "unsigned char",
-        "I": "unsigned int",
-        "S": "unsigned short",
-        "L": "unsigned long",
-        "Q": "unsigned long long",
-        "f": "float",
-        "d": "double",
-        "B": "bool",
-        "v": "void",
-        "*": "char *",
-        "@": "id",
-        "#": "Class",
-        ":": "SEL",
-    }
-
-    pointers = ""
-    while encoding[0] == "^":
-        pointers += "*"
-        encoding = encoding[1:]
-
-    type = None
-    if encoding in encodingMap:
-        type = encodingMap[encoding]
-
-    if type and pointers:
-        type = type + " " + pointers
-
-    if not type:
-        # Handle simple structs: {CGPoint=ff}, {CGSize=ff},
-        # {CGRect={CGPoint=ff}{CGSize=ff}}
-        if encoding[0] == "{":
-            encoding = encoding[1:]
-
-        type = re.sub(r"=.*", "", encoding)
-        if pointers:
-            type += " " + pointers
-
-    if type:
-        value = frame.EvaluateExpression("*(" + type + " *)" + str(address))
-
-        if value.GetError() is None or str(value.GetError()) == "success":
-            description = None
-
-            if encoding == "@":
-                description = value.GetObjectDescription()
-
-            if not description:
-                description = value.GetValue()
-            if not description:
-                description = value.GetSummary()
-            if description:
-                return type + ": " + description
-
-    return None
+    for invocation, typeEncoding in zip(methods, typeEncodings):
+        invocation.read(typeEncoding)
+
+    with fb.batch(printErrors=False) as batch:
+        futures = [
+            (invocation, index, batch.add("(id)" + address, kind="description"))
+            for invocation in methods
+            for index, address in invocation.objectArguments()
+        ]
+    for invocation, index, future in futures:
+        invocation.descriptions[index] = future.result()
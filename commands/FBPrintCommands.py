@@ -5,12 +5,18 @@
 # This source code is licensed under the MIT license found in the
 # LICENSE file in the root directory of this source tree.
 
+import base64
+import codecs
+import json
 import os
 import re
 import subprocess
 
 import fbchisellldbbase as fb
+import fbchisellldbjsonhelpers as jsonHelpers
+import fbchisellldbmemoryhelpers as memory
 import fbchisellldbobjcruntimehelpers as runtimeHelpers
+import fbchisellldboutputhelpers as output
 import fbchisellldbviewcontrollerhelpers as vcHelpers
 import fbchisellldbviewhelpers as viewHelpers
 import lldb
@@ -136,6 +142,25 @@ class FBPrintViewHierarchyCommand(fb.FBCommand):
                 print(
                     "Failed to walk view hierarchy. Make sure you pass a view, not any other kind of object or expression."
                 )
+        elif options.short or options.medium:
+            # The short and medium descriptions only need the class and address
+            # of each view, which a snapshot provides without fetching the full
+            # recursive description.
+            tree = viewHelpers.snapshotViewHierarchy(
+                arguments[0], maxDepth=(maxDepth if maxDepth > 0 else None)
+            )
+            if tree is None:
+                print(
+                    "Failed to walk view hierarchy. Make sure you pass a view, not any other kind of object or expression."
+                )
+                return
+
+            for node in tree:
+                if options.short:
+                    nodeDescription = "<{}>".format(node.className)
+                else:
+                    nodeDescription = "<{}: {}>".format(node.className, node.address)
+                print("   | " * node.depth + nodeDescription)
         else:
             printingMethod = "recursiveDescription"
             if isMac:
@@ -150,13 +175,6 @@ class FBPrintViewHierarchyCommand(fb.FBCommand):
                 description += "\n"
                 description = re.sub(r"%s.*\n" % (prefixToRemove), r"", description)
 
-            if options.short:
-                toRemove = ":.*(?:\n|$)"
-                description = re.sub(toRemove, r">\n", description)
-            elif options.medium:
-                toRemove = ";.*(?:\n|$)"
-                description = re.sub(toRemove, r">\n", description)
-
             print(description)
 
 
@@ -177,14 +195,29 @@ class FBPrintViewControllerHierarchyCommand(fb.FBCommand):
             )
         ]
 
+    def options(self):
+        return [
+            fb.FBCommandArgument(
+                arg="json",
+                short="-j",
+                long="--json",
+                type="BOOL",
+                boolean=True,
+                default=False,
+                help="Print the view controller tree as JSON.",
+            ),
+            output.outputOption(),
+        ]
+
     def run(self, arguments, options):
         isMac = runtimeHelpers.isMacintoshArch()
 
         if arguments[0] == "__keyWindow_rootVC_dynamic__":
-            if fb.evaluateBooleanExpression(
+            if not options.json and fb.evaluateBooleanExpression(
                 "[UIViewController respondsToSelector:@selector(_printHierarchy)]"
             ):
-                print(fb.describeObject("[UIViewController _printHierarchy]"))
+                description = fb.describeObject("[UIViewController _printHierarchy]")
+                output.writeLines(description.splitlines(), self.result, options.out)
                 return
 
             arguments[0] = (
@@ -195,7 +228,20 @@ class FBPrintViewControllerHierarchyCommand(fb.FBCommand):
                     "(id)[[[[NSApplication sharedApplication] windows] objectAtIndex:0] contentViewController]"
                 )
 
-        print(vcHelpers.viewControllerRecursiveDescription(arguments[0]))
+        if options.json:
+            tree = vcHelpers.viewControllerTree(arguments[0])
+            if tree is None:
+                print("Couldn't get the view controller tree.")
+                return
+            lines = json.dumps(tree, indent=2).splitlines()
+            output.writeLines(lines, self.result, options.out)
+            return
+
+        output.writeLines(
+            vcHelpers.viewControllerRecursiveDescriptionLines(arguments[0]),
+            self.result,
+            options.out,
+        )
 
 
 class FBPrintIsExecutingInAnimationBlockCommand(fb.FBCommand):
@@ -292,37 +338,85 @@ def _responderChain(startResponder):
         )
 
 
-def tableViewInHierarchy():
-    viewDescription = fb.evaluateExpressionValue(
-        "(id)[(id)[[UIApplication sharedApplication] keyWindow] recursiveDescription]"
-    ).GetObjectDescription()
-
-    searchView = None
-
-    # Try to find an instance of
-    classPattern = re.compile(r"UITableView: (0x[0-9a-fA-F]+);")
-    for match in re.finditer(classPattern, viewDescription):
-        searchView = match.group(1)
-        break
-
-    # Try to find a direct subclass
-    if not searchView:
-        subclassPattern = re.compile(r"(0x[0-9a-fA-F]+); baseClass = UITableView;")
-        for match in re.finditer(subclassPattern, viewDescription):
-            searchView = match.group(1)
-            break
-
-    # SLOW: check every pointer in town
-    if not searchView:
-        pattern = re.compile(r"(0x[0-9a-fA-F]+)[;>]")
-        for view in re.findall(pattern, viewDescription):
-            if fb.evaluateBooleanExpression(
-                "[" + view + " isKindOfClass:(id)[UITableView class]]"
-            ):
-                searchView = view
-                break
-
-    return searchView
+# Finds the table (or collection) views in the key window, skipping hidden
+# subtrees, and returns the address, class and on-screen area of each.
+SCROLL_LISTS_EXPRESSION = """
+Class __listClass = (Class)NSClassFromString(@"%(className)s");
+id __window = (id)[[UIApplication sharedApplication] keyWindow];
+CGRect __windowBounds = (CGRect)[__window bounds];
+NSMutableArray *__lists = (id)[NSMutableArray array];
+NSMutableArray *__stack = (id)[NSMutableArray array];
+if (__window != nil) {
+    [__stack addObject:__window];
+}
+while ((NSUInteger)[__stack count] > 0) {
+    id __view = (id)[__stack lastObject];
+    [__stack removeLastObject];
+    if ((BOOL)[__view isHidden] || (CGFloat)[__view alpha] <= 0.01) {
+        continue;
+    }
+    if ((BOOL)[__view isKindOfClass:__listClass]) {
+        CGRect __frame = (CGRect)[__view convertRect:(CGRect)[__view bounds] toView:nil];
+        CGRect __visible = (CGRect)CGRectIntersection(__frame, __windowBounds);
+        double __area = (BOOL)CGRectIsNull(__visible) ? 0 : __visible.size.width * __visible.size.height;
+        [__lists addObject:@[
+            (id)[NSString stringWithFormat:@"%%p", __view],
+            (id)NSStringFromClass((Class)[__view class]),
+            [NSNumber numberWithDouble:__area]
+        ]];
+    }
+    NSArray *__subviews = (id)[__view subviews];
+    for (NSInteger __i = (NSInteger)[__subviews count] - 1; __i >= 0; --__i) {
+        [__stack addObject:(id)[__subviews objectAtIndex:__i]];
+    }
+}
+RETURN(__lists);
+"""
+
+# Returns the address, section, row (or item) and description of each visible
+# cell of a table or collection view.
+VISIBLE_CELLS_EXPRESSION = """
+id __list = (id)(%(list)s);
+NSMutableArray *__cells = (id)[NSMutableArray array];
+for (id __cell in (NSArray *)[__list visibleCells]) {
+    NSIndexPath *__path = (id)[__list indexPathForCell:__cell];
+    [__cells addObject:@[
+        (id)[NSString stringWithFormat:@"%%p", __cell],
+        [NSNumber numberWithInteger:__path ? (NSInteger)[__path indexAtPosition:0] : -1],
+        [NSNumber numberWithInteger:__path ? (NSInteger)[__path indexAtPosition:1] : -1],
+        (id)[__cell description]
+    ]];
+}
+RETURN(__cells);
+"""
+
+COLLECTION_OPTION = fb.FBCommandArgument(
+    short="-c",
+    long="--collection",
+    arg="collection",
+    type="BOOL",
+    boolean=True,
+    default=False,
+    help="Look for a collection view instead of a table view.",
+)
+
+
+# Returns the (address, class name, visible area) of the table views (or
+# collection views) in the key window, largest visible area first. Views with
+# the same area keep their hierarchy order.
+def scrollListsInHierarchy(collection=False):
+    className = "UICollectionView" if collection else "UITableView"
+    lists = fb.evaluate(SCROLL_LISTS_EXPRESSION % {"className": className})
+    return sorted(lists or [], key=lambda entry: -entry[2])
+
+
+def scrollListKind(collection=False):
+    return "collection-view" if collection else "table-view"
+
+
+def tableViewInHierarchy(collection=False):
+    lists = scrollListsInHierarchy(collection)
+    return lists[0][0] if lists else None
 
 
 class FBPrintOnscreenTableView(fb.FBCommand):
@@ -330,17 +424,24 @@ class FBPrintOnscreenTableView(fb.FBCommand):
         return "ptv"
 
     def description(self):
-        return "Print the highest table view in the hierarchy."
+        return "Print the table view (or collection view) with the largest visible area in the hierarchy."
+
+    def options(self):
+        return [COLLECTION_OPTION]
 
     def run(self, arguments, options):
-        tableView = tableViewInHierarchy()
+        tableView = tableViewInHierarchy(options.collection)
         if tableView:
             viewValue = fb.evaluateExpressionValue(tableView)
             print(viewValue.GetObjectDescription())
             cmd = 'echo %s | tr -d "\n" | pbcopy' % tableView
             os.system(cmd)
         else:
-            print("Sorry, chump. I couldn't find a table-view. :'(")
+            print(
+                "Sorry, chump. I couldn't find a {}. :'(".format(
+                    scrollListKind(options.collection)
+                )
+            )
 
 
 class FBPrintOnscreenTableViewCells(fb.FBCommand):
@@ -348,15 +449,26 @@ class FBPrintOnscreenTableViewCells(fb.FBCommand):
         return "pcells"
 
     def description(self):
-        return "Print the visible cells of the highest table view in the hierarchy."
+        return "Print the visible cells, with their index paths, of the table view (or collection view) with the largest visible area in the hierarchy."
+
+    def options(self):
+        return [COLLECTION_OPTION]
 
     def run(self, arguments, options):
-        tableView = tableViewInHierarchy()
-        print(
-            fb.evaluateExpressionValue(
-                "(id)[(id)" + tableView + " visibleCells]"
-            ).GetObjectDescription()
-        )
+        tableView = tableViewInHierarchy(options.collection)
+        if not tableView:
+            print(
+                "Sorry, chump. I couldn't find a {}. :'(".format(
+                    scrollListKind(options.collection)
+                )
+            )
+            return
+
+        cells = fb.evaluate(VISIBLE_CELLS_EXPRESSION % {"list": tableView}) or []
+        for _, section, row, description in sorted(
+            cells, key=lambda cell: (cell[1], cell[2])
+        ):
+            print("[{}, {}] {}".format(section, row, description))
 
 
 class FBPrintInternals(fb.FBCommand):
@@ -538,29 +650,121 @@ class FBPrintApplicationBundlePath(fb.FBCommand):
             os.system("open " + pathString)
 
 
+# The encodings pdata understands, as (Python codec, names). Names are matched
+# ignoring case, spaces, dashes and underscores; any other name is looked up
+# as a Python codec.
+DATA_ENCODINGS = [
+    ("ascii", ("ascii",)),
+    ("utf-8", ("utf8",)),
+    ("utf-16", ("utf16", "unicode")),
+    ("utf-16-le", ("utf16l", "utf16le")),
+    ("utf-16-be", ("utf16b", "utf16be")),
+    ("utf-32", ("utf32",)),
+    ("utf-32-le", ("utf32l", "utf32le")),
+    ("utf-32-be", ("utf32b", "utf32be")),
+    ("latin-1", ("latin1", "iso88591", "88591")),
+    ("iso8859-2", ("latin2", "iso88592", "88592")),
+    ("cp1250", ("cp1250", "1250")),
+    ("cp1251", ("cp1251", "1251")),
+    ("cp1252", ("cp1252", "1252")),
+    ("cp1253", ("cp1253", "1253")),
+    ("cp1254", ("cp1254", "1254")),
+]
+
+HEXDUMP_WIDTH = 16
+
+# Bytes per line of base64 output, 76 characters like MIME.
+BASE64_LINE_BYTES = 57
+
+
+def codecForEncoding(name):
+    normalized = re.sub(r"[\s_-]", "", name.lower())
+    for codec, names in DATA_ENCODINGS:
+        if normalized in names:
+            return codec
+    try:
+        info = codecs.lookup(name)
+    except LookupError:
+        return None
+    # Leave out bytes-to-bytes codecs such as hex, base64 and zlib.
+    return info.name if getattr(info, "_is_text_encoding", True) else None
+
+
+# Parses `offset:length` into the (start, end) of the range of a buffer of
+# `size` bytes, clamped to the buffer. Either side may be left out. Raises
+# ValueError for a negative offset or length.
+def parseDataRange(text, size):
+    offset, _, length = text.partition(":")
+    offset = int(offset, 0) if offset.strip() else 0
+    length = int(length, 0) if length.strip() else None
+    if offset < 0 or (length is not None and length < 0):
+        raise ValueError("Negative offset or length in {}".format(text))
+    start = min(offset, size)
+    end = min(start + length, size) if length is not None else size
+    return start, end
+
+
+def _regroup(chunks, size):
+    pending = b""
+    for chunk in chunks:
+        pending += bytes(chunk)
+        whole = len(pending) - len(pending) % size
+        if whole:
+            yield pending[:whole]
+            pending = pending[whole:]
+    if pending:
+        yield pending
+
+
+def textLines(chunks, codec):
+    decoder = codecs.getincrementaldecoder(codec)(errors="replace")
+    pending = ""
+    for chunk in chunks:
+        pending += decoder.decode(bytes(chunk))
+        lines = pending.split("\n")
+        pending = lines.pop()
+        for line in lines:
+            yield line
+    pending += decoder.decode(b"", final=True)
+    if pending:
+        yield pending
+
+
+# Yields lines like `hexdump -C`, numbering the bytes from `start`.
+def hexdumpLines(chunks, start=0):
+    offset = start
+    for block in _regroup(chunks, HEXDUMP_WIDTH):
+        for index in range(0, len(block), HEXDUMP_WIDTH):
+            row = block[index : index + HEXDUMP_WIDTH]
+            hexBytes = " ".join("{:02x}".format(byte) for byte in row[:8])
+            if len(row) > 8:
+                hexBytes += "  " + " ".join("{:02x}".format(byte) for byte in row[8:])
+            text = "".join(chr(byte) if 32 <= byte < 127 else "." for byte in row)
+            yield "{:08x}  {:<49} |{}|".format(offset, hexBytes, text)
+            offset += len(row)
+
+
+def base64Lines(chunks):
+    for block in _regroup(chunks, BASE64_LINE_BYTES):
+        for index in range(0, len(block), BASE64_LINE_BYTES):
+            line = block[index : index + BASE64_LINE_BYTES]
+            yield base64.b64encode(line).decode("ascii")
+
+
 class FBPrintData(fb.FBCommand):
     def name(self):
         return "pdata"
 
     def description(self):
         return (
-            "Print the contents of NSData object as string.\n"
-            "Supported encodings:\n"
-            "- ascii,\n"
-            "- utf8,\n"
-            "- utf16, unicode,\n"
-            "- utf16l (Little endian),\n"
-            "- utf16b (Big endian),\n"
-            "- utf32,\n"
-            "- utf32l (Little endian),\n"
-            "- utf32b (Big endian),\n"
-            "- latin1, iso88591 (88591),\n"
-            "- latin2, iso88592 (88592),\n"
-            "- cp1251 (1251),\n"
-            "- cp1252 (1252),\n"
-            "- cp1253 (1253),\n"
-            "- cp1254 (1254),\n"
-            "- cp1250 (1250),"
+            "Print the contents of NSData object as string, hexdump or base64. "
+            "The bytes are read directly and decoded by the debugger, so large "
+            "data prints in full without allocating in the process.\n"
+            "Supported encodings (or any Python codec name):\n"
+            + ",\n".join(
+                "- {} ({})".format(", ".join(names), codec)
+                for codec, names in DATA_ENCODINGS
+            )
         )
 
     def options(self):
@@ -572,7 +776,32 @@ class FBPrintData(fb.FBCommand):
                 type="string",
                 help="Used encoding (default utf-8).",
                 default="utf-8",
-            )
+            ),
+            fb.FBCommandArgument(
+                arg="hexdump",
+                short="-x",
+                long="--hexdump",
+                boolean=True,
+                default=False,
+                help="Print a hexdump of the bytes.",
+            ),
+            fb.FBCommandArgument(
+                arg="base64",
+                short="-b",
+                long="--base64",
+                boolean=True,
+                default=False,
+                help="Print the bytes encoded as base64.",
+            ),
+            fb.FBCommandArgument(
+                arg="range",
+                short="-r",
+                long="--range",
+                type="string",
+                help="Only print the bytes in offset:length (e.g. 0x100:64).",
+                default=None,
+            ),
+            output.outputOption(),
         ]
 
     def args(self):
@@ -580,56 +809,157 @@ class FBPrintData(fb.FBCommand):
             fb.FBCommandArgument(arg="data", type="NSData *", help="NSData object.")
         ]
 
-    def run(self, arguments, option):  # noqa C901
-        # Normalize encoding.
-        encoding_text = option.encoding.lower().replace(" -", "")
-        enc = 4  # Default encoding UTF-8.
-        if encoding_text == "ascii":
-            enc = 1
-        elif encoding_text == "utf8":
-            enc = 4
-        elif (
-            encoding_text == "latin1"
-            or encoding_text == "88591"
-            or encoding_text == "iso88591"
-        ):
-            enc = 5
-        elif (
-            encoding_text == "latin2"
-            or encoding_text == "88592"
-            or encoding_text == "iso88592"
-        ):
-            enc = 9
-        elif encoding_text == "unicode" or encoding_text == "utf16":
-            enc = 10
-        elif encoding_text == "1251" or encoding_text == "cp1251":
-            enc = 11
-        elif encoding_text == "1252" or encoding_text == "cp1252":
-            enc = 12
-        elif encoding_text == "1253" or encoding_text == "cp1253":
-            enc = 13
-        elif encoding_text == "1254" or encoding_text == "cp1254":
-            enc = 14
-        elif encoding_text == "1250" or encoding_text == "cp1250":
-            enc = 15
-        elif encoding_text == "utf16b":
-            enc = 0x90000100
-        elif encoding_text == "utf16l":
-            enc = 0x94000100
-        elif encoding_text == "utf32":
-            enc = 0x8C000100
-        elif encoding_text == "utf32b":
-            enc = 0x98000100
-        elif encoding_text == "utf32l":
-            enc = 0x9C000100
+    def run(self, arguments, option):
+        codec = codecForEncoding(option.encoding)
+        if codec is None:
+            self.result.SetError("Unknown encoding {}".format(option.encoding))
+            return
 
-        print(
-            fb.describeObject(
-                "[[NSString alloc] initWithData:{} encoding:{}]".format(
-                    arguments[0], enc
-                )
+        data = fb.evaluateInputExpression(arguments[0])
+        address, length = memory.bytesAndLengthOfData(data)
+        if not address or not length:
+            print("{} is nil or empty".format(arguments[0]), file=self.result)
+            return
+        start, end = 0, length
+        if option.range:
+            try:
+                start, end = parseDataRange(option.range, length)
+            except ValueError:
+                self.result.SetError("Invalid range {}".format(option.range))
+                return
+
+        chunks = (chunk for _, chunk in memory.readMemoryChunks(address, end, start))
+        if option.hexdump:
+            lines = hexdumpLines(chunks, start)
+        elif option.base64:
+            lines = base64Lines(chunks)
+        else:
+            lines = textLines(chunks, codec)
+
+        try:
+            output.writeLines(lines, self.result, option.out)
+        except memory.FBMemoryReadError as error:
+            self.result.SetError("Can't read {}: {}".format(arguments[0], error))
+
+
+# Returns the targets of each control in `controls` with the actions they're
+# sent, and the control events (as a bit mask) each action is sent for.
+CONTROL_ACTIONS = fb.FBExpressionTemplate(
+    "controlActions",
+    "char *",
+    [("NSArray *", "controls")],
+    """
+    NSMutableArray *results = [NSMutableArray array];
+    for (id control in controls) {
+        NSMutableArray *targets = [NSMutableArray array];
+        for (id target in [control allTargets]) {
+            id receiver = target == [NSNull null] ? nil : target;
+            NSMutableDictionary *events = [NSMutableDictionary dictionary];
+            NSMutableArray *actions = [NSMutableArray array];
+            for (NSString *action in [control actionsForTarget:receiver forControlEvent:0]) {
+                [actions addObject:action];
+                events[action] = @0;
+            }
+            for (NSUInteger bit = 0; bit < 32; bit++) {
+                unsigned long long event = 1ULL << bit;
+                for (NSString *action in [control actionsForTarget:receiver forControlEvent:event]) {
+                    events[action] = @([events[action] unsignedLongLongValue] | event);
+                }
+            }
+            NSMutableArray *wiring = [NSMutableArray array];
+            for (NSString *action in actions) {
+                [wiring addObject:@[action, events[action]]];
+            }
+            [targets addObject:@{
+                @"address": [NSString stringWithFormat:@"0x%lx", (unsigned long)receiver],
+                @"description": receiver ? [receiver debugDescription] : @"(first responder)",
+                @"actions": wiring
+            }];
+        }
+        [results addObject:@{
+            @"address": [NSString stringWithFormat:@"0x%lx", (unsigned long)control],
+            @"class": NSStringFromClass((Class)[control class]),
+            @"targets": targets
+        }];
+    }
+    return RETURN(results);
+    """,
+)
+
+CONTROL_EVENTS = [
+    (0, "TouchDown"),
+    (1, "TouchDownRepeat"),
+    (2, "TouchDragInside"),
+    (3, "TouchDragOutside"),
+    (4, "TouchDragEnter"),
+    (5, "TouchDragExit"),
+    (6, "TouchUpInside"),
+    (7, "TouchUpOutside"),
+    (8, "TouchCancel"),
+    (12, "ValueChanged"),
+    (13, "PrimaryActionTriggered"),
+    (14, "MenuActionTriggered"),
+    (16, "EditingDidBegin"),
+    (17, "EditingChanged"),
+    (18, "EditingDidEnd"),
+    (19, "EditingDidEndOnExit"),
+]
+
+
+def controlEventNames(mask):
+    names = []
+    for bit, name in CONTROL_EVENTS:
+        if mask & (1 << bit):
+            names.append(name)
+            mask &= ~(1 << bit)
+    if mask:
+        names.append("0x{:x}".format(mask))
+    return names
+
+
+def controlActions(controls):
+    """
+    Returns a dict for each control expression with its address, class and
+    targets, each target listing its actions as (selector, [event names]).
+    """
+    array = "@[{}]".format(", ".join("(id)({})".format(c) for c in controls))
+    results = CONTROL_ACTIONS.evaluateJSON(array) or []
+    for control in results:
+        for target in control["targets"]:
+            target["actions"] = [
+                (action, controlEventNames(mask)) for action, mask in target["actions"]
+            ]
+    return results
+
+
+def controlsInKeyWindow():
+    tree = viewHelpers.snapshotViewHierarchy(
+        "(id)[[UIApplication sharedApplication] keyWindow]",
+        properties={
+            "isControl": "[NSNumber numberWithBool:(BOOL)[__view "
+            "isKindOfClass:(Class)[UIControl class]]]"
+        },
+    )
+    if tree is None:
+        return []
+    return [node.address for node in tree if node.properties.get("isControl")]
+
+
+# Yields a line per target of each control, listing its actions and their
+# events. With `headers`, each control with targets gets a line of its own and
+# its targets are indented under it.
+def targetActionLines(controls, headers=False):
+    for control in controls:
+        if headers and control["targets"]:
+            yield "<{}: {}>".format(control["class"], control["address"])
+        for target in control["targets"]:
+            actions = ", ".join(
+                "{} ({})".format(action, ", ".join(events)) if events else action
+                for action, events in target["actions"]
+            )
+            yield "{}{}: {}".format(
+                "  " if headers else "", target["description"], actions
             )
-        )
 
 
 class FBPrintTargetActions(fb.FBCommand):
@@ -637,7 +967,24 @@ class FBPrintTargetActions(fb.FBCommand):
         return "pactions"
 
     def description(self):
-        return "Print the actions and targets of a control."
+        return (
+            "Print the actions and targets of a control, with the control events "
+            "each action is sent for. With --all, print them for every control "
+            "in the key window."
+        )
+
+    def options(self):
+        return [
+            fb.FBCommandArgument(
+                short="-a",
+                long="--all",
+                arg="all",
+                boolean=True,
+                default=False,
+                help="Print the actions of every control in the key window.",
+            ),
+            output.outputOption(),
+        ]
 
     def args(self):
         return [
@@ -645,40 +992,78 @@ class FBPrintTargetActions(fb.FBCommand):
                 arg="control",
                 type="UIControl *",
                 help="The control to inspect the actions of.",
+                default="__keyWindow_dynamic__",
             )
         ]
 
     def run(self, arguments, options):
-        control = fb.evaluateInputExpression(arguments[0])
-        targets = fb.evaluateObjectExpression(
-            "[[{control} allTargets] allObjects]".format(control=control)
-        )
-        targetCount = fb.evaluateIntegerExpression(
-            "[{targets} count]".format(targets=targets)
+        if options.all:
+            controls = controlActions(controlsInKeyWindow())
+        elif arguments[0] == "__keyWindow_dynamic__":
+            print("Whoops! You are missing the <control> argument.")
+            return
+        else:
+            controls = controlActions([fb.evaluateInputExpression(arguments[0])])
+
+        output.writeLines(
+            targetActionLines(controls, headers=options.all),
+            self.result,
+            options.out,
         )
 
-        for index in range(0, targetCount):
-            target = fb.evaluateObjectExpression(
-                "[{targets} objectAtIndex:{index}]".format(targets=targets, index=index)
-            )
-            actions = fb.evaluateObjectExpression(
-                "[{control} actionsForTarget:{target} forControlEvent:0]".format(
-                    control=control, target=target
-                )
-            )
 
-            targetDescription = fb.evaluateExpressionValue(
-                "(id){target}".format(target=target)
-            ).GetObjectDescription()
-            actionsDescription = fb.evaluateExpressionValue(
-                '(id)[{actions} componentsJoinedByString:@", "]'.format(actions=actions)
-            ).GetObjectDescription()
+def jsonOptions():
+    return [
+        fb.FBCommandArgument(
+            arg="plain",
+            short="-p",
+            long="--plain",
+            boolean=True,
+            default=False,
+            help="Plain JSON",
+        ),
+        fb.FBCommandArgument(
+            arg="path",
+            long="--path",
+            type="string",
+            default=None,
+            help="Print only the value at this path, e.g. feed.items[3].",
+        ),
+        fb.FBCommandArgument(
+            arg="maxDepth",
+            short="-d",
+            long="--max-depth",
+            type="int",
+            default=None,
+            help="Replace collections nested deeper than this by their size.",
+        ),
+        fb.FBCommandArgument(
+            arg="maxItems",
+            short="-n",
+            long="--max-items",
+            type="int",
+            default=None,
+            help="Print at most this many items of each collection.",
+        ),
+        output.outputOption(),
+    ]
 
-            print(
-                "{target}: {actions}".format(
-                    target=targetDescription, actions=actionsDescription
-                )
-            )
+
+# Serializes the object in the process, pruned by the options, and prints it
+# from the serialized bytes.
+def printJSON(command, object, options):
+    try:
+        value = jsonHelpers.readJSON(
+            object,
+            options.path,
+            int(options.maxDepth) if options.maxDepth is not None else None,
+            int(options.maxItems) if options.maxItems is not None else None,
+        )
+    except (jsonHelpers.JSONPathError, memory.FBMemoryReadError) as error:
+        print(error, file=command.result)
+        return False
+    lines = jsonHelpers.jsonLines(value, pretty=not options.plain)
+    output.writeLines(lines, command.result, options.out)
 
 
 class FBPrintJSON(fb.FBCommand):
@@ -686,19 +1071,15 @@ class FBPrintJSON(fb.FBCommand):
         return "pjson"
 
     def description(self):
-        return "Print JSON representation of NSDictionary or NSArray object"
+        return (
+            "Print JSON representation of NSDictionary or NSArray object. The "
+            "JSON is serialized in the process and read back in bulk, so large "
+            "objects print in full; use --path, --max-depth and --max-items to "
+            "print part of it, and --out to write it to a file."
+        )
 
     def options(self):
-        return [
-            fb.FBCommandArgument(
-                arg="plain",
-                short="-p",
-                long="--plain",
-                boolean=True,
-                default=False,
-                help="Plain JSON",
-            )
-        ]
+        return jsonOptions()
 
     def args(self):
         return [
@@ -711,19 +1092,7 @@ class FBPrintJSON(fb.FBCommand):
 
     def run(self, arguments, options):
         objectToPrint = fb.evaluateInputExpression(arguments[0])
-        pretty = 1 if options.plain is None else 0
-        jsonData = fb.evaluateObjectExpression(
-            "[NSJSONSerialization dataWithJSONObject:(id){} options:{} error:nil]".format(
-                objectToPrint, pretty
-            )
-        )
-        jsonString = fb.evaluateExpressionValue(
-            "(NSString*)[[NSString alloc] initWithData:(id){} encoding:4]".format(
-                jsonData
-            )
-        ).GetObjectDescription()
-
-        print(jsonString)
+        return printJSON(self, objectToPrint, options)
 
 
 class FBPrintSwiftJSON(fb.FBCommand):
@@ -731,19 +1100,13 @@ class FBPrintSwiftJSON(fb.FBCommand):
         return "psjson"
 
     def description(self):
-        return "Print JSON representation of Swift Dictionary or Swift Array object"
+        return (
+            "Print JSON representation of Swift Dictionary or Swift Array "
+            "object. Takes the same options as pjson."
+        )
 
     def options(self):
-        return [
-            fb.FBCommandArgument(
-                arg="plain",
-                short="-p",
-                long="--plain",
-                boolean=True,
-                default=False,
-                help="Plain JSON",
-            )
-        ]
+        return jsonOptions()
 
     def args(self):
         return [
@@ -759,19 +1122,81 @@ class FBPrintSwiftJSON(fb.FBCommand):
         objectToPrint = fb.evaluateInputExpression(
             "{obj} as NSObject".format(obj=arguments[0])
         )
-        pretty = 1 if options.plain is None else 0
-        jsonData = fb.evaluateObjectExpression(
-            "[NSJSONSerialization dataWithJSONObject:(NSObject*){} options:{} error:nil]".format(
-                objectToPrint, pretty
-            )
-        )
-        jsonString = fb.evaluateExpressionValue(
-            "(NSString*)[[NSString alloc] initWithData:(NSObject*){} encoding:4]".format(
-                jsonData
-            )
-        ).GetObjectDescription()
-
-        print(jsonString)
+        return printJSON(self, objectToPrint, options)
+
+
+# Serializes the requests in `objects` in one call. Session tasks are replaced
+# by their current (or original) request, and anything else that isn't an
+# NSURLRequest is skipped. The body is returned as the address and length of
+# its bytes, to be read with the bulk memory reader.
+CURL_REQUESTS = fb.FBExpressionTemplate(
+    "curlRequests",
+    "char *",
+    [("NSArray *", "objects")],
+    """
+    Class taskClass = NSClassFromString(@"NSURLSessionTask");
+    NSMutableArray *requests = [NSMutableArray array];
+    for (id object in objects) {
+        id request = object;
+        if (taskClass && (BOOL)[object isKindOfClass:taskClass]) {
+            request = [object currentRequest] ?: [object originalRequest];
+        }
+        if (!(BOOL)[request isKindOfClass:[NSURLRequest class]]) {
+            continue;
+        }
+        NSData *body = [request HTTPBody];
+        NSMutableDictionary *entry = [NSMutableDictionary dictionary];
+        entry[@"address"] = [NSString stringWithFormat:@"0x%lx", (unsigned long)request];
+        entry[@"method"] = [request HTTPMethod] ?: @"GET";
+        entry[@"URL"] = [[request URL] absoluteString] ?: @"";
+        entry[@"timeout"] = @((double)[request timeoutInterval]);
+        entry[@"headers"] = [request allHTTPHeaderFields] ?: @{};
+        entry[@"body"] = [NSString stringWithFormat:@"0x%lx", (unsigned long)[body bytes]];
+        entry[@"bodyLength"] = @((unsigned long long)[body length]);
+        entry[@"bodyStream"] = @((BOOL)([request HTTPBodyStream] != nil));
+        [requests addObject:entry];
+    }
+    return RETURN(requests);
+    """,
+)
+
+# Collects the tasks of an NSURLSession. The tasks are handed to a completion
+# handler on the session's delegate queue, so the other threads must be allowed
+# to run while this is evaluated.
+SESSION_TASKS_EXPRESSION = """
+id __session = (id)(%(session)s);
+__block NSArray *__tasks = nil;
+dispatch_semaphore_t __semaphore = (dispatch_semaphore_t)dispatch_semaphore_create(0);
+[__session getAllTasksWithCompletionHandler:^(NSArray *tasks) {
+    __tasks = [tasks copy];
+    dispatch_semaphore_signal(__semaphore);
+}];
+dispatch_semaphore_wait(__semaphore, dispatch_time(DISPATCH_TIME_NOW, (int64_t)(%(timeout)d * NSEC_PER_SEC)));
+(NSArray *)(__tasks ?: @[]);
+"""
+
+SESSION_TASKS_TIMEOUT = 2
+
+ADDRESS_PATTERN = re.compile(r"^(0x[0-9a-fA-F]+|\$\w+)$")
+
+
+def sessionTasks(session):
+    tasks = fb.evaluateExpressionValue(
+        SESSION_TASKS_EXPRESSION
+        % {"session": session, "timeout": SESSION_TASKS_TIMEOUT},
+        tryAllThreads=True,
+    )
+    return tasks.GetValue() if fb.isSuccess(tasks.GetError()) else None
+
+
+def serializeRequests(objects):
+    """
+    Returns a dict for each NSURLRequest (or session task) among the object
+    expressions, with the method, URL, timeout, headers and the address and
+    length of the body.
+    """
+    array = "@[{}]".format(", ".join("(id)({})".format(o) for o in objects))
+    return CURL_REQUESTS.evaluateJSON(array) or []
 
 
 class FBPrintAsCurl(fb.FBCommand):
@@ -779,7 +1204,12 @@ class FBPrintAsCurl(fb.FBCommand):
         return "pcurl"
 
     def description(self):
-        return "Print the NSURLRequest (HTTP) as curl command."
+        return (
+            "Print the NSURLRequest (HTTP) as curl command.\n\n"
+            "Several requests (or session tasks) can be given as addresses "
+            "separated by spaces, and with --session the argument is an "
+            "NSURLSession whose tasks are all printed, one curl line each."
+        )
 
     def options(self):
         return [
@@ -790,7 +1220,15 @@ class FBPrintAsCurl(fb.FBCommand):
                 boolean=True,
                 default=False,
                 help="Embed request data as base64.",
-            )
+            ),
+            fb.FBCommandArgument(
+                short="-s",
+                long="--session",
+                arg="session",
+                boolean=True,
+                default=False,
+                help="Print the requests of every task of an NSURLSession.",
+            ),
         ]
 
     def args(self):
@@ -810,82 +1248,71 @@ class FBPrintAsCurl(fb.FBCommand):
         )
 
     def run(self, arguments, options):
-        request = fb.evaluateInputExpression(arguments[0])
-        HTTPHeaderSring = ""
-        HTTPMethod = fb.evaluateExpressionValue(
-            "(id)[{} HTTPMethod]".format(request)
-        ).GetObjectDescription()
-        URL = fb.evaluateExpressionValue(
-            "(id)[{} URL]".format(request)
-        ).GetObjectDescription()
-        timeout = fb.evaluateExpression(
-            "(NSTimeInterval)[{} timeoutInterval]".format(request)
-        )
-        HTTPHeaders = fb.evaluateObjectExpression(
-            "(id)[{} allHTTPHeaderFields]".format(request)
-        )
-        HTTPHeadersCount = fb.evaluateIntegerExpression(
-            "[{} count]".format(HTTPHeaders)
-        )
-        allHTTPKeys = fb.evaluateObjectExpression("[{} allKeys]".format(HTTPHeaders))
-        for index in range(0, HTTPHeadersCount):
-            key = fb.evaluateObjectExpression(
-                "[{} objectAtIndex:{}]".format(allHTTPKeys, index)
+        if options.session:
+            tasks = sessionTasks(fb.evaluateInputExpression(arguments[0]))
+            if tasks is None:
+                print("Can't get the tasks of session {}".format(arguments[0]))
+                return False
+            requests = CURL_REQUESTS.evaluateJSON(tasks) or []
+        else:
+            expressions = arguments[0].split()
+            if not all(ADDRESS_PATTERN.match(e) for e in expressions):
+                expressions = [arguments[0]]
+            requests = serializeRequests(
+                [fb.evaluateInputExpression(e) for e in expressions]
             )
-            keyDescription = fb.evaluateExpressionValue(
-                "(id){}".format(key)
-            ).GetObjectDescription()
-            value = fb.evaluateExpressionValue(
-                "(id)[(id){} objectForKey:{}]".format(HTTPHeaders, key)
-            ).GetObjectDescription()
-            if len(HTTPHeaderSring) > 0:
-                HTTPHeaderSring += " "
-            HTTPHeaderSring += '-H "{}: {}"'.format(keyDescription, value)
-        HTTPData = fb.evaluateObjectExpression("[{} HTTPBody]".format(request))
+
+        if not requests:
+            print("No NSURLRequest found in {}".format(arguments[0]))
+            return False
+
+        for request in requests:
+            commandString = self.curlCommand(request, options.embed)
+            if commandString is None:
+                return False
+            print(commandString)
+
+    def curlCommand(self, request, embed):
         dataFile = None
-        dataAsString = None
-        if fb.evaluateIntegerExpression("[{} length]".format(HTTPData)) > 0:
-            if options.embed:
-                if fb.evaluateIntegerExpression(
-                    "[{} respondsToSelector:@selector(base64EncodedStringWithOptions:)]".format(
-                        HTTPData
+        commandString = ""
+        bodyAddress = int(request["body"], 16)
+        bodyLength = request["bodyLength"]
+        if bodyLength > 0:
+            label = "HTTPBody {}".format(request["address"])
+            try:
+                if embed:
+                    data = memory.readMemory(bodyAddress, bodyLength, label=label)
+                    dataFile = self.generateTmpFilePath()
+                    commandString += 'echo "{}" | base64 -D -o "{}" && '.format(
+                        base64.b64encode(bytes(data)).decode("ascii"), dataFile
                     )
-                ):
-                    dataAsString = fb.evaluateExpressionValue(
-                        "(id)[(id){} base64EncodedStringWithOptions:0]".format(HTTPData)
-                    ).GetObjectDescription()
                 else:
-                    print("This version of OS doesn't supports base64 data encoding")
-                    return False
-            elif not runtimeHelpers.isIOSDevice():
-                dataFile = self.generateTmpFilePath()
-                if not fb.evaluateBooleanExpression(
-                    '(BOOL)[{} writeToFile:@"{}" atomically:NO]'.format(
-                        HTTPData, dataFile
+                    # The body is read out of the process, so this works the
+                    # same on devices as in the simulator.
+                    dataFile = self.generateTmpFilePath()
+                    memory.copyMemoryToFile(
+                        bodyAddress, bodyLength, dataFile, label=label
                     )
-                ):
-                    print("Can't write data to file {}".format(dataFile))
-                    return False
-            else:
-                print(
-                    'HTTPBody data for iOS Device is supported only with "--embed-data" flag'
+            except memory.FBMemoryReadError as error:
+                print("Can't read the body of {}: {}".format(request["address"], error))
+                return None
+        elif request["bodyStream"]:
+            print(
+                "# The body of {} is a stream and isn't included.".format(
+                    request["address"]
                 )
-                return False
-
-        commandString = ""
-        if dataAsString is not None and len(dataAsString) > 0:
-            dataFile = self.generateTmpFilePath()
-            commandString += 'echo "{}" | base64 -D -o "{}" && '.format(
-                dataAsString, dataFile
             )
-        commandString += "curl -X {} --connect-timeout {}".format(HTTPMethod, timeout)
-        if len(HTTPHeaderSring) > 0:
-            commandString += " " + HTTPHeaderSring
+
+        commandString += "curl -X {} --connect-timeout {:g}".format(
+            request["method"], request["timeout"]
+        )
+        for key, value in sorted(request["headers"].items()):
+            commandString += ' -H "{}: {}"'.format(key, value)
         if dataFile is not None:
             commandString += ' --data-binary @"{}"'.format(dataFile)
 
-        commandString += ' "{}"'.format(URL)
-        print(commandString)
+        commandString += ' "{}"'.format(request["URL"])
+        return commandString
 
 
 class FBPrintToClipboard(fb.FBCommand):
@@ -7,6 +7,7 @@
 
 import fbchisellldbbase as fb
 import fbchisellldbviewhelpers as viewHelpers
+import fbchisellldbviewqueryhelpers as queryHelpers
 
 
 ACCESSIBILITY_ID = 0
@@ -43,14 +44,9 @@ class FBInputTexByAccessibilityIdCommand(fb.FBCommand):
         )
 
     def findView(self, view, searchIdentifier, replacementText):
-        views = subviewsOfView(view)
-        for index in range(0, viewsCount(views)):
-            subview = subviewAtIndex(views, index)
-            self.findView(subview, searchIdentifier, replacementText)
-        else:
-            identifier = accessibilityIdentifier(view)
-            if isEqualToString(identifier, searchIdentifier):
-                setTextInView(view, replacementText)
+        clause = queryHelpers.ViewQueryClause("identifier", "==", searchIdentifier)
+        for node in queryHelpers.findViews([clause], roots=[view]):
+            setTextInView(node.address, replacementText)
 
 
 class FBInputTexToFirstResponderCommand(fb.FBCommand):
@@ -71,13 +67,15 @@ class FBInputTexToFirstResponderCommand(fb.FBCommand):
         self.findFirstResponder(rootView(), arguments[INPUT_TEXT])
 
     def findFirstResponder(self, view, replacementText):
-        views = subviewsOfView(view)
-        if isFirstResponder(view):
-            setTextInView(view, replacementText)
-        else:
-            for index in range(0, viewsCount(views)):
-                subview = subviewAtIndex(views, index)
-                self.findFirstResponder(subview, replacementText)
+        tree = viewHelpers.snapshotViewHierarchy(
+            view,
+            properties={
+                "firstResponder": "[NSNumber numberWithBool:(BOOL)[__view isFirstResponder]]"
+            },
+        )
+        for node in tree or []:
+            if node.properties["firstResponder"]:
+                setTextInView(node.address, replacementText)
 
 
 # Some helpers
@@ -85,32 +83,6 @@ def rootView():
     return fb.evaluateObjectExpression("[[UIApplication sharedApplication] keyWindow]")
 
 
-def subviewsOfView(view):
-    return fb.evaluateObjectExpression("[%s subviews]" % view)
-
-
-def subviewAtIndex(views, index):
-    return fb.evaluateObjectExpression("[%s objectAtIndex:%i]" % (views, index))
-
-
-def viewsCount(views):
-    return int(fb.evaluateExpression("(int)[%s count]" % views))
-
-
-def accessibilityIdentifier(view):
-    return fb.evaluateObjectExpression("[%s accessibilityIdentifier]" % view)
-
-
-def isEqualToString(identifier, needle):
-    return fb.evaluateBooleanExpression(
-        '[%s isEqualToString:@"%s"]' % (identifier, needle)
-    )
-
-
 def setTextInView(view, text):
     fb.evaluateObjectExpression('[%s setText:@"%s"]' % (view, text))
     viewHelpers.flushCoreAnimationTransaction()
-
-
-def isFirstResponder(view):
-    return fb.evaluateBooleanExpression("[%s isFirstResponder]" % view)
@@ -10,8 +10,8 @@ import os
 import time
 
 import fbchisellldbbase as fb
+import fbchisellldbmemoryhelpers as memory
 import fbchisellldbobjecthelpers as objectHelpers
-import lldb
 
 
 def lldbcommands():
@@ -34,30 +34,16 @@ def _showImage(commandForImage):
 
     toPNG = "(id)UIImagePNGRepresentation((id){})".format(commandForImage)
     imageDataAddress = fb.evaluateExpressionValue(toPNG, tryAllThreads=True).GetValue()
-    imageBytesStartAddress = fb.evaluateExpression(
-        "(void *)[(id)" + imageDataAddress + " bytes]"
-    )
-    imageBytesLength = fb.evaluateExpression(
-        "(NSUInteger)[(id)" + imageDataAddress + " length]"
-    )
-
-    address = int(imageBytesStartAddress, 16)
-    length = int(imageBytesLength)
 
-    if not (address or length):
-        print("Could not get image data.")
+    try:
+        if not memory.copyDataToFile(imageDataAddress, imagePath, label="Image"):
+            print("Could not get image data.")
+            return
+    except memory.FBMemoryReadError as error:
+        print(error)
         return
 
-    process = lldb.debugger.GetSelectedTarget().GetProcess()
-    error = lldb.SBError()
-    mem = process.ReadMemory(address, length, error)
-
-    if error is not None and str(error) != "success":
-        print(error)
-    else:
-        with open(imagePath, "wb") as imgFile:
-            imgFile.write(mem)
-        os.system("open " + imagePath)
+    os.system("open " + imagePath)
 
 
 def _colorIsCGColorRef(color):
@@ -190,32 +176,50 @@ def _dataIsString(data):
 def _visualize(target):
     target = fb.evaluateInputExpression(target)
 
-    if fb.evaluateBooleanExpression(
-        "(unsigned long)CFGetTypeID((CFTypeRef)"
-        + target
-        + ") == (unsigned long)CGImageGetTypeID()"
-    ):
+    # Resolve every type check in a single round trip.
+    with fb.batch() as batch:
+        isCGImage = batch.add(
+            "(unsigned long)CFGetTypeID((CFTypeRef)"
+            + target
+            + ") == (unsigned long)CGImageGetTypeID()",
+            "boolean",
+        )
+        isPixelBuffer = batch.add(
+            "(unsigned long)CFGetTypeID((CFTypeRef)"
+            + target
+            + ") == (unsigned long)CVPixelBufferGetTypeID()",
+            "boolean",
+        )
+        kinds = {
+            className: objectHelpers.isKindOfClass(target, className, batch=batch)
+            for className in [
+                "UIImage",
+                "UIView",
+                "CALayer",
+                "UIColor",
+                "CIColor",
+                "NSData",
+                "CIImage",
+            ]
+        }
+
+    def isKind(className):
+        return kinds[className].result()
+
+    if isCGImage.result():
         _showImage("(id)[UIImage imageWithCGImage:" + target + "]")
-    elif fb.evaluateBooleanExpression(
-        "(unsigned long)CFGetTypeID((CFTypeRef)"
-        + target
-        + ") == (unsigned long)CVPixelBufferGetTypeID()"
-    ):
+    elif isPixelBuffer.result():
         _showPixelBuffer(target)
     else:
-        if objectHelpers.isKindOfClass(target, "UIImage"):
+        if isKind("UIImage"):
             _showImage(target)
-        elif objectHelpers.isKindOfClass(target, "UIView"):
+        elif isKind("UIView"):
             _showLayer("[(id)" + target + " layer]")
-        elif objectHelpers.isKindOfClass(target, "CALayer"):
+        elif isKind("CALayer"):
             _showLayer(target)
-        elif (
-            objectHelpers.isKindOfClass(target, "UIColor")
-            or objectHelpers.isKindOfClass(target, "CIColor")
-            or _colorIsCGColorRef(target)
-        ):
+        elif isKind("UIColor") or isKind("CIColor") or _colorIsCGColorRef(target):
             _showColor(target)
-        elif objectHelpers.isKindOfClass(target, "NSData"):
+        elif isKind("NSData"):
             if _dataIsImage(target):
                 _showImage("(id)[UIImage imageWithData:" + target + "]")
             elif _dataIsString(target):
@@ -226,7 +230,7 @@ def _visualize(target):
                 )
             else:
                 print("Data isn't an image and isn't a string.")
-        elif objectHelpers.isKindOfClass(target, "CIImage"):
+        elif isKind("CIImage"):
             _showImage("[UIImage imageWithCIImage:(id)" + target + "]")
         else:
             print(
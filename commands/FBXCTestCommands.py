@@ -8,6 +8,8 @@
 import re
 
 import fbchisellldbbase as fb
+import fbchisellldbcache as cache
+import fbchisellldboutputhelpers as output
 import lldb
 
 
@@ -110,10 +112,22 @@ class FBXCPrintTree(fb.FBCommand):
                 default=False,
                 help="Print frames",
             ),
+            fb.FBCommandArgument(
+                arg="diff",
+                short="-d",
+                long="--diff",
+                type="BOOL",
+                boolean=True,
+                default=False,
+                help="Print only elements added, removed or changed since the last "
+                "xtree of the same element",
+            ),
+            output.outputOption(),
         ]
 
     def run(self, arguments, options):
         element = arguments[0]
+        tree_key = element
         language = fb.currentLanguage()
         if element == "__default__":
             element = (
@@ -131,16 +145,36 @@ class FBXCPrintTree(fb.FBCommand):
         # Get pointer value, so it will be working in Swift and Objective-C
         element_pointer = int(element_sbvalue.GetValue(), 16)
 
-        # Get XCElementSnapshot object
-        snapshot = take_snapshot(element_pointer)
+        # Load XCElementSnapshot tree
+        snapshot_object = load_snapshot_tree(element_pointer, language)
 
-        # Print tree for snapshot element
-        snapshot_object = XCElementSnapshot(snapshot, language=language)
-        print(
-            snapshot_object.tree().hierarchy_text(
-                pointer=options.pointer, trait=options.trait, frame=options.frame
+        previous = _previous_trees.peek(tree_key)
+        if isinstance(snapshot_object, XCElementSnapshotNode):
+            _previous_trees.put(tree_key, snapshot_object)
+
+        if options.diff and previous is None:
+            print(
+                "No previous tree of {} to diff against, printing the full "
+                "tree.".format(element),
+                file=self.result,
             )
+        elif options.diff:
+            # Print changes since the previous tree
+            lines = diff_lines(
+                previous,
+                snapshot_object,
+                pointer=options.pointer,
+                trait=options.trait,
+                frame=options.frame,
+            )
+            output.writeLines(lines, self.result, options.out)
+            return
+
+        # Print tree for snapshot element
+        lines = snapshot_object.tree().hierarchy_lines(
+            pointer=options.pointer, trait=options.trait, frame=options.frame
         )
+        output.writeLines(lines, self.result, options.out)
 
 
 class FBXCPrintObject(fb.FBCommand):
@@ -179,11 +213,12 @@ class FBXCPrintObject(fb.FBCommand):
         # Get pointer value, so it will be working in Swift and Objective-C
         element_pointer = int(element_sbvalue.GetValue(), 16)
 
-        # Get XCElementSnapshot object
-        snapshot = take_snapshot(element_pointer)
+        # Load XCElementSnapshot object
+        snapshot_object = load_snapshot_tree(
+            element_pointer, language, recursive=False, details=True
+        )
 
         # Print details of snapshot element
-        snapshot_object = XCElementSnapshot(snapshot, language=language)
         print(snapshot_object.detail_summary())
 
 
@@ -242,6 +277,7 @@ class FBXCNoId(fb.FBCommand):
                 default=False,
                 help="Print frames",
             ),
+            output.outputOption(),
         ]
 
     def run(self, arguments, options):
@@ -263,20 +299,18 @@ class FBXCNoId(fb.FBCommand):
         # Get pointer value, so it will be working in Swift and Objective-C
         element_pointer = int(element_sbvalue.GetValue(), 16)
 
-        # Get XCElementSnapshot object
-        snapshot = take_snapshot(element_pointer)
+        # Load XCElementSnapshot tree
+        snapshot_object = load_snapshot_tree(element_pointer, language)
 
         # Print tree for snapshot element
-        snapshot_object = XCElementSnapshot(snapshot, language=language)
         elements = snapshot_object.find_missing_identifiers(
             status_bar=options.status_bar
         )
         if elements is not None:
-            print(
-                elements.hierarchy_text(
-                    pointer=options.pointer, trait=options.trait, frame=options.frame
-                )
+            lines = elements.hierarchy_lines(
+                pointer=options.pointer, trait=options.trait, frame=options.frame
             )
+            output.writeLines(lines, self.result, options.out)
         else:
             print("Couldn't found elements without identifier")
 
@@ -296,6 +330,259 @@ def take_snapshot(element):
     )
 
 
+# Walks the snapshot subtree of an XCUIElement and returns the values of every
+# element as a flat list in depth first order. Each element refers to its
+# parent by index.
+SNAPSHOT_TREE = fb.FBExpressionTemplate(
+    "xcElementSnapshotTree",
+    "char *",
+    [("id", "element"), ("BOOL", "recursive"), ("BOOL", "details")],
+    """
+    NSMutableArray *nodes = [NSMutableArray array];
+    id snapshot = (id)[(NSArray *)[(id)[element query] matchingSnapshotsWithError:nil] firstObject];
+    if (snapshot == nil) {
+        return RETURN(nodes);
+    }
+    NSString *(^text)(id) = ^NSString *(id object) {
+        if (object == nil) {
+            return @"";
+        }
+        if ((BOOL)[object isKindOfClass:[NSString class]]) {
+            return (NSString *)object;
+        }
+        return (NSString *)[object description];
+    };
+    NSArray *(^rect)(CGRect) = ^NSArray *(CGRect r) {
+        return @[@(r.origin.x), @(r.origin.y), @(r.size.width), @(r.size.height)];
+    };
+    NSMutableArray *pending = [NSMutableArray arrayWithObject:snapshot];
+    NSMutableArray *parents = [NSMutableArray arrayWithObject:@(-1)];
+    while ([pending count] > 0) {
+        id s = [pending lastObject];
+        NSNumber *parent = [parents lastObject];
+        [pending removeLastObject];
+        [parents removeLastObject];
+
+        NSMutableDictionary *node = [NSMutableDictionary dictionary];
+        node[@"parent"] = parent;
+        node[@"pointer"] = [NSString stringWithFormat:@"0x%016lx", (unsigned long)s];
+        node[@"type"] = @((NSInteger)[s elementType]);
+        node[@"traits"] = @((unsigned long long)[s traits]);
+        node[@"frame"] = rect((CGRect)[s frame]);
+        node[@"identifier"] = text((id)[s identifier]);
+        node[@"value"] = text((id)[s value]);
+        node[@"placeholderValue"] = text((id)[s placeholderValue]);
+        node[@"label"] = text((id)[s label]);
+        node[@"title"] = text((id)[s title]);
+        node[@"enabled"] = @((BOOL)[s isEnabled]);
+        node[@"selected"] = @((BOOL)[s isSelected]);
+        node[@"isMainWindow"] = @((BOOL)[s respondsToSelector:@selector(isMainWindow)] && (BOOL)[s isMainWindow]);
+        node[@"hasKeyboardFocus"] = @((BOOL)[s respondsToSelector:@selector(hasKeyboardFocus)] && (BOOL)[s hasKeyboardFocus]);
+        node[@"hasFocus"] = @((BOOL)[s respondsToSelector:@selector(hasFocus)] && (BOOL)[s hasFocus]);
+        node[@"generation"] = @((BOOL)[s respondsToSelector:@selector(generation)] ? (unsigned int)[s generation] : 0);
+        node[@"horizontalSizeClass"] = @((BOOL)[s respondsToSelector:@selector(horizontalSizeClass)] ? (NSInteger)[s horizontalSizeClass] : 0);
+        node[@"verticalSizeClass"] = @((BOOL)[s respondsToSelector:@selector(verticalSizeClass)] ? (NSInteger)[s verticalSizeClass] : 0);
+
+        if (details && [nodes count] == 0) {
+            node[@"depth"] = @((int)[s depth]);
+            node[@"visibleFrame"] = rect((CGRect)[s visibleFrame]);
+            @try {
+                CGPoint p = (CGPoint)[s hitPoint];
+                node[@"hitPoint"] = @[@(p.x), @(p.y)];
+                p = (CGPoint)[s hitPointForScrolling];
+                node[@"hitPointForScrolling"] = @[@(p.x), @(p.y)];
+            } @catch (NSException *e) {
+            }
+            node[@"isTouchBarElement"] = @((BOOL)[s isTouchBarElement]);
+            node[@"isTopLevelTouchBarElement"] = @((BOOL)[s isTopLevelTouchBarElement]);
+            node[@"uniqueObjectiveC"] = text((id)[s _uniquelyIdentifyingObjectiveCCode]);
+            node[@"uniqueSwift"] = text((id)[s _uniquelyIdentifyingSwiftCode]);
+            node[@"suggestedHitPoints"] = text((id)[s suggestedHitpoints]);
+        }
+
+        NSNumber *index = @([nodes count]);
+        [nodes addObject:node];
+        if (recursive) {
+            NSArray *children = (NSArray *)[s children];
+            for (NSInteger i = (NSInteger)[children count] - 1; i >= 0; i--) {
+                [pending addObject:children[i]];
+                [parents addObject:index];
+            }
+        }
+    }
+    return RETURN(nodes);
+    """,
+)
+
+
+def load_snapshot_tree(element, language, recursive=True, details=False):
+    """
+    Loads the snapshot (XCElementSnapshot) subtree of XCUIElement (as pointer)
+    with a single expression.
+
+    Falls back to a XCElementSnapshot wrapper, which reads values one by one,
+    if the subtree can't be serialized.
+
+    :param int element: Pointer to the XCUIElement
+    :param language: Project language
+    :param bool recursive: Load element children
+    :param bool details: Load values used by `detail_summary`
+    :return: Root of the snapshot tree
+    :rtype: XCElementSnapshotNode | XCElementSnapshot
+    """
+    import_uikit()
+    records = SNAPSHOT_TREE.evaluateJSON(
+        element, "YES" if recursive else "NO", "YES" if details else "NO"
+    )
+    if not records:
+        return XCElementSnapshot(take_snapshot(element), language=language)
+
+    nodes = []
+    for record in records:
+        node = XCElementSnapshotNode(record, language)
+        if record["parent"] >= 0:
+            nodes[record["parent"]].children.append(node)
+        nodes.append(node)
+    return nodes[0]
+
+
+# The last tree loaded by xtree, by element argument, for `xtree --diff`.
+_previous_trees = cache.FBStopCache("xtreeSnapshots", maxSize=8, perStop=False)
+
+
+def identity_keys(elements):
+    """
+    Keys identifying elements among their siblings across snapshots.
+
+    Pointers and generations change with every snapshot, so elements are keyed
+    by type and identifier, or by type and position among the siblings of the
+    same type without an identifier.
+
+    :param list[_XCElementSummary] elements: Sibling elements
+    :return: Identity key of each element
+    :rtype: list[str]
+    """
+    keys = []
+    seen = set()
+    positions = {}
+    for e in elements:
+        type_summary = e.type_summary
+        if len(e.identifier_value) > 0:
+            key = "{}[{}]".format(type_summary, e.identifier_value)
+        else:
+            key = "{}#{}".format(type_summary, positions.get(type_summary, 0))
+            positions[type_summary] = positions.get(type_summary, 0) + 1
+        # Duplicated identifiers are told apart by their order
+        while key in seen:
+            key += "'"
+        seen.add(key)
+        keys.append(key)
+    return keys
+
+
+def subtree_hashes(root, trait, frame):
+    """
+    Hashes of the content of each element and of each subtree, so that equal
+    subtrees can be skipped without visiting them.
+
+    :param _XCElementSummary root: Root of the tree
+    :param bool trait: Compare traits
+    :param bool frame: Compare frames
+    :return: (content hash, subtree hash) by element id
+    :rtype: dict[int, (int, int)]
+    """
+    hashes = {}
+    # Post-order walk, children are hashed before their parent
+    stack = [(root, False)]
+    while stack:
+        e, visited = stack.pop()
+        children = e.child_snapshots()
+        if not visited:
+            stack.append((e, True))
+            stack.extend((c, False) for c in children)
+            continue
+        content = hash(e.summary(pointer=False, trait=trait, frame=frame))
+        subtree = hash((content, tuple(hashes[id(c)][1] for c in children)))
+        hashes[id(e)] = (content, subtree)
+    return hashes
+
+
+def count_elements(root):
+    """
+    :param _XCElementSummary root: Root of the tree
+    :return: Number of elements in the tree
+    :rtype: int
+    """
+    count = 0
+    stack = [root]
+    while stack:
+        count += 1
+        stack.extend(stack.pop().child_snapshots())
+    return count
+
+
+def diff_lines(old, new, pointer=False, trait=False, frame=False):
+    """
+    Lines describing elements added (+), removed (-) and changed (~) between
+    two trees of the same element.
+
+    :param _XCElementSummary old: Previous tree
+    :param _XCElementSummary new: Current tree
+    :param bool pointer: Print pointers
+    :param bool trait: Compare and print traits
+    :param bool frame: Compare and print frames
+    :return: Lines describing the differences
+    :rtype: list[str]
+    """
+    old_hashes = subtree_hashes(old, trait, frame)
+    new_hashes = subtree_hashes(new, trait, frame)
+
+    def describe(e):
+        return e.summary(pointer=pointer, trait=trait, frame=frame)
+
+    def describe_subtree(e):
+        descendants = count_elements(e) - 1
+        if descendants == 0:
+            return describe(e)
+        return "{} (and {} descendants)".format(describe(e), descendants)
+
+    lines = []
+    added = removed = changed = 0
+    stack = [(old, new, identity_keys([new])[0])]
+    while stack:
+        o, n, path = stack.pop()
+        old_content, old_subtree = old_hashes[id(o)]
+        new_content, new_subtree = new_hashes[id(n)]
+        if old_subtree == new_subtree:
+            continue
+        if old_content != new_content:
+            changed += 1
+            lines.append("~ {}: {}".format(path, describe(o)))
+            lines.append("  {}  -> {}".format(" " * len(path), describe(n)))
+
+        old_children = o.child_snapshots()
+        new_children = n.child_snapshots()
+        old_by_key = dict(zip(identity_keys(old_children), old_children))
+        matched = []
+        for key, child in zip(identity_keys(new_children), new_children):
+            child_path = "{}/{}".format(path, key)
+            if key in old_by_key:
+                matched.append((old_by_key.pop(key), child, child_path))
+            else:
+                added += 1
+                lines.append("+ {}: {}".format(child_path, describe_subtree(child)))
+        for key, child in old_by_key.items():
+            removed += 1
+            lines.append("- {}/{}: {}".format(path, key, describe_subtree(child)))
+        # Visit matched children in order
+        stack.extend(reversed(matched))
+
+    if not lines:
+        return ["No changes"]
+    lines.append("{} added, {} removed, {} changed".format(added, removed, changed))
+    return lines
+
+
 class _ElementList(object):
     """
     Store element and list of children
@@ -325,6 +612,23 @@ class _ElementList(object):
             self.element.summary(pointer=pointer, trait=trait, frame=frame),
         )
 
+    def hierarchy_lines(self, pointer=False, trait=False, frame=False, indent=0):
+        """
+        Lines of the hierarchy of elements, generated one at a time
+
+        :param bool pointer: Print pointers
+        :param bool trait: Print traits
+        :param bool frame: Print frames
+        :param int indent: Indention
+        :return: Lines of the hierarchy of elements, without line breaks
+        :rtype: collections.Iterator[str]
+        """
+        stack = [(self, indent)]
+        while stack:
+            e, level = stack.pop()
+            yield e.text(pointer=pointer, trait=trait, frame=frame, indent=level)[:-1]
+            stack.extend((c, level + 1) for c in reversed(e.children))
+
     def hierarchy_text(self, pointer=False, trait=False, frame=False, indent=0):
         """
         String representation of the hierarchy of elements
@@ -336,15 +640,337 @@ class _ElementList(object):
         :return: String representation of the hierarchy of elements
         :rtype: str
         """
-        s = self.text(pointer=pointer, trait=trait, frame=frame, indent=indent)
-        for e in self.children:
-            s += e.hierarchy_text(
-                pointer=pointer, trait=trait, frame=frame, indent=indent + 1
+        return "".join(
+            line + "\n"
+            for line in self.hierarchy_lines(
+                pointer=pointer, trait=trait, frame=frame, indent=indent
+            )
+        )
+
+
+class _XCElementSummary(object):
+    """
+    Summaries shared by XCElementSnapshot and XCElementSnapshotNode, built on
+    top of their `*_value` properties and `child_snapshots()`.
+    """
+
+    __slots__ = ()
+
+    @property
+    def is_missing_identifier(self):
+        """
+        Checks if element has a label but doesn't have an identifier.
+
+        :return: True if element has a label but doesn't have an identifier.
+        :rtype: bool
+        """
+        return len(self.identifier_value) == 0 and len(self.label_value) > 0
+
+    @property
+    def type_summary(self):
+        """
+        :return: XCUIElementType summary
+        :rtype: str
+        """
+        return self.get_type_value_string(self.type_value)
+
+    @property
+    def traits_summary(self):
+        """
+        :return: UIAccessibilityTraits summary
+        :rtype: str
+        """
+        return self.get_traits_value_string(self.traits_value)
+
+    @property
+    def identifier_summary(self):
+        """
+        :return: XCUIElement identifier summary
+        :rtype: str | None
+        """
+        if len(self.identifier_value) == 0:
+            return None
+        return "identifier: '{}'".format(self.identifier_value)
+
+    @property
+    def value_summary(self):
+        """
+        :return: XCUIElement value summary
+        :rtype: str | None
+        """
+        if len(self.value_value) == 0:
+            return None
+        return "value: '{}'".format(self.value_value)
+
+    @property
+    def placeholder_summary(self):
+        """
+        :return: XCUIElement placeholderValue summary
+        :rtype: str | None
+        """
+        if len(self.placeholder_value) == 0:
+            return None
+        return "placeholderValue: '{}'".format(self.placeholder_value)
+
+    @property
+    def label_summary(self):
+        """
+        :return: XCUIElement label summary
+        :rtype: str | None
+        """
+        if len(self.label_value) == 0:
+            return None
+        return "label: '{}'".format(self.label_value)
+
+    @property
+    def title_summary(self):
+        """
+        :return: XCUIElement title summary
+        :rtype: str | None
+        """
+        if len(self.title_value) == 0:
+            return None
+        return "title: '{}'".format(self.title_value)
+
+    @property
+    def enabled_summary(self):
+        """
+        :return: XCUIElement is enabled summary
+        :rtype: str | None
+        """
+        if not self.enabled_value:
+            return "enabled: {}".format(self.enabled_value)
+        return None
+
+    @property
+    def selected_summary(self):
+        """
+        :return: XCUIElement is selected summary
+        :rtype: str | None
+        """
+        if self.selected_value:
+            return "selected: {}".format(self.selected_value)
+        return None
+
+    @property
+    def is_main_window_summary(self):
+        """
+        :return: XCUIElement isMainWindow summary
+        :rtype: str | None
+        """
+        if self.is_main_window_value:
+            return "MainWindow"
+        return None
+
+    @property
+    def keyboard_focus_summary(self):
+        """
+        :return: XCUIElement hasKeyboardFocus summary
+        :rtype: str | None
+        """
+        if self.keyboard_focus_value:
+            return "hasKeyboardFocus: {}".format(self.keyboard_focus_value)
+        return None
+
+    @property
+    def focus_summary(self):
+        """
+        :return: XCUIElement hasFocus summary
+        :rtype: str | None
+        """
+        if self.focus_value:
+            return "hasFocus: {}".format(self.focus_value)
+        return None
+
+    @property
+    def horizontal_size_class_summary(self):
+        """
+        :return:  XCUIElement horizontal size class summary
+        """
+        return self.get_user_interface_size_class_string(
+            self.horizontal_size_class_value
+        )
+
+    @property
+    def vertical_size_class_summary(self):
+        """
+        :return:  XCUIElement vertical size class summary
+        """
+        return self.get_user_interface_size_class_string(self.vertical_size_class_value)
+
+    def summary(self, pointer=False, trait=False, frame=False):
+        """
+        Returns XCElementSnapshot summary
+
+        :param bool pointer: Print pointers
+        :param bool trait: Print traits
+        :param bool frame: Print frames
+        :return: XCElementSnapshot summary
+        :rtype: str
+        """
+        type_text = self.type_summary
+        if pointer:
+            type_text += " {:#x}".format(int(self.element_value, 16))
+        if trait:
+            type_text += " traits: {}({:#x})".format(
+                self.traits_summary, self.traits_value
+            )
+
+        frame_text = self.frame_summary if frame else None
+        identifier = self.identifier_summary
+        label = self.label_summary
+        title = self.title_summary
+        value = self.value_summary
+        placeholder = self.placeholder_summary
+        enabled = self.enabled_summary
+        selected = self.selected_summary
+        main_window = self.is_main_window_summary
+        keyboard_focus = self.keyboard_focus_summary
+        focus = self.focus_summary
+
+        texts = [
+            t
+            for t in [
+                frame_text,
+                identifier,
+                label,
+                title,
+                value,
+                placeholder,
+                enabled,
+                selected,
+                main_window,
+                keyboard_focus,
+                focus,
+            ]
+            if t is not None
+        ]
+
+        return "{}: {}".format(type_text, ", ".join(texts))
+
+    def detail_summary(self):
+        """
+        Returns XCElementSnapshot detail summary
+
+        :return: XCElementSnapshot detail summary
+        :rtype: str
+        """
+        texts = list()
+        texts.append("Pointer: {:#x}".format(int(self.element_value, 16)))
+        texts.append("Type: {}".format(self.type_summary))
+        texts.append("Depth: {}".format(self.depth_value))
+        texts.append(
+            "Traits: {} ({:#x})".format(self.traits_summary, self.traits_value)
+        )
+        texts.append("Frame: {}".format(self.frame_summary))
+        texts.append("Visible frame: {}".format(self.visible_frame_summary))
+        texts.append("Identifier: '{}'".format(self.identifier_value))
+        texts.append("Label: '{}'".format(self.label_value))
+        texts.append("Title: '{}'".format(self.title_value))
+        texts.append("Value: '{}'".format(self.value_value))
+        texts.append("Placeholder: '{}'".format(self.placeholder_value))
+        if self.language != lldb.eLanguageTypeSwift:
+            # They doesn't work on Swift :(
+            texts.append("Hit point: {}".format(self.hit_point_value))
+            texts.append(
+                "Hit point for scrolling: {}".format(self.hit_point_for_scrolling_value)
+            )
+        texts.append("Enabled: {}".format(self.enabled_value))
+        texts.append("Selected: {}".format(self.selected_value))
+        texts.append("Main Window: {}".format(self.is_main_window_value))
+        texts.append("Keyboard focus: {}".format(self.keyboard_focus_value))
+        texts.append("Focus: {}".format(self.focus_value))
+        texts.append("Generation: {}".format(self.generation_value))
+        texts.append(
+            "Horizontal size class: {}".format(self.horizontal_size_class_summary)
+        )
+        texts.append("Vertical size class: {}".format(self.vertical_size_class_summary))
+        texts.append("TouchBar element: {}".format(self.is_touch_bar_element_value))
+        texts.append(
+            "TouchBar top level element: {}".format(
+                self.is_top_level_touch_bar_element_value
+            )
+        )
+        texts.append(
+            "Unique Objective-C: {}".format(
+                self.uniquely_identifying_objective_c_code_value
             )
-        return s
+        )
+        texts.append(
+            "Unique Swift: {}".format(self.uniquely_identifying_swift_code_value)
+        )
+        texts.append("Suggested hit points: {}".format(self.suggested_hit_points_value))
+        return "\n".join(texts)
+
+    def tree(self):
+        """
+        Returns tree of elements in hierarchy
+
+        :return: Elements hierarchy
+        :rtype: _ElementList
+        """
+        children = [e.tree() for e in self.child_snapshots()]
+        return _ElementList(self, children)
+
+    def find_missing_identifiers(self, status_bar):
+        """
+        Find element which has a label but doesn't have an identifier
+
+        :param bool status_bar: Print status bar items
+        :return: Hierarchy structure with items which has a label but doesn't have an identifier
+        :rtype: _ElementList | None
+        """
+        # Do not print status bar items
+        if status_bar is not True and self.type_value == XCUIElementType.StatusBar:
+            return None
+
+        children_missing = [
+            e.find_missing_identifiers(status_bar=status_bar)
+            for e in self.child_snapshots()
+        ]
+        children_missing = [x for x in children_missing if x is not None]
+
+        # Self and its children are not missing identifiers
+        if self.is_missing_identifier is False and len(children_missing) == 0:
+            return None
+
+        return _ElementList(self, children_missing)
+
+    @staticmethod
+    def get_type_value_string(value):
+        """
+        Get element type string from XCUIElementType (as int)
+
+        :param int value: XCUIElementType (as int)
+        :return: XCUIElementType string
+        :rtype: str
+        """
+        return XCUIElementType.name_for_value(value)
 
+    @staticmethod
+    def get_traits_value_string(value):
+        """
+        Get element traits string from UIAccessibilityTraits (as int)
 
-class XCElementSnapshot(object):
+        :param int value: UIAccessibilityTraits (as int)
+        :return: UIAccessibilityTraits string
+        :rtype: str
+        """
+        return UIAccessibilityTraits.name_for_value(value)
+
+    @staticmethod
+    def get_user_interface_size_class_string(value):
+        """
+        Get user interface size class string from UIUserInterfaceSizeClass (as int)
+
+        :param value: UIAccessibilityTraits (as int)
+        :return: UIUserInterfaceSizeClass string
+        :rtype: str
+        """
+        return UIUserInterfaceSizeClass.name_for_value(value)
+
+
+class XCElementSnapshot(_XCElementSummary):
     """
     XCElementSnapshot wrapper
 
@@ -399,16 +1025,6 @@ class XCElementSnapshot(object):
         self._horizontalSizeClass = None
         self._verticalSizeClass = None
 
-    @property
-    def is_missing_identifier(self):
-        """
-        Checks if element has a label but doesn't have an identifier.
-
-        :return: True if element has a label but doesn't have an identifier.
-        :rtype: bool
-        """
-        return len(self.identifier_value) == 0 and len(self.label_value) > 0
-
     @property
     def type(self):
         """
@@ -433,14 +1049,6 @@ class XCElementSnapshot(object):
         """
         return int(self.type.GetValue())
 
-    @property
-    def type_summary(self):
-        """
-        :return: XCUIElementType summary
-        :rtype: str
-        """
-        return self.get_type_value_string(self.type_value)
-
     @property
     def traits(self):
         """
@@ -465,14 +1073,6 @@ class XCElementSnapshot(object):
         """
         return int(self.traits.GetValue())
 
-    @property
-    def traits_summary(self):
-        """
-        :return: UIAccessibilityTraits summary
-        :rtype: str
-        """
-        return self.get_traits_value_string(self.traits_value)
-
     @property
     def frame(self):
         """
@@ -522,16 +1122,6 @@ class XCElementSnapshot(object):
         """
         return normalize_summary(self.identifier.GetSummary())
 
-    @property
-    def identifier_summary(self):
-        """
-        :return: XCUIElement identifier summary
-        :rtype: str | None
-        """
-        if len(self.identifier_value) == 0:
-            return None
-        return "identifier: '{}'".format(self.identifier_value)
-
     @property
     def value(self):
         """
@@ -556,16 +1146,6 @@ class XCElementSnapshot(object):
         """
         return normalize_summary(self.value.GetSummary())
 
-    @property
-    def value_summary(self):
-        """
-        :return: XCUIElement value summary
-        :rtype: str | None
-        """
-        if len(self.value_value) == 0:
-            return None
-        return "value: '{}'".format(self.value_value)
-
     @property
     def placeholder(self):
         """
@@ -590,16 +1170,6 @@ class XCElementSnapshot(object):
         """
         return normalize_summary(self.placeholder.GetSummary())
 
-    @property
-    def placeholder_summary(self):
-        """
-        :return: XCUIElement placeholderValue summary
-        :rtype: str | None
-        """
-        if len(self.placeholder_value) == 0:
-            return None
-        return "placeholderValue: '{}'".format(self.placeholder_value)
-
     @property
     def label(self):
         """
@@ -619,20 +1189,10 @@ class XCElementSnapshot(object):
     @property
     def label_value(self):
         """
-        :return: XCUIElement label value
-        :rtype: str
-        """
-        return normalize_summary(self.label.GetSummary())
-
-    @property
-    def label_summary(self):
-        """
-        :return: XCUIElement label summary
-        :rtype: str | None
+        :return: XCUIElement label value
+        :rtype: str
         """
-        if len(self.label_value) == 0:
-            return None
-        return "label: '{}'".format(self.label_value)
+        return normalize_summary(self.label.GetSummary())
 
     @property
     def title(self):
@@ -658,16 +1218,6 @@ class XCElementSnapshot(object):
         """
         return normalize_summary(self.title.GetSummary())
 
-    @property
-    def title_summary(self):
-        """
-        :return: XCUIElement title summary
-        :rtype: str | None
-        """
-        if len(self.title_value) == 0:
-            return None
-        return "title: '{}'".format(self.title_value)
-
     @property
     def children(self):
         """
@@ -724,16 +1274,6 @@ class XCElementSnapshot(object):
         """
         return bool(self.enabled.GetValueAsSigned())
 
-    @property
-    def enabled_summary(self):
-        """
-        :return: XCUIElement is enabled summary
-        :rtype: str | None
-        """
-        if not self.enabled_value:
-            return "enabled: {}".format(self.enabled_value)
-        return None
-
     @property
     def selected(self):
         """
@@ -758,16 +1298,6 @@ class XCElementSnapshot(object):
         """
         return bool(self.selected.GetValueAsSigned())
 
-    @property
-    def selected_summary(self):
-        """
-        :return: XCUIElement is selected summary
-        :rtype: str | None
-        """
-        if self.selected_value:
-            return "selected: {}".format(self.selected_value)
-        return None
-
     @property
     def is_main_window(self):
         """
@@ -792,16 +1322,6 @@ class XCElementSnapshot(object):
         """
         return bool(self.is_main_window.GetValueAsSigned())
 
-    @property
-    def is_main_window_summary(self):
-        """
-        :return: XCUIElement isMainWindow summary
-        :rtype: str | None
-        """
-        if self.is_main_window_value:
-            return "MainWindow"
-        return None
-
     @property
     def keyboard_focus(self):
         """
@@ -826,16 +1346,6 @@ class XCElementSnapshot(object):
         """
         return bool(self.keyboard_focus.GetValueAsSigned())
 
-    @property
-    def keyboard_focus_summary(self):
-        """
-        :return: XCUIElement hasKeyboardFocus summary
-        :rtype: str | None
-        """
-        if self.keyboard_focus_value:
-            return "hasKeyboardFocus: {}".format(self.keyboard_focus_value)
-        return None
-
     @property
     def focus(self):
         """
@@ -860,16 +1370,6 @@ class XCElementSnapshot(object):
         """
         return bool(self.focus.GetValueAsSigned())
 
-    @property
-    def focus_summary(self):
-        """
-        :return: XCUIElement hasFocus summary
-        :rtype: str | None
-        """
-        if self.focus_value:
-            return "hasFocus: {}".format(self.focus_value)
-        return None
-
     @property
     def generation(self):
         """
@@ -918,15 +1418,6 @@ class XCElementSnapshot(object):
         """
         return int(self.horizontal_size_class.GetValue())
 
-    @property
-    def horizontal_size_class_summary(self):
-        """
-        :return:  XCUIElement horizontal size class summary
-        """
-        return self.get_user_interface_size_class_string(
-            self.horizontal_size_class_value
-        )
-
     @property
     def vertical_size_class(self):
         """
@@ -951,13 +1442,6 @@ class XCElementSnapshot(object):
         """
         return int(self.vertical_size_class.GetValue())
 
-    @property
-    def vertical_size_class_summary(self):
-        """
-        :return:  XCUIElement vertical size class summary
-        """
-        return self.get_user_interface_size_class_string(self.vertical_size_class_value)
-
     @property
     def uniquely_identifying_objective_c_code(self):
         """
@@ -1127,180 +1611,136 @@ class XCElementSnapshot(object):
         """
         return CGPoint(self.hit_point_for_scrolling).summary()
 
-    def summary(self, pointer=False, trait=False, frame=False):
+    def child_snapshots(self):
         """
-        Returns XCElementSnapshot summary
-
-        :param bool pointer: Print pointers
-        :param bool trait: Print traits
-        :param bool frame: Print frames
-        :return: XCElementSnapshot summary
-        :rtype: str
+        :return: Wrappers of the element children
+        :rtype: list[XCElementSnapshot]
         """
-        type_text = self.type_summary
-        if pointer:
-            type_text += " {:#x}".format(int(self.element_value, 16))
-        if trait:
-            type_text += " traits: {}({:#x})".format(
-                self.traits_summary, self.traits_value
-            )
+        return [XCElementSnapshot(e, self.language) for e in self.children_list]
 
-        frame_text = self.frame_summary if frame else None
-        identifier = self.identifier_summary
-        label = self.label_summary
-        title = self.title_summary
-        value = self.value_summary
-        placeholder = self.placeholder_summary
-        enabled = self.enabled_summary
-        selected = self.selected_summary
-        main_window = self.is_main_window_summary
-        keyboard_focus = self.keyboard_focus_summary
-        focus = self.focus_summary
 
-        texts = [
-            t
-            for t in [
-                frame_text,
-                identifier,
-                label,
-                title,
-                value,
-                placeholder,
-                enabled,
-                selected,
-                main_window,
-                keyboard_focus,
-                focus,
-            ]
-            if t is not None
-        ]
+class XCElementSnapshotNode(_XCElementSummary):
+    """
+    XCElementSnapshot values loaded up front by `load_snapshot_tree`, so that
+    summaries don't need to touch the process.
 
-        return "{}: {}".format(type_text, ", ".join(texts))
+    Detail values (depth, visible frame, hit points, ...) are only loaded for
+    the root, and only when asked for.
+    """
 
-    def detail_summary(self):
-        """
-        Returns XCElementSnapshot detail summary
+    __slots__ = (
+        "element_value",
+        "language",
+        "children",
+        "type_value",
+        "traits_value",
+        "frame_rect",
+        "identifier_value",
+        "value_value",
+        "placeholder_value",
+        "label_value",
+        "title_value",
+        "enabled_value",
+        "selected_value",
+        "is_main_window_value",
+        "keyboard_focus_value",
+        "focus_value",
+        "generation_value",
+        "horizontal_size_class_value",
+        "vertical_size_class_value",
+        "depth_value",
+        "visible_frame_rect",
+        "hit_point_coordinates",
+        "hit_point_for_scrolling_coordinates",
+        "is_touch_bar_element_value",
+        "is_top_level_touch_bar_element_value",
+        "uniquely_identifying_objective_c_code_value",
+        "uniquely_identifying_swift_code_value",
+        "suggested_hit_points_value",
+    )
 
-        :return: XCElementSnapshot detail summary
-        :rtype: str
+    def __init__(self, record, language):
         """
-        texts = list()
-        texts.append("Pointer: {:#x}".format(int(self.element_value, 16)))
-        texts.append("Type: {}".format(self.type_summary))
-        texts.append("Depth: {}".format(self.depth_value))
-        texts.append(
-            "Traits: {} ({:#x})".format(self.traits_summary, self.traits_value)
-        )
-        texts.append("Frame: {}".format(self.frame_summary))
-        texts.append("Visible frame: {}".format(self.visible_frame_summary))
-        texts.append("Identifier: '{}'".format(self.identifier_value))
-        texts.append("Label: '{}'".format(self.label_value))
-        texts.append("Title: '{}'".format(self.title_value))
-        texts.append("Value: '{}'".format(self.value_value))
-        texts.append("Placeholder: '{}'".format(self.placeholder_value))
-        if self.language != lldb.eLanguageTypeSwift:
-            # They doesn't work on Swift :(
-            texts.append("Hit point: {}".format(self.hit_point_value))
-            texts.append(
-                "Hit point for scrolling: {}".format(self.hit_point_for_scrolling_value)
-            )
-        texts.append("Enabled: {}".format(self.enabled_value))
-        texts.append("Selected: {}".format(self.selected_value))
-        texts.append("Main Window: {}".format(self.is_main_window_value))
-        texts.append("Keyboard focus: {}".format(self.keyboard_focus_value))
-        texts.append("Focus: {}".format(self.focus_value))
-        texts.append("Generation: {}".format(self.generation_value))
-        texts.append(
-            "Horizontal size class: {}".format(self.horizontal_size_class_summary)
+        :param dict record: Element values returned by SNAPSHOT_TREE
+        :param language: Project language
+        """
+        self.element_value = record["pointer"]
+        self.language = language
+        self.children = []
+
+        self.type_value = record["type"]
+        self.traits_value = record["traits"]
+        self.frame_rect = record["frame"]
+        self.identifier_value = record["identifier"]
+        self.value_value = record["value"]
+        self.placeholder_value = record["placeholderValue"]
+        self.label_value = record["label"]
+        self.title_value = record["title"]
+        self.enabled_value = record["enabled"]
+        self.selected_value = record["selected"]
+        self.is_main_window_value = record["isMainWindow"]
+        self.keyboard_focus_value = record["hasKeyboardFocus"]
+        self.focus_value = record["hasFocus"]
+        self.generation_value = record["generation"]
+        self.horizontal_size_class_value = record["horizontalSizeClass"]
+        self.vertical_size_class_value = record["verticalSizeClass"]
+
+        self.depth_value = record.get("depth")
+        self.visible_frame_rect = record.get("visibleFrame")
+        self.hit_point_coordinates = record.get("hitPoint")
+        self.hit_point_for_scrolling_coordinates = record.get("hitPointForScrolling")
+        self.is_touch_bar_element_value = record.get("isTouchBarElement")
+        self.is_top_level_touch_bar_element_value = record.get(
+            "isTopLevelTouchBarElement"
         )
-        texts.append("Vertical size class: {}".format(self.vertical_size_class_summary))
-        texts.append("TouchBar element: {}".format(self.is_touch_bar_element_value))
-        texts.append(
-            "TouchBar top level element: {}".format(
-                self.is_top_level_touch_bar_element_value
-            )
+        self.uniquely_identifying_objective_c_code_value = normalize_array_description(
+            record.get("uniqueObjectiveC", "")
         )
-        texts.append(
-            "Unique Objective-C: {}".format(
-                self.uniquely_identifying_objective_c_code_value
-            )
+        self.uniquely_identifying_swift_code_value = normalize_array_description(
+            record.get("uniqueSwift", "")
         )
-        texts.append(
-            "Unique Swift: {}".format(self.uniquely_identifying_swift_code_value)
+        self.suggested_hit_points_value = normalize_array_description(
+            record.get("suggestedHitPoints", "")
         )
-        texts.append("Suggested hit points: {}".format(self.suggested_hit_points_value))
-        return "\n".join(texts)
 
-    def tree(self):
+    @property
+    def frame_summary(self):
         """
-        Returns tree of elements in hierarchy
-
-        :return: Elements hierarchy
-        :rtype: _ElementList
+        :return: XCUIElement frame summary
+        :rtype: str
         """
-        children = [
-            XCElementSnapshot(e, self.language).tree() for e in self.children_list
-        ]
-        return _ElementList(self, children)
+        return rect_summary(self.frame_rect)
 
-    def find_missing_identifiers(self, status_bar):
+    @property
+    def visible_frame_summary(self):
         """
-        Find element which has a label but doesn't have an identifier
-
-        :param bool status_bar: Print status bar items
-        :return: Hierarchy structure with items which has a label but doesn't have an identifier
-        :rtype: _ElementList | None
+        :return: XCUIElement visible frame
+        :rtype: str
         """
-        # Do not print status bar items
-        if status_bar is not True and self.type_value == XCUIElementType.StatusBar:
-            return None
-
-        children_missing = [
-            XCElementSnapshot(e, self.language).find_missing_identifiers(
-                status_bar=status_bar
-            )
-            for e in self.children_list
-        ]
-        children_missing = [x for x in children_missing if x is not None]
-
-        # Self and its children are not missing identifiers
-        if self.is_missing_identifier is False and len(children_missing) == 0:
-            return None
-
-        return _ElementList(self, children_missing)
+        return rect_summary(self.visible_frame_rect)
 
-    @staticmethod
-    def get_type_value_string(value):
+    @property
+    def hit_point_value(self):
         """
-        Get element type string from XCUIElementType (as int)
-
-        :param int value: XCUIElementType (as int)
-        :return: XCUIElementType string
+        :return: XCUIElement hit point
         :rtype: str
         """
-        return XCUIElementType.name_for_value(value)
+        return point_summary(self.hit_point_coordinates)
 
-    @staticmethod
-    def get_traits_value_string(value):
+    @property
+    def hit_point_for_scrolling_value(self):
         """
-        Get element traits string from UIAccessibilityTraits (as int)
-
-        :param int value: UIAccessibilityTraits (as int)
-        :return: UIAccessibilityTraits string
+        :return: XCUIElement hit point for scrolling
         :rtype: str
         """
-        return UIAccessibilityTraits.name_for_value(value)
+        return point_summary(self.hit_point_for_scrolling_coordinates)
 
-    @staticmethod
-    def get_user_interface_size_class_string(value):
+    def child_snapshots(self):
         """
-        Get user interface size class string from UIUserInterfaceSizeClass (as int)
-
-        :param value: UIAccessibilityTraits (as int)
-        :return: UIUserInterfaceSizeClass string
-        :rtype: str
+        :return: Wrappers of the element children
+        :rtype: list[XCElementSnapshotNode]
         """
-        return UIUserInterfaceSizeClass.name_for_value(value)
+        return self.children
 
 
 class XCUIElementType(object):
@@ -1580,6 +2020,34 @@ def normalize_summary(summary):
     return summary.lstrip("@").strip('"')
 
 
+def rect_summary(rect):
+    """
+    CGRect summary of a loaded frame
+
+    :param list[float] | None rect: Frame as [x, y, width, height]
+    :return: CGRect summary
+    :rtype: str
+    """
+    if rect is None:
+        return "Unknown"
+    x, y, width, height = [float(v) for v in rect]
+    return "{{{{{}, {}}}, {{{}, {}}}}}".format(x, y, width, height)
+
+
+def point_summary(point):
+    """
+    CGPoint summary of a loaded point
+
+    :param list[float] | None point: Point as [x, y]
+    :return: CGPoint summary
+    :rtype: str
+    """
+    if point is None:
+        return "Unknown"
+    x, y = [float(v) for v in point]
+    return "{{{}, {}}}".format(x, y)
+
+
 def normalize_array_description(description):
     """
     Normalize array object description by removing "<" and ">" characters and content between them.
@@ -5,61 +5,235 @@
 # This source code is licensed under the MIT license found in the
 # LICENSE file in the root directory of this source tree.
 
-import imp
+import hashlib
+import importlib.util
+import json
 import os
+import sys
 from contextlib import redirect_stderr, redirect_stdout
 from optparse import OptionParser
 
+import fbchisellldbprofile as profile
 import lldb
 
 
+# Bump whenever the shape of the manifest or of the generated help changes.
+MANIFEST_VERSION = 1
+
+# Setting CHISEL_EAGER_LOAD in the environment imports every command module
+# at startup, as Chisel always used to. CHISEL_MANIFEST_PATH overrides where
+# the manifest of commands is cached.
+EAGER_LOAD_VARIABLE = "CHISEL_EAGER_LOAD"
+MANIFEST_PATH_VARIABLE = "CHISEL_MANIFEST_PATH"
+
+# Functions registered before lldb handed us its script dictionary.
+_registeredFunctions = {}
+
+
 def __lldb_init_module(debugger, dict):
     filePath = os.path.realpath(__file__)
     lldbHelperDir = os.path.dirname(filePath)
 
     commandsDirectory = os.path.join(lldbHelperDir, "commands")
-    loadCommandsInDirectory(commandsDirectory)
+    loadCommandsInDirectory(commandsDirectory, dict)
 
 
-def loadCommandsInDirectory(commandsDirectory):
-    for file in os.listdir(commandsDirectory):
-        fileName, fileExtension = os.path.splitext(file)
-        if fileExtension == ".py":
-            module = imp.load_source(fileName, os.path.join(commandsDirectory, file))
-
-            if hasattr(module, "lldbinit"):
-                module.lldbinit()
+def loadCommandsInDirectory(commandsDirectory, internalDict=None):
+    lazy = not os.environ.get(EAGER_LOAD_VARIABLE)
+    manifestPath = manifestPathForDirectory(commandsDirectory)
+    manifest = loadManifest(manifestPath) if lazy else {}
+    updatedManifest = {}
 
-            if hasattr(module, "lldbcommands"):
-                module._loadedFunctions = {}
-                for command in module.lldbcommands():
-                    loadCommand(
-                        module, command, commandsDirectory, fileName, fileExtension
-                    )
+    for file in sorted(os.listdir(commandsDirectory)):
+        fileName, fileExtension = os.path.splitext(file)
+        if fileExtension != ".py":
+            continue
+
+        path = os.path.join(commandsDirectory, file)
+        entry = manifest.get(fileName)
+        fingerprint = fingerprintForFile(path, entry)
+
+        if (
+            lazy
+            and entry
+            and entry["sha1"] == fingerprint["sha1"]
+            and not entry["lldbinit"]
+        ):
+            load = profile.recordModuleLoad(fileName, len(entry["commands"]))
+            load.lazy = True
+            with profile.timer() as registration:
+                for command in entry["commands"]:
+                    loadLazyCommand(fileName, path, command, internalDict)
+        else:
+            with profile.timer() as moduleImport:
+                module = importCommandModule(fileName, path)
+            load = profile.recordModuleLoad(fileName)
+            load.importSeconds = moduleImport.elapsed
+
+            with profile.timer() as registration:
+                if hasattr(module, "lldbinit"):
+                    module.lldbinit()
+
+                commands = []
+                if hasattr(module, "lldbcommands"):
+                    module._loadedFunctions = {}
+                    for command in module.lldbcommands():
+                        func = loadCommand(
+                            module,
+                            command,
+                            commandsDirectory,
+                            fileName,
+                            fileExtension,
+                            internalDict,
+                        )
+                        commands.append(
+                            {
+                                "name": command.name(),
+                                "class": command.__class__.__name__,
+                                "help": func.__doc__,
+                            }
+                        )
+            load.commandCount = len(commands)
+            entry = {"lldbinit": hasattr(module, "lldbinit"), "commands": commands}
+
+        updatedManifest[fileName] = dict(entry, **fingerprint)
+        load.registerSeconds = registration.elapsed
+
+    if lazy and updatedManifest != manifest:
+        saveManifest(manifestPath, updatedManifest)
+
+
+def importCommandModule(name, path):
+    spec = importlib.util.spec_from_file_location(name, path)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    try:
+        spec.loader.exec_module(module)
+    except BaseException:
+        del sys.modules[name]
+        raise
+    return module
+
+
+def manifestPathForDirectory(commandsDirectory):
+    path = os.environ.get(MANIFEST_PATH_VARIABLE)
+    if path:
+        return os.path.expanduser(path)
+    return os.path.join(commandsDirectory, "__pycache__", "chisel-manifest.json")
+
+
+def loadManifest(path):
+    try:
+        with open(path) as manifestFile:
+            manifest = json.load(manifestFile)
+    except (OSError, ValueError):
+        return {}
+
+    if manifest.get("version") != MANIFEST_VERSION:
+        return {}
+    return manifest.get("modules", {})
+
+
+def saveManifest(path, modules):
+    # The manifest is only an optimization, so failing to write it (say, in
+    # a read-only install) just means the next session imports everything.
+    temporaryPath = "{}.{}".format(path, os.getpid())
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(temporaryPath, "w") as manifestFile:
+            json.dump(
+                {"version": MANIFEST_VERSION, "modules": modules},
+                manifestFile,
+                indent=1,
+                sort_keys=True,
+            )
+        os.replace(temporaryPath, path)
+    except OSError:
+        pass
+
+
+def fingerprintForFile(path, entry=None):
+    stat = os.stat(path)
+    fingerprint = {"mtime": stat.st_mtime_ns, "size": stat.st_size}
+
+    # Hashing is only needed when the file looks touched; an unchanged mtime
+    # and size reuse the previous hash.
+    if (
+        entry
+        and entry.get("mtime") == fingerprint["mtime"]
+        and entry.get("size") == fingerprint["size"]
+    ):
+        fingerprint["sha1"] = entry["sha1"]
+    else:
+        with open(path, "rb") as moduleFile:
+            fingerprint["sha1"] = hashlib.sha1(moduleFile.read()).hexdigest()
+
+    return fingerprint
+
+
+def loadLazyCommand(moduleName, path, manifestCommand, internalDict=None):
+    name = manifestCommand["name"]
+    state = {}
+
+    def runCommand(debugger, input, exe_ctx, result, internal_dict):
+        if "func" not in state:
+            state["func"] = makeRunCommand(
+                commandFromModule(moduleName, path, name), path
+            )
+        state["func"](debugger, input, exe_ctx, result, internal_dict)
+
+    runCommand.__doc__ = manifestCommand["help"]
+    registerCommand(moduleName, name, runCommand, internalDict)
+
+
+def commandFromModule(moduleName, path, name):
+    module = sys.modules.get(moduleName)
+    if module is None or getattr(module, "__file__", None) != path:
+        with profile.timer() as moduleImport:
+            module = importCommandModule(moduleName, path)
+        load = profile.moduleLoadNamed(moduleName)
+        if load:
+            load.importSeconds = moduleImport.elapsed
+
+    for command in module.lldbcommands():
+        if command.name() == name:
+            return command
+    raise LookupError(
+        "{} no longer defines the command {}. Restart lldb to reload Chisel.".format(
+            path, name
+        )
+    )
 
 
-def loadCommand(module, command, directory, filename, extension):
+def loadCommand(module, command, directory, filename, extension, internalDict=None):
     func = makeRunCommand(command, os.path.join(directory, filename + extension))
-    name = command.name()
-    helpText = (
-        command.description().strip().splitlines()[0]
-    )  # first line of description
+    module._loadedFunctions[filename + "_" + command.name()] = func
+    registerCommand(filename, command.name(), func, internalDict)
+    return func
 
-    key = filename + "_" + name
 
-    module._loadedFunctions[key] = func
+def registerCommand(moduleName, name, func, internalDict=None):
+    helpText = func.__doc__.strip().splitlines()[0]  # first line of description
 
+    key = moduleName + "_" + name
     functionName = "__" + key
 
-    lldb.debugger.HandleCommand(
-        "script "
-        + functionName
-        + " = sys.modules['"
-        + module.__name__
-        + "']._loadedFunctions['"
-        + key
-        + "']"
-    )
+    if internalDict is not None:
+        # The dictionary handed to __lldb_init_module is the namespace lldb
+        # resolves --function in, so the function can be stored directly.
+        internalDict[functionName] = func
+    else:
+        _registeredFunctions[key] = func
+        lldb.debugger.HandleCommand(
+            "script "
+            + functionName
+            + " = sys.modules['"
+            + __name__
+            + "']._registeredFunctions['"
+            + key
+            + "']"
+        )
+
     lldb.debugger.HandleCommand(
         'command script add --help "{help}" --function {function} {name}'.format(
             help=helpText.replace('"', '\\"'),  # escape quotes
@@ -76,7 +250,9 @@ def makeRunCommand(command, filename):
         # use methods like print (or parse_args) in the command logic
         # as if they are writing to stdout, but write to result
         # instead. lldb will handle displaying it to the user.
-        with redirect_stdout(result), redirect_stderr(result):
+        with redirect_stdout(result), redirect_stderr(result), profile.commandRun(
+            command.name(), input
+        ):
             command.result = result
             command.context = exe_ctx
             splitInput = command.lex(input)
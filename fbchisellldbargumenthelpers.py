@@ -0,0 +1,554 @@
+#!/usr/bin/python
+
+# Copyright (c) Facebook, Inc. and its affiliates. All Rights Reserved
+#
+# This source code is licensed under the MIT license found in the
+# LICENSE file in the root directory of this source tree.
+
+import collections
+import re
+import struct
+
+import fbchisellldbprofile as profile
+import lldb
+
+
+# Where the arguments of a function are passed on an architecture:
+# integerRegisters and floatRegisters are the argument registers in order (with
+# alternative names for each, as lldb versions differ), entryStackOffset is
+# where the stack arguments start relative to the stack pointer on entry, and
+# packedStack means stack arguments are packed by their natural alignment
+# (Apple arm64) instead of being given 8 byte slots.
+ABI = collections.namedtuple(
+    "ABI",
+    ["name", "integerRegisters", "floatRegisters", "entryStackOffset", "packedStack"],
+)
+
+ABIS = {
+    "x86_64": ABI(
+        "x86_64",
+        [(name,) for name in ("rdi", "rsi", "rdx", "rcx", "r8", "r9")],
+        [("xmm{}".format(i),) for i in range(8)],
+        8,
+        False,
+    ),
+    "arm64": ABI(
+        "arm64",
+        [("x{}".format(i),) for i in range(8)],
+        [("d{}".format(i), "v{}".format(i)) for i in range(8)],
+        0,
+        True,
+    ),
+}
+ABIS["x86_64h"] = ABIS["x86_64"]
+ABIS["arm64e"] = ABIS["arm64"]
+
+# Once the frame is set up, stack arguments start above the saved frame
+# pointer and return address, on both x86_64 and arm64.
+FRAME_STACK_OFFSET = 16
+
+WORD_SIZE = 8
+
+# Type encoding qualifiers (const, in, out, ...), which don't change the layout.
+TYPE_QUALIFIERS = "rnNoORVA"
+
+# struct format, name, and size (which is also the alignment) of each scalar
+# type encoding, for LP64.
+SCALAR_TYPES = {
+    "c": ("b", "char", 1),
+    "C": ("B", "unsigned char", 1),
+    "B": ("?", "bool", 1),
+    "s": ("h", "short", 2),
+    "S": ("H", "unsigned short", 2),
+    "i": ("i", "int", 4),
+    "I": ("I", "unsigned int", 4),
+    "l": ("i", "long", 4),
+    "L": ("I", "unsigned long", 4),
+    "q": ("q", "long long", 8),
+    "Q": ("Q", "unsigned long long", 8),
+    "f": ("f", "float", 4),
+    "d": ("d", "double", 8),
+    "v": (None, "void", 0),
+    "@": ("Q", "id", 8),
+    "#": ("Q", "Class", 8),
+    ":": ("Q", "SEL", 8),
+    "*": ("Q", "char *", 8),
+    "^": ("Q", "void *", 8),
+    "?": ("Q", "void *", 8),
+}
+
+FLOAT_CODES = "fd"
+POINTER_CODES = "@#:*^?"
+
+
+class FBArgumentError(Exception):
+    pass
+
+
+class ArgumentType:
+    """
+    A type parsed from an Objective-C type encoding. `code` is the scalar
+    encoding, or "{" for structs, whose `fields` are the (offset, type) of each
+    member.
+    """
+
+    __slots__ = ("code", "name", "size", "alignment", "fields")
+
+    def __init__(self, code, name, size, alignment, fields=None):
+        self.code = code
+        self.name = name
+        self.size = size
+        self.alignment = alignment
+        self.fields = fields or []
+
+    @property
+    def isStruct(self):
+        return self.code == "{"
+
+    def scalars(self, offset=0):
+        """Yields the (offset, type) of each scalar in the type, flattened."""
+        if not self.isStruct:
+            yield offset, self
+            return
+        for fieldOffset, field in self.fields:
+            for scalar in field.scalars(offset + fieldOffset):
+                yield scalar
+
+    def unpack(self, data):
+        """
+        Returns the value of the type held in `data`: an int for integers and
+        pointers, a float, a bool, or a tuple of the field values for structs.
+        """
+        if self.isStruct:
+            return tuple(
+                field.unpack(data[offset : offset + field.size])
+                for offset, field in self.fields
+            )
+        return struct.unpack("<" + SCALAR_TYPES[self.code][0], data[: self.size])[0]
+
+    def decode(self, data):
+        """Formats the value of the type held in `data`, like `{{0, 0}, {1, 1}}`."""
+        if self.isStruct:
+            return "{{{}}}".format(
+                ", ".join(
+                    field.decode(data[offset : offset + field.size])
+                    for offset, field in self.fields
+                )
+            )
+        value = self.unpack(data)
+        if self.code in FLOAT_CODES:
+            return "{:g}".format(value)
+        if self.code == "B":
+            return "true" if value else "false"
+        if self.code in POINTER_CODES:
+            return "0x{:x}".format(value)
+        return str(value)
+
+
+POINTER_TYPE = ArgumentType("^", "void *", WORD_SIZE, WORD_SIZE)
+
+
+def _parseType(encoding, position):
+    while position < len(encoding) and encoding[position] in TYPE_QUALIFIERS:
+        position += 1
+    if position >= len(encoding):
+        raise FBArgumentError("Truncated type encoding {}".format(encoding))
+
+    code = encoding[position]
+    position += 1
+    if code == "^":
+        pointee, position = _parseType(encoding, position)
+        return ArgumentType("^", pointee.name + " *", WORD_SIZE, WORD_SIZE), position
+    if code == "@":
+        if encoding.startswith("?", position):
+            return ArgumentType("@", "block", WORD_SIZE, WORD_SIZE), position + 1
+        if encoding.startswith('"', position):
+            end = encoding.index('"', position + 1)
+            name = encoding[position + 1 : end] + " *"
+            return ArgumentType("@", name, WORD_SIZE, WORD_SIZE), end + 1
+    if code in SCALAR_TYPES:
+        _, name, size = SCALAR_TYPES[code]
+        return ArgumentType(code, name, size, max(size, 1)), position
+    if code == "{":
+        return _parseStruct(encoding, position)
+    raise FBArgumentError("Unsupported type encoding {} in {}".format(code, encoding))
+
+
+def _parseStruct(encoding, position):
+    match = re.compile(r"([^=}]*)(=?)").match(encoding, position)
+    name, position = match.group(1), match.end()
+    if not match.group(2):
+        raise FBArgumentError("Opaque struct {} in {}".format(name, encoding))
+
+    fields = []
+    size = 0
+    alignment = 1
+    while not encoding.startswith("}", position):
+        field, position = _parseType(encoding, position)
+        size = -(-size // field.alignment) * field.alignment
+        fields.append((size, field))
+        size += field.size
+        alignment = max(alignment, field.alignment)
+    size = -(-size // alignment) * alignment
+    return ArgumentType("{", name or "struct", size, alignment, fields), position + 1
+
+
+def parseTypeEncoding(encoding):
+    """Parses the type encoding of a single type, like `@` or `{CGPoint=dd}`."""
+    type, position = _parseType(encoding, 0)
+    if position != len(encoding):
+        raise FBArgumentError(
+            "Unexpected {} in {}".format(encoding[position:], encoding)
+        )
+    return type
+
+
+def parseMethodTypeEncoding(encoding):
+    """
+    Parses a method type encoding like `v24@0:8@16` into the ArgumentTypes of
+    its return value and arguments (self and _cmd included).
+    """
+    types = []
+    position = 0
+    while position < len(encoding):
+        type, position = _parseType(encoding, position)
+        types.append(type)
+        while position < len(encoding) and (
+            encoding[position].isdigit() or encoding[position] == "-"
+        ):
+            position += 1
+    return types
+
+
+# How an argument is passed: `kind` is "registers" when `registers` hold the
+# (offset in the value, size) `pieces` of it, "stack" for a copy at `offset`
+# from the start of the stack arguments, and "indirect" when the location
+# `pointer` holds the address of a copy.
+ArgumentLocation = collections.namedtuple(
+    "ArgumentLocation", ["kind", "registers", "pieces", "offset", "pointer"]
+)
+
+
+def _homogeneousFloatMembers(type):
+    scalars = list(type.scalars())
+    codes = set(scalar.code for _, scalar in scalars)
+    if len(scalars) <= 4 and len(codes) == 1 and codes <= set(FLOAT_CODES):
+        return scalars
+    return None
+
+
+class _Allocator:
+    def __init__(self, abi):
+        self.abi = abi
+        self.integerIndex = 0
+        self.floatIndex = 0
+        self.stackOffset = 0
+
+    def integers(self, count):
+        if self.integerIndex + count > len(self.abi.integerRegisters):
+            self.integerIndex = len(self.abi.integerRegisters)
+            return None
+        registers = self.abi.integerRegisters[
+            self.integerIndex : self.integerIndex + count
+        ]
+        self.integerIndex += count
+        return registers
+
+    def floats(self, count):
+        if self.floatIndex + count > len(self.abi.floatRegisters):
+            self.floatIndex = len(self.abi.floatRegisters)
+            return None
+        registers = self.abi.floatRegisters[self.floatIndex : self.floatIndex + count]
+        self.floatIndex += count
+        return registers
+
+    def stack(self, type):
+        if self.abi.packedStack:
+            alignment = max(type.alignment, 1)
+            size = type.size
+        else:
+            alignment = max(type.alignment, WORD_SIZE)
+            size = -(-type.size // WORD_SIZE) * WORD_SIZE
+        offset = -(-self.stackOffset // alignment) * alignment
+        self.stackOffset = offset + size
+        return ArgumentLocation("stack", [], [], offset, None)
+
+    def scalar(self, type):
+        if type.code in FLOAT_CODES:
+            registers = self.floats(1)
+        else:
+            registers = self.integers(1)
+        if registers:
+            return ArgumentLocation("registers", registers, [(0, type.size)], 0, None)
+        return self.stack(type)
+
+
+def _allocateARM64(allocator, type):
+    if not type.isStruct:
+        return allocator.scalar(type)
+
+    members = _homogeneousFloatMembers(type)
+    if members:
+        registers = allocator.floats(len(members))
+        if registers:
+            pieces = [(offset, member.size) for offset, member in members]
+            return ArgumentLocation("registers", registers, pieces, 0, None)
+        return allocator.stack(type)
+    if type.size > 16:
+        pointer = allocator.scalar(POINTER_TYPE)
+        return ArgumentLocation("indirect", [], [], 0, pointer)
+    count = -(-type.size // WORD_SIZE)
+    registers = allocator.integers(count)
+    if registers:
+        pieces = [
+            (i * WORD_SIZE, min(WORD_SIZE, type.size - i * WORD_SIZE))
+            for i in range(count)
+        ]
+        return ArgumentLocation("registers", registers, pieces, 0, None)
+    return allocator.stack(type)
+
+
+def _allocateX86_64(allocator, type):
+    if not type.isStruct:
+        return allocator.scalar(type)
+
+    if type.size > 16:
+        return allocator.stack(type)
+
+    # Each eightbyte goes in an SSE register if it only holds floating point
+    # members, in a general purpose register otherwise.
+    eightbytes = []
+    for start in range(0, type.size, WORD_SIZE):
+        codes = set(
+            scalar.code
+            for offset, scalar in type.scalars()
+            if start <= offset < start + WORD_SIZE
+        )
+        isFloat = bool(codes) and codes <= set(FLOAT_CODES)
+        eightbytes.append((start, min(WORD_SIZE, type.size - start), isFloat))
+
+    floatCount = sum(1 for _, _, isFloat in eightbytes if isFloat)
+    integerCount = len(eightbytes) - floatCount
+    abi = allocator.abi
+    floatsLeft = len(abi.floatRegisters) - allocator.floatIndex
+    integersLeft = len(abi.integerRegisters) - allocator.integerIndex
+    if floatCount > floatsLeft or integerCount > integersLeft:
+        return allocator.stack(type)
+
+    registers = []
+    pieces = []
+    for start, size, isFloat in eightbytes:
+        if isFloat:
+            registers.extend(allocator.floats(1))
+        else:
+            registers.extend(allocator.integers(1))
+        pieces.append((start, size))
+    return ArgumentLocation("registers", registers, pieces, 0, None)
+
+
+ALLOCATORS = {"x86_64": _allocateX86_64, "arm64": _allocateARM64}
+
+
+def argumentLocations(types, abi, returnType=None):
+    """
+    Returns where each of the argument types is passed, following the calling
+    convention of `abi`. Variadic arguments aren't supported.
+
+    On x86_64 a struct larger than 16 bytes is returned through a hidden
+    pointer passed in the first integer register, which moves the arguments
+    down one register (the `_stret` methods), so `returnType` is needed to
+    place them. arm64 passes that pointer in x8, which isn't an argument
+    register.
+    """
+    allocator = _Allocator(abi)
+    allocate = ALLOCATORS[abi.name]
+    if (
+        abi.name == "x86_64"
+        and returnType is not None
+        and returnType.isStruct
+        and returnType.size > 16
+    ):
+        allocator.integers(1)
+    return [allocate(allocator, type) for type in types]
+
+
+def abiForTarget(target):
+    return ABIS.get(target.GetTriple().split("-")[0])
+
+
+def frameRegisters(frame):
+    """
+    Returns the registers of `frame` by name, fetched in a single
+    SBFrame.GetRegisters() pass.
+    """
+    registers = {}
+    for registerSet in frame.GetRegisters():
+        for register in registerSet:
+            registers[register.GetName()] = register
+    return registers
+
+
+def _registerBytes(registers, names):
+    for name in names:
+        register = registers.get(name)
+        if register is None:
+            continue
+        data = register.GetData()
+        error = lldb.SBError()
+        raw = data.ReadRawData(error, 0, data.GetByteSize())
+        if error.Success() and raw:
+            return bytes(raw)
+    return None
+
+
+class FBFrameArguments:
+    """
+    Reads the arguments of the function running in `frame`, straight from its
+    registers and stack without evaluating any expression. The registers are
+    fetched in one SBFrame.GetRegisters() pass and the stack arguments in one
+    memory read.
+
+    Argument registers are only guaranteed to hold the arguments on entry to
+    the function (`atEntry`), later on they may have been reused.
+    """
+
+    def __init__(self, frame, abi=None):
+        self.frame = frame
+        self.process = frame.GetThread().GetProcess()
+        self.abi = abi or abiForTarget(self.process.GetTarget())
+        if self.abi is None:
+            triple = self.process.GetTarget().GetTriple()
+            raise FBArgumentError("Unsupported architecture {}".format(triple))
+        self._registers = None
+        self._stack = None
+
+    @property
+    def registers(self):
+        if self._registers is None:
+            self._registers = frameRegisters(self.frame)
+        return self._registers
+
+    @property
+    def _start(self):
+        start = self.frame.GetSymbol().GetStartAddress()
+        return start.GetLoadAddress(self.process.GetTarget())
+
+    @property
+    def atEntry(self):
+        """
+        Whether the frame is stopped at the first instruction of its function,
+        or just after its prologue, where symbolic breakpoints on functions
+        with debug info stop. The argument registers still hold the arguments.
+        """
+        start = self._start
+        prologueEnd = start + self.frame.GetSymbol().GetPrologueByteSize()
+        return self.frame.GetPC() in (start, prologueEnd)
+
+    @property
+    def stackAddress(self):
+        # Before the prologue runs the stack arguments are at the stack
+        # pointer, after it they are above the saved frame pointer and return
+        # address.
+        if self.frame.GetPC() == self._start:
+            return self.frame.GetSP() + self.abi.entryStackOffset
+        return self.frame.GetFP() + FRAME_STACK_OFFSET
+
+    def _stackBytes(self, offset, size, stackSize):
+        if self._stack is None:
+            error = lldb.SBError()
+            data = profile.readMemory(self.process, self.stackAddress, stackSize, error)
+            self._stack = bytes(data) if error.Success() and data else b""
+        if offset + size > len(self._stack):
+            return None
+        return self._stack[offset : offset + size]
+
+    def read(self, types, indexes=None, returnType=None):
+        """
+        Returns the bytes of an argument of each of the types, in order, or None
+        for arguments that couldn't be read. With `indexes`, only the arguments
+        at those indexes are read (the types of the arguments before them are
+        still needed to know where they are). See argumentLocations for
+        `returnType`.
+        """
+        locations = argumentLocations(types, self.abi, returnType)
+        stackSize = max(
+            [
+                location.offset + type.size
+                for type, location in zip(types, locations)
+                if location.kind == "stack"
+            ]
+            + [
+                location.pointer.offset + WORD_SIZE
+                for location in locations
+                if location.kind == "indirect" and location.pointer.kind == "stack"
+            ]
+            + [0]
+        )
+        if indexes is None:
+            indexes = range(len(types))
+        return [
+            self._readLocation(types[index], locations[index], stackSize)
+            for index in indexes
+        ]
+
+    def argument(self, index, type="@", signature=None):
+        """
+        Returns the value of the argument at `index` (self is 0 for methods,
+        _cmd 1), unpacked by ArgumentType.unpack, or None if it can't be read.
+
+        `type` is the type encoding of the argument. The arguments before it
+        are assumed to be words (objects, pointers or integers), unless
+        `signature` is the full method type encoding, return type included, as
+        returned by method_getTypeEncoding (like `v40@0:8@16d24`), which is
+        needed when floating point or struct arguments come first.
+        """
+        returnType = None
+        if signature:
+            returnType, *types = parseMethodTypeEncoding(signature)
+        else:
+            types = [POINTER_TYPE] * index + [parseTypeEncoding(type)]
+        if index >= len(types):
+            raise FBArgumentError("No argument {} in {}".format(index, signature))
+        data = self.read(types, [index], returnType)[0]
+        return types[index].unpack(data) if data is not None else None
+
+    def _readLocation(self, type, location, stackSize):
+        if location.kind == "stack":
+            return self._stackBytes(location.offset, type.size, stackSize)
+        if location.kind == "indirect":
+            pointer = self._readLocation(POINTER_TYPE, location.pointer, stackSize)
+            if pointer is None:
+                return None
+            error = lldb.SBError()
+            address = struct.unpack("<Q", pointer)[0]
+            data = profile.readMemory(self.process, address, type.size, error)
+            return bytes(data) if error.Success() and data else None
+
+        value = bytearray(type.size)
+        for register, (offset, size) in zip(location.registers, location.pieces):
+            raw = _registerBytes(self.registers, register)
+            if raw is None or len(raw) < size:
+                return None
+            value[offset : offset + size] = raw[:size]
+        return bytes(value)
+
+
+def argumentAtIndex(frame, index, type="@", signature=None):
+    """
+    Returns the value of the argument at `index` of the function running in
+    `frame`, see FBFrameArguments.argument. Doesn't evaluate any expression, so
+    it can be used in breakpoint callbacks that run often.
+    """
+    return FBFrameArguments(frame).argument(index, type, signature)
+
+
+def entryArgumentExpression(abi, index, type="id"):
+    """
+    Returns an expression for the word-sized argument at `index` (self is 0
+    for methods) on entry to a function, reading its register or its stack
+    slot, for use in breakpoint conditions.
+    """
+    location = argumentLocations([POINTER_TYPE] * (index + 1), abi)[index]
+    if location.kind == "registers":
+        return "({})${}".format(type, location.registers[0][0])
+    return "*({} *)($sp + {})".format(type, abi.entryStackOffset + location.offset)
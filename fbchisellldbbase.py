@@ -5,9 +5,13 @@
 # This source code is licensed under the MIT license found in the
 # LICENSE file in the root directory of this source tree.
 
+import collections
+import itertools
 import json
 import shlex
 
+import fbchisellldbcache as cache
+import fbchisellldbprofile as profile
 import lldb
 
 
@@ -56,7 +60,7 @@ def isSuccess(error):
 def importModule(frame, module):
     options = lldb.SBExpressionOptions()
     options.SetLanguage(lldb.eLanguageTypeObjC)
-    value = frame.EvaluateExpression("@import " + module, options)
+    value = profile.evaluateExpression(frame, "@import " + module, options)
     return isSuccess(value.error)
 
 
@@ -89,7 +93,7 @@ def evaluateExpressionValue(
     # Most Chisel commands are not multithreaded.
     options.SetTryAllThreads(tryAllThreads)
 
-    value = frame.EvaluateExpression(expression, options)
+    value = profile.evaluateExpression(frame, expression, options)
     error = value.GetError()
 
     # Retry if the error could be resolved by first importing UIKit.
@@ -98,7 +102,7 @@ def evaluateExpressionValue(
         and error.value == lldb.eExpressionParseError
         and importModule(frame, "UIKit")
     ):
-        value = frame.EvaluateExpression(expression, options)
+        value = profile.evaluateExpression(frame, expression, options)
         error = value.GetError()
 
     if printErrors and not isSuccess(error):
@@ -120,7 +124,7 @@ def evaluateInputExpression(expression, printErrors=True):
     )
     options = lldb.SBExpressionOptions()
     options.SetTrapExceptions(False)
-    value = frame.EvaluateExpression(expression, options)
+    value = profile.evaluateExpression(frame, expression, options)
     error = value.GetError()
 
     if printErrors and error.Fail():
@@ -169,7 +173,7 @@ def evaluateCStringExpression(expression, printErrors=True):
 
     process = lldb.debugger.GetSelectedTarget().GetProcess()
     error = lldb.SBError()
-    ret = process.ReadCStringFromMemory(int(ret, 16), 256, error)
+    ret = profile.readMemory(process, int(ret, 16), 256, error, cString=True)
     if error.Success():
         return ret
     else:
@@ -207,29 +211,285 @@ def check_expr(expr):
 # Example:
 #       >>> fbchisellldbbase.evaluate('NSString *str = @"hello world"; RETURN(@{@"key": str});')
 #       {u'key': u'hello world'}
-def evaluate(expr):
+def evaluate(expr, printErrors=True):
     if not check_expr(expr):
         raise Exception(
             "Invalid Expression, the last expression not include a RETURN family marco"
         )
 
     command = "({" + RETURN_MACRO + "\n" + expr + "})"
-    ret = evaluateExpressionValue(command, printErrors=True)
+    ret = evaluateExpressionValue(command, printErrors=printErrors)
+    return _jsonResult(ret, printErrors)
+
+
+# Reads the JSON string produced by the RETURN macro.
+def _jsonResult(ret, printErrors=True):
     if not ret.GetError().Success():
-        print(ret.GetError())
+        if printErrors:
+            print(ret.GetError())
         return None
     else:
         process = lldb.debugger.GetSelectedTarget().GetProcess()
         error = lldb.SBError()
-        ret = process.ReadCStringFromMemory(int(ret.GetValue(), 16), 2**20, error)
+        address = int(ret.GetValue(), 16)
+        ret = profile.readMemory(process, address, 2**20, error, cString=True)
+        if error.Success() and len(ret.encode("utf-8")) >= 2**20 - 1:
+            # The result didn't fit, it's likely a large snapshot. Read it again
+            # using its exact length.
+            length = int(
+                evaluateExpression("(size_t)strlen((char *){})".format(address))
+            )
+            ret = profile.readMemory(process, address, length, error)
+            if error.Success():
+                ret = ret.decode("utf-8")
         if not error.Success():
-            print(error)
+            if printErrors:
+                print(error)
             return None
         else:
             ret = json.loads(ret)
             return ret["return"]
 
 
+# Wraps each queued expression so that its value can be returned as part of a
+# JSON array. The key is the kind of result the caller expects back.
+BATCH_BOXES = {
+    "boolean": "[NSNumber numberWithBool:(BOOL)({})]",
+    "integer": "[NSNumber numberWithLongLong:(long long)({})]",
+    "object": '[NSString stringWithFormat:@"0x%016lx", (unsigned long)(id)({})]',
+    "pointer": '[NSString stringWithFormat:@"0x%016lx", (unsigned long)(void *)({})]',
+    "string": "((id)({}) ?: (id)[NSNull null])",
+    "description": "((id)[(id)({}) debugDescription] ?: (id)[NSNull null])",
+}
+
+# Upper bound on the number of expressions sent in a single round trip, to keep
+# the size of the generated expression reasonable.
+BATCH_LIMIT = 512
+
+
+class FBExpressionFuture:
+    """
+    The lazily computed result of an expression queued on an FBExpressionBatch.
+    Calling result() flushes the batch if the expression hasn't run yet.
+    """
+
+    def __init__(self, batch, expression, kind, transform=None):
+        self.batch = batch
+        self.expression = expression
+        self.kind = kind
+        self.transform = transform
+        self.resolved = False
+        self.value = None
+
+    def resolve(self, value):
+        self.value = value
+        self.resolved = True
+
+    def result(self):
+        if not self.resolved:
+            self.batch.flush()
+        if self.transform:
+            return self.transform(self.value)
+        return self.value
+
+
+class FBExpressionBatch:
+    """
+    Collects expressions and evaluates them in a single round trip.
+
+    Example:
+        with fb.batch() as batch:
+            isView = batch.add("[(id)obj isKindOfClass:[UIView class]]", "boolean")
+            name = objecthelpers.className("obj", batch=batch)
+        print(isView.result(), name.result())
+
+    Each queued expression is wrapped in @try/@catch, so an exception only fails
+    the one expression (its result is None). If the combined expression fails to
+    compile, every expression is evaluated separately as a fallback.
+    """
+
+    def __init__(self, printErrors=True):
+        self.printErrors = printErrors
+        self.pending = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, excType, excValue, traceback):
+        if excType is None:
+            self.flush()
+
+    def add(self, expression, kind="object", transform=None):
+        if kind not in BATCH_BOXES:
+            raise Exception("Unknown batch result kind: " + kind)
+        future = FBExpressionFuture(self, expression, kind, transform)
+        self.pending.append(future)
+        return future
+
+    def flush(self):
+        while self.pending:
+            futures = self.pending[:BATCH_LIMIT]
+            self.pending = self.pending[BATCH_LIMIT:]
+            self._evaluate(futures)
+
+    def _evaluate(self, futures):
+        lines = ["NSMutableArray *__chisel_batch = (id)[NSMutableArray array];"]
+        for future in futures:
+            box = BATCH_BOXES[future.kind].format(future.expression)
+            lines.append(
+                "@try { [__chisel_batch addObject:" + box + "]; } "
+                "@catch (NSException *__e) { [__chisel_batch addObject:(id)[NSNull null]]; }"
+            )
+        lines.append("RETURN(__chisel_batch);")
+
+        results = evaluate("\n".join(lines), printErrors=False)
+        if results is None or len(results) != len(futures):
+            results = [
+                _evaluateSingle(future.expression, future.kind, self.printErrors)
+                for future in futures
+            ]
+
+        for future, value in zip(futures, results):
+            future.resolve(value)
+
+
+# Evaluates one queued expression on its own, boxed and returned the same way
+# as in a batch, so that results have the same format either way.
+def _evaluateSingle(expression, kind, printErrors):
+    box = BATCH_BOXES[kind].format(expression)
+    results = evaluate(
+        "id __chisel_single = (id)[NSNull null];\n"
+        "@try { __chisel_single = " + box + "; } @catch (NSException *__e) {}\n"
+        "NSArray *__chisel_result = @[__chisel_single ?: (id)[NSNull null]];\n"
+        "RETURN(__chisel_result);",
+        printErrors=printErrors,
+    )
+    return results[0] if results else None
+
+
+def batch(printErrors=True):
+    return FBExpressionBatch(printErrors)
+
+
+# Evaluates a list of expressions of the same kind in a single round trip, and
+# returns their results in order.
+def evaluateMany(expressions, kind="object", printErrors=True):
+    with batch(printErrors) as expressionBatch:
+        futures = [expressionBatch.add(expression, kind) for expression in expressions]
+    return [future.result() for future in futures]
+
+
+# Every expression template that has been declared, by name. Used by
+# `chiselcache`.
+templates = collections.OrderedDict()
+
+# The persistent variables holding compiled templates, keyed by template source.
+# Compiled code doesn't survive a relaunch, so entries are per process.
+_compiledTemplates = cache.FBStopCache("expressionTemplates", perStop=False)
+_templateVariableNumbers = itertools.count()
+
+
+class FBExpressionTemplate:
+    """
+    An expression that is compiled once per process, into a block stored in a
+    persistent variable, and then called with different arguments. Each call
+    only has to compile the call itself, instead of the whole body.
+
+    Example:
+        TARGET_ACTIONS = fb.FBExpressionTemplate(
+            "targetActions",
+            "id",
+            [("id", "control"), ("id", "target")],
+            "return [control actionsForTarget:target forControlEvent:0];",
+        )
+        actions = TARGET_ACTIONS.evaluate(control, target)
+
+    A template returning `char *` from the RETURN macro (`return RETURN(obj);`)
+    can be called with evaluateJSON(). If the block can't be compiled, calls
+    fall back to evaluating the body inline.
+    """
+
+    def __init__(self, name, returnType, parameters, body):
+        self.name = name
+        self.returnType = returnType
+        self.parameters = parameters
+        self.body = body
+        self.resetCounters()
+        templates[name] = self
+
+    def resetCounters(self):
+        self.compiles = 0
+        self.calls = 0
+        self.fallbacks = 0
+
+    @property
+    def source(self):
+        return "^{}({}) {{\n{}\n}}".format(
+            self.returnType,
+            ", ".join(type + " " + name for type, name in self.parameters),
+            self.body,
+        )
+
+    def _declaration(self, variable):
+        return "{} (^{})({})".format(
+            self.returnType,
+            variable,
+            ", ".join(type for type, _ in self.parameters),
+        )
+
+    def _compile(self):
+        variable = "$__chisel_template_{}".format(next(_templateVariableNumbers))
+        value = evaluateExpressionValue(
+            "{}\n{} = {};".format(
+                RETURN_MACRO, self._declaration(variable), self.source
+            ),
+            printErrors=False,
+        )
+        if not isSuccess(value.GetError()):
+            return None
+        self.compiles += 1
+        return variable
+
+    def value(self, *arguments, **kwargs):
+        """Calls the template with expressions as arguments, returns an SBValue."""
+        printErrors = kwargs.get("printErrors", True)
+        if len(arguments) != len(self.parameters):
+            raise Exception(
+                "{} takes {} arguments, {} given".format(
+                    self.name, len(self.parameters), len(arguments)
+                )
+            )
+
+        self.calls += 1
+        callArguments = ", ".join(
+            "({})({})".format(type, argument)
+            for (type, _), argument in zip(self.parameters, arguments)
+        )
+        variable = _compiledTemplates.get(self.source, self._compile)
+        if variable:
+            call = "({}){}({})".format(self.returnType, variable, callArguments)
+        else:
+            self.fallbacks += 1
+            call = "({{{}\n{} = {}; ({})__chisel_template({});}})".format(
+                RETURN_MACRO,
+                self._declaration("__chisel_template"),
+                self.source,
+                self.returnType,
+                callArguments,
+            )
+        return evaluateExpressionValue(call, printErrors=printErrors)
+
+    def evaluate(self, *arguments, **kwargs):
+        return self.value(*arguments, **kwargs).GetValue()
+
+    def describe(self, *arguments, **kwargs):
+        return self.value(*arguments, **kwargs).GetObjectDescription()
+
+    def evaluateJSON(self, *arguments, **kwargs):
+        printErrors = kwargs.get("printErrors", True)
+        return _jsonResult(self.value(*arguments, **kwargs), printErrors)
+
+
 def currentLanguage():
     return (
         lldb.debugger.GetSelectedTarget()
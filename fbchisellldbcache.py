@@ -0,0 +1,122 @@
+#!/usr/bin/python
+
+# Copyright (c) Facebook, Inc. and its affiliates. All Rights Reserved
+#
+# This source code is licensed under the MIT license found in the
+# LICENSE file in the root directory of this source tree.
+
+import collections
+import functools
+
+import lldb
+
+
+# Every cache that has been created, by name. Used by `chiselcache`.
+caches = collections.OrderedDict()
+
+
+def currentProcessKey():
+    process = lldb.debugger.GetSelectedTarget().GetProcess()
+    if not process.IsValid():
+        return None
+    return process.GetUniqueID()
+
+
+# Identifies the current stop of the current process. The stop ID changes every
+# time the process resumes (which includes an exec), but not for the internal
+# resumes used to run expressions.
+def currentStopKey():
+    process = lldb.debugger.GetSelectedTarget().GetProcess()
+    if not process.IsValid():
+        return None
+    return (process.GetUniqueID(), process.GetStopID())
+
+
+class FBStopCache:
+    """
+    An LRU cache that drops its entries whenever the process stops again
+    (perStop=True) or is relaunched (perStop=False).
+    """
+
+    def __init__(self, name, maxSize=1024, perStop=True):
+        self.name = name
+        self.maxSize = maxSize
+        self.perStop = perStop
+        self.entries = collections.OrderedDict()
+        self.scope = None
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        caches[name] = self
+
+    def validate(self):
+        scope = currentStopKey() if self.perStop else currentProcessKey()
+        if scope != self.scope:
+            if self.entries:
+                self.invalidations += 1
+                self.entries.clear()
+            self.scope = scope
+
+    def get(self, key, compute):
+        self.validate()
+        if key in self.entries:
+            self.hits += 1
+            self.entries.move_to_end(key)
+            return self.entries[key]
+
+        self.misses += 1
+        value = compute()
+        self.entries[key] = value
+        if len(self.entries) > self.maxSize:
+            self.entries.popitem(last=False)
+            self.evictions += 1
+        return value
+
+    # Stores a value, replacing the cached one.
+    def put(self, key, value):
+        self.validate()
+        self.entries[key] = value
+        self.entries.move_to_end(key)
+        if len(self.entries) > self.maxSize:
+            self.entries.popitem(last=False)
+            self.evictions += 1
+
+    # Returns the cached value without computing it, or None.
+    def peek(self, key):
+        self.validate()
+        return self.entries.get(key)
+
+    def clear(self):
+        if self.entries:
+            self.invalidations += 1
+        self.entries.clear()
+
+    def resetCounters(self):
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+
+# Memoizes a function on its (hashable) arguments, for the current stop or the
+# current process.
+def memoize(name, maxSize=1024, perStop=True):
+    def decorator(function):
+        cache = FBStopCache(name, maxSize, perStop)
+
+        @functools.wraps(function)
+        def memoized(*args):
+            return cache.get(args, lambda: function(*args))
+
+        memoized.cache = cache
+        return memoized
+
+    return decorator
+
+
+# Drops every cached value, for events the stop ID doesn't capture, such as
+# loading a library from an expression.
+def invalidateAll():
+    for cache in caches.values():
+        cache.clear()
@@ -0,0 +1,446 @@
+#!/usr/bin/python
+
+# Copyright (c) Facebook, Inc. and its affiliates. All Rights Reserved
+#
+# This source code is licensed under the MIT license found in the
+# LICENSE file in the root directory of this source tree.
+
+import os
+import struct
+import time
+
+import fbchisellldbbase as fb
+import fbchisellldbcache as cache
+import fbchisellldbmemoryhelpers as memory
+import lldb
+
+
+# Number of classes sent to the process per expression.
+CLASS_BATCH_SIZE = 4096
+
+# Layout of CHLInstanceCensus and CHLInstanceRecord, see CHLObjcInstanceCommands.h.
+CENSUS_HEADER = struct.Struct("<Q")
+INSTANCE_RECORD = struct.Struct("<QQQ")
+
+# Layout of CHLClassCensus and CHLClassRecord.
+CLASS_RECORD = struct.Struct("<QQQ")
+
+# Returns the name and superclass of each class.
+CLASS_INFO_EXPRESSION = """
+unsigned long long __classes[] = {{ {classes} }};
+NSMutableArray *__infos = [NSMutableArray array];
+for (unsigned int __i = 0; __i < {count}; __i++) {{
+    Class __class = (Class)__classes[__i];
+    [__infos addObject:@[
+        (id)[NSString stringWithUTF8String:(const char *)class_getName(__class)],
+        (id)[NSNumber numberWithUnsignedLongLong:(unsigned long long)class_getSuperclass(__class)],
+    ]];
+}}
+RETURN(__infos);
+"""
+
+# Returns the classes that conform to the protocol, directly or through a
+# superclass.
+CONFORMING_CLASSES_EXPRESSION = """
+Protocol *__protocol = (Protocol *)objc_getProtocol("{protocol}");
+unsigned long long __classes[] = {{ {classes} }};
+NSMutableArray *__conforming = [NSMutableArray array];
+for (unsigned int __i = 0; __protocol && __i < {count}; __i++) {{
+    for (Class __class = (Class)__classes[__i]; __class; __class = (Class)class_getSuperclass(__class)) {{
+        if ((BOOL)class_conformsToProtocol(__class, __protocol)) {{
+            [__conforming addObject:(id)[NSNumber numberWithUnsignedLongLong:__classes[__i]]];
+            break;
+        }}
+    }}
+}}
+RETURN(__conforming);
+"""
+
+
+def chiselLibraryPath():
+    # script os.environ['CHISEL_LIBRARY_PATH'] = '/path/to/custom/Chisel'
+    path = os.getenv("CHISEL_LIBRARY_PATH")
+    if path and os.path.exists(path):
+        return path
+
+    source_dir = os.path.dirname(__file__)
+    # ugh: .. is to back out of libexec/
+    return os.path.join(source_dir, "..", "lib", "Chisel.framework", "Chisel")
+
+
+def hasFunction(name):
+    target = lldb.debugger.GetSelectedTarget()
+    symbol_contexts = target.FindSymbols(name, lldb.eSymbolTypeCode)
+    return any(ctx.symbol.IsValid() for ctx in symbol_contexts)
+
+
+def loadChiselIfNecessary():
+    if hasFunction("PrintInstances"):
+        return True
+
+    path = chiselLibraryPath()
+    if not os.path.exists(path):
+        print("Chisel library missing: " + path)
+        return False
+
+    target = lldb.debugger.GetSelectedTarget()
+    module = fb.evaluateExpressionValue('(void*)dlopen("{}", 2)'.format(path))
+    if module.unsigned != 0 or target.module["Chisel"]:
+        # Loading a library adds classes without the process stopping again.
+        cache.invalidateAll()
+        return True
+
+    # `errno` is a macro that expands to a call to __error(). In development,
+    # lldb was not getting a correct value for `errno`, so `__error()` is used.
+    errno = fb.evaluateExpressionValue("*(int*)__error()").value
+    error = fb.evaluateExpressionValue("(char*)dlerror()")
+    if errno == 50:
+        # KERN_CODESIGN_ERROR from <mach/kern_return.h>
+        print("Error loading Chisel: Code signing failure; Must re-run codesign")
+    elif error.unsigned != 0:
+        print("Error loading Chisel: " + error.summary)
+    elif errno != 0:
+        error = fb.evaluateExpressionValue("(char*)strerror({})".format(errno))
+        if error.unsigned != 0:
+            print("Error loading Chisel: " + error.summary)
+        else:
+            print("Error loading Chisel (errno {})".format(errno))
+    else:
+        print("Unknown error loading Chisel")
+
+    return False
+
+
+def hasInstanceCensus():
+    # Libraries built before the census was added only have PrintInstances.
+    return hasFunction("CHLCopyInstanceCensus")
+
+
+def hasClassCensus():
+    return hasFunction("CHLCopyClassCensus")
+
+
+class FBClassInfo:
+    def __init__(self, address, name, superclass):
+        self.address = address
+        self.name = name
+        self.superclass = superclass
+
+
+class FBHeapCensus:
+    """
+    Every viable Objective-C instance on the heap at one stop, as
+    (address, class, size) records in heap order.
+    """
+
+    def __init__(self, buffer, records, classes, scanSeconds):
+        self.buffer = buffer
+        self.records = records
+        self.classes = classes
+        self.scanSeconds = scanSeconds
+        self.instanceClasses = {record[1] for record in records}
+
+    def recordsOfClasses(self, classes):
+        return [record for record in self.records if record[1] in classes]
+
+    def superclasses(self, cls):
+        info = self.classes.get(cls)
+        while info:
+            yield info.address
+            info = self.classes.get(info.superclass)
+
+    def className(self, cls):
+        info = self.classes.get(cls)
+        return info.name if info else "0x{:x}".format(cls)
+
+
+_censusCache = cache.FBStopCache("heapCensus", maxSize=1)
+
+# The census buffer of the most recent census, kept alive in the process for
+# predicate queries and freed when it's replaced.
+_liveCensusBuffer = None
+
+
+def instanceCensus(refresh=False):
+    """
+    Returns the heap census of the current stop and whether it was just taken.
+    The heap is only scanned once per stop, unless `refresh` is set.
+    """
+    if refresh:
+        _censusCache.clear()
+
+    scanned = []
+
+    def takeCensus():
+        census = _takeInstanceCensus()
+        scanned.append(census)
+        return census
+
+    census = _censusCache.get("census", takeCensus)
+    if census is None:
+        _censusCache.clear()
+    return census, bool(scanned)
+
+
+def _takeInstanceCensus():
+    global _liveCensusBuffer
+
+    _freeLiveCensusBuffer()
+
+    start = time.time()
+    value = fb.evaluateExpressionValue("(void *)CHLCopyInstanceCensus()")
+    if not value.GetError().Success() or not value.unsigned:
+        print("Could not take a heap census: {}".format(value.GetError()))
+        return None
+    buffer = value.unsigned
+    _liveCensusBuffer = (cache.currentProcessKey(), buffer)
+
+    header = memory.readMemory(buffer, CENSUS_HEADER.size)
+    (count,) = CENSUS_HEADER.unpack(bytes(header))
+    table = memory.readMemory(
+        buffer + CENSUS_HEADER.size, count * INSTANCE_RECORD.size, "Census"
+    )
+    records = list(INSTANCE_RECORD.iter_unpack(table))
+    classes = classInfo({cls for _, cls, _ in records})
+    return FBHeapCensus(buffer, records, classes, time.time() - start)
+
+
+class FBClassCensusRow:
+    def __init__(self, name, count, size):
+        self.name = name
+        self.count = count
+        self.size = size
+
+    @property
+    def averageSize(self):
+        return float(self.size) / self.count if self.count else 0.0
+
+
+class FBClassCensus:
+    """
+    The number of instances of each class, and their total malloc size, keyed
+    by class name.
+    """
+
+    def __init__(self, rows, scanSeconds):
+        self.rows = rows
+        self.scanSeconds = scanSeconds
+        self.stopKey = cache.currentStopKey()
+
+    @property
+    def instanceCount(self):
+        return sum(row.count for row in self.rows.values())
+
+    @property
+    def totalSize(self):
+        return sum(row.size for row in self.rows.values())
+
+
+_classCensusCache = cache.FBStopCache("classCensus", maxSize=1)
+
+
+def classCensus(refresh=False):
+    """
+    Returns the per-class census of the current stop, and whether the heap was
+    just scanned for it. An instance census already taken at this stop (by
+    findinstances) is aggregated instead of scanning again.
+    """
+    if refresh:
+        _censusCache.clear()
+        _classCensusCache.clear()
+
+    scanned = []
+
+    def takeCensus():
+        instanceCensus = _censusCache.peek("census")
+        if instanceCensus:
+            return _aggregateInstanceCensus(instanceCensus)
+        census = _takeClassCensus()
+        scanned.append(census)
+        return census
+
+    census = _classCensusCache.get("census", takeCensus)
+    if census is None:
+        _classCensusCache.clear()
+    return census, bool(scanned)
+
+
+def _aggregateInstanceCensus(instanceCensus):
+    rows = {}
+    for _, cls, size in instanceCensus.records:
+        name = instanceCensus.className(cls)
+        row = rows.get(name)
+        if row is None:
+            row = rows[name] = FBClassCensusRow(name, 0, 0)
+        row.count += 1
+        row.size += size
+    return FBClassCensus(rows, instanceCensus.scanSeconds)
+
+
+def _takeClassCensus():
+    start = time.time()
+    value = fb.evaluateExpressionValue("(void *)CHLCopyClassCensus()")
+    if not value.GetError().Success() or not value.unsigned:
+        print("Could not take a heap census: {}".format(value.GetError()))
+        return None
+
+    buffer = value.unsigned
+    try:
+        header = memory.readMemory(buffer, CENSUS_HEADER.size)
+        (count,) = CENSUS_HEADER.unpack(bytes(header))
+        table = memory.readMemory(
+            buffer + CENSUS_HEADER.size, count * CLASS_RECORD.size, "Census"
+        )
+    finally:
+        fb.evaluateEffect("(void)free((void *){})".format(buffer))
+
+    records = list(CLASS_RECORD.iter_unpack(table))
+    classes = classInfo({cls for cls, _, _ in records}, withSuperclasses=False)
+
+    rows = {}
+    for cls, count, size in records:
+        info = classes.get(cls)
+        name = info.name if info else "0x{:x}".format(cls)
+        if name in rows:
+            # Distinct classes can share a name, for example across images.
+            rows[name].count += count
+            rows[name].size += size
+        else:
+            rows[name] = FBClassCensusRow(name, count, size)
+    return FBClassCensus(rows, time.time() - start)
+
+
+def _freeLiveCensusBuffer():
+    global _liveCensusBuffer
+
+    if _liveCensusBuffer:
+        processKey, buffer = _liveCensusBuffer
+        if processKey == cache.currentProcessKey():
+            fb.evaluateEffect("(void)free((void *){})".format(buffer))
+        _liveCensusBuffer = None
+
+
+def _classList(classes):
+    return ", ".join("0x{:x}".format(cls) for cls in classes)
+
+
+def _batches(items):
+    items = list(items)
+    for start in range(0, len(items), CLASS_BATCH_SIZE):
+        yield items[start : start + CLASS_BATCH_SIZE]
+
+
+def classInfo(classes, withSuperclasses=True):
+    """
+    Returns the name and superclass of the given classes and, unless
+    `withSuperclasses` is False, of all their superclasses. Each level of the
+    hierarchy is fetched in one expression.
+    """
+    infos = {}
+    pending = set(classes)
+    while pending:
+        for batch in _batches(pending):
+            results = fb.evaluate(
+                CLASS_INFO_EXPRESSION.format(
+                    classes=_classList(batch), count=len(batch)
+                )
+            )
+            if results is None:
+                return infos
+            for cls, (name, superclass) in zip(batch, results):
+                infos[cls] = FBClassInfo(cls, name, superclass)
+
+        pending = {
+            info.superclass
+            for info in infos.values()
+            if withSuperclasses and info.superclass and info.superclass not in infos
+        }
+    return infos
+
+
+@cache.memoize("classesConformingToProtocol")
+def classesConformingToProtocol(protocol, classes):
+    conforming = set()
+    for batch in _batches(sorted(classes)):
+        results = fb.evaluate(
+            CONFORMING_CLASSES_EXPRESSION.format(
+                protocol=protocol, classes=_classList(batch), count=len(batch)
+            )
+        )
+        conforming.update(results or [])
+    return frozenset(conforming)
+
+
+def isKnownType(name):
+    return fb.evaluateBooleanExpression(
+        '(BOOL)(objc_getClass("{0}") != nil || objc_getProtocol("{0}") != nil)'.format(
+            name
+        )
+    )
+
+
+def classesMatchingType(census, type):
+    """
+    Returns the classes of the census that match a findinstances type: a class
+    and its subclasses, only the class itself when prefixed with `*`, or the
+    classes conforming to a protocol. Swift classes can be given without their
+    module name.
+    """
+    exact = type.startswith("*")
+    name = type[1:] if exact else type
+
+    matches = set()
+    if not exact and name != "NSObject":
+        matches |= classesConformingToProtocol(name, frozenset(census.classes))
+
+    baseClasses = {
+        info.address for info in census.classes.values() if info.name == name
+    }
+    if not baseClasses:
+        # SwiftModule.ClassName
+        baseClasses = {
+            info.address
+            for info in census.classes.values()
+            if info.name.partition(".")[2] == name
+        }
+
+    if exact:
+        matches |= baseClasses & census.instanceClasses
+    else:
+        for cls in census.instanceClasses:
+            if not baseClasses.isdisjoint(census.superclasses(cls)):
+                matches.add(cls)
+    return matches
+
+
+def matchingInstanceDescriptions(census, classes, predicate):
+    """
+    Evaluates an NSPredicate on the instances of the given classes in the
+    census, and returns a description line for each match.
+    """
+    # Escape double quotes and backslashes.
+    predicate = predicate.replace("\\", "\\\\").replace('"', '\\"')
+    value = fb.evaluateExpressionValue(
+        """
+        unsigned long long __classes[] = {{ {classes} }};
+        (char *)CHLCopyMatchingInstances((const void *){census}, __classes, {count}, "{predicate}");
+        """.format(
+            classes=_classList(classes) or "0",
+            census=census.buffer,
+            count=len(classes),
+            predicate=predicate,
+        )
+    )
+    if not value.GetError().Success() or not value.unsigned:
+        print(value.GetError())
+        return []
+
+    address = value.unsigned
+    try:
+        length = fb.evaluateIntegerExpression(
+            "(size_t)strlen((char *){})".format(address)
+        )
+        output = bytes(memory.readMemory(address, length)).decode("utf-8", "replace")
+    finally:
+        fb.evaluateEffect("(void)free((void *){})".format(address))
+    return output.splitlines()
@@ -0,0 +1,211 @@
+#!/usr/bin/python
+
+# Copyright (c) Facebook, Inc. and its affiliates. All Rights Reserved
+#
+# This source code is licensed under the MIT license found in the
+# LICENSE file in the root directory of this source tree.
+
+import json
+import re
+
+import fbchisellldbbase as fb
+import fbchisellldbmemoryhelpers as memory
+
+
+PATH_COMPONENT = re.compile(r"""\.?([^.\[\]"']+)|\[(\d+)\]|\[(["'])(.*?)\3\]""")
+
+# Key added to a truncated dictionary, and item appended to a truncated array.
+TRUNCATED_KEY = "..."
+
+# Selects the value at `path` in `object`, prunes it to `maxDepth` levels and
+# `maxItems` items per collection (-1 for no limit) and serializes it, wrapped
+# in an array so that strings and numbers can be serialized too. Returns the
+# address and length of the serialized bytes, which stay alive until the
+# process resumes.
+JSON_DATA = fb.FBExpressionTemplate(
+    "jsonData",
+    "char *",
+    [
+        ("id", "object"),
+        ("NSArray *", "path"),
+        ("NSInteger", "maxDepth"),
+        ("NSInteger", "maxItems"),
+    ],
+    """
+    id value = object;
+    for (NSUInteger i = 0; i < [path count]; i++) {
+        id component = path[i];
+        id next = nil;
+        if ([component isKindOfClass:[NSNumber class]]) {
+            NSInteger index = [component integerValue];
+            if ([value isKindOfClass:[NSArray class]] && index < (NSInteger)[value count]) {
+                next = [value objectAtIndex:index];
+            }
+        } else if ([value isKindOfClass:[NSDictionary class]]) {
+            next = [value objectForKey:component];
+        }
+        if (next == nil) {
+            return RETURN(@{@"missing": @(i), @"class": NSStringFromClass((Class)[value class]) ?: @"nil"});
+        }
+        value = next;
+    }
+
+    if (maxDepth >= 0 || maxItems >= 0) {
+        __block id (^prune)(id, NSInteger);
+        prune = ^id(id item, NSInteger depth) {
+            BOOL isDictionary = [item isKindOfClass:[NSDictionary class]];
+            if (!isDictionary && ![item isKindOfClass:[NSArray class]]) {
+                return item;
+            }
+            NSUInteger count = [item count];
+            if (maxDepth >= 0 && depth >= maxDepth) {
+                return [NSString stringWithFormat:@"<%%lu %%s>", (unsigned long)count, isDictionary ? "keys" : "items"];
+            }
+            NSUInteger limit = maxItems >= 0 ? MIN(count, (NSUInteger)maxItems) : count;
+            NSString *more = [NSString stringWithFormat:@"<%%lu more>", (unsigned long)(count - limit)];
+            if (isDictionary) {
+                NSMutableDictionary *pruned = [NSMutableDictionary dictionary];
+                NSArray *keys = [item allKeys];
+                for (NSUInteger i = 0; i < limit; i++) {
+                    id key = keys[i];
+                    pruned[key] = prune([item objectForKey:key], depth + 1);
+                }
+                if (limit < count) {
+                    pruned[@"%s"] = more;
+                }
+                return pruned;
+            }
+            NSMutableArray *pruned = [NSMutableArray array];
+            for (NSUInteger i = 0; i < limit; i++) {
+                [pruned addObject:prune([item objectAtIndex:i], depth + 1)];
+            }
+            if (limit < count) {
+                [pruned addObject:more];
+            }
+            return pruned;
+        };
+        value = prune(value, 0);
+    }
+
+    if (value == nil) {
+        return RETURN(@{@"invalid": @"nil"});
+    }
+    NSArray *wrapped = @[value];
+    if (![NSJSONSerialization isValidJSONObject:wrapped]) {
+        return RETURN(@{@"invalid": NSStringFromClass((Class)[value class])});
+    }
+    NSData *data = [NSJSONSerialization dataWithJSONObject:wrapped options:0 error:nil];
+    return RETURN(@{
+        @"bytes": [NSString stringWithFormat:@"0x%%lx", (unsigned long)[data bytes]],
+        @"length": @([data length])
+    });
+    """ % TRUNCATED_KEY,
+)
+
+
+class JSONPathError(Exception):
+    pass
+
+
+def parseJSONPath(path):
+    """
+    Parses a path like `a.b[3]` (or `a["b.c"]` for keys with dots) into its
+    components: strings for dictionary keys, ints for array indexes.
+    """
+    components = []
+    position = 0
+    path = path or ""
+    while position < len(path):
+        match = PATH_COMPONENT.match(path, position)
+        if match is None or (match.group(1) and match.group(0)[0] != "." and position):
+            raise JSONPathError("Can't parse path {} at {}".format(path, position))
+        key, index, _, quoted = match.groups()
+        if index is not None:
+            components.append(int(index))
+        else:
+            components.append(key if key is not None else quoted)
+        position = match.end()
+    return components
+
+
+def formatJSONPath(components):
+    path = ""
+    for component in components:
+        if isinstance(component, int):
+            path += "[{}]".format(component)
+        elif re.match(r"^[^.\[\]\"']+$", component):
+            path += ("." if path else "") + component
+        else:
+            path += "[{}]".format(json.dumps(component))
+    return path
+
+
+def _pathLiteral(components):
+    return "@[{}]".format(
+        ", ".join(
+            "@({})".format(c) if isinstance(c, int) else "@{}".format(json.dumps(c))
+            for c in components
+        )
+    )
+
+
+def serializeJSON(object, path=None, maxDepth=None, maxItems=None):
+    """
+    Serializes the JSON object (NSDictionary, NSArray, ...) at `path` in
+    `object` inside the process, pruned to `maxDepth` and `maxItems`, and
+    returns the address and length of the bytes. The bytes hold the value
+    wrapped in an array. Raises JSONPathError if there's no value at `path` or
+    the value can't be serialized.
+    """
+    components = parseJSONPath(path)
+    result = JSON_DATA.evaluateJSON(
+        object,
+        _pathLiteral(components),
+        -1 if maxDepth is None else maxDepth,
+        -1 if maxItems is None else maxItems,
+    )
+    if result is None:
+        raise JSONPathError("Can't serialize {}".format(object))
+    if "missing" in result:
+        found = components[: result["missing"]]
+        raise JSONPathError(
+            "No value at {} (found {} at {})".format(
+                formatJSONPath(components[: result["missing"] + 1]),
+                result["class"],
+                formatJSONPath(found) or "the root",
+            )
+        )
+    if "invalid" in result:
+        raise JSONPathError("{} isn't a valid JSON object".format(result["invalid"]))
+    return int(result["bytes"], 16), result["length"]
+
+
+def readJSON(object, path=None, maxDepth=None, maxItems=None):
+    """
+    Like serializeJSON, but reads the serialized bytes with the bulk memory
+    reader and returns the decoded value.
+    """
+    address, length = serializeJSON(object, path, maxDepth, maxItems)
+    data = memory.readMemory(address, length, label="JSON")
+    return json.loads(data.decode("utf-8"))[0]
+
+
+def jsonLines(value, pretty=True):
+    """
+    Yields the lines of `value` encoded as JSON, as they are encoded.
+    """
+    if not pretty:
+        yield json.dumps(value, ensure_ascii=False, separators=(",", ":"))
+        return
+
+    encoder = json.JSONEncoder(ensure_ascii=False, indent=2, separators=(",", ": "))
+    pending = []
+    for fragment in encoder.iterencode(value):
+        # Newlines in strings are escaped, so these only come from the indent.
+        lines = fragment.split("\n")
+        for line in lines[:-1]:
+            pending.append(line)
+            yield "".join(pending)
+            pending = []
+        pending.append(lines[-1])
+    yield "".join(pending)
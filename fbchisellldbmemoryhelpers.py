@@ -0,0 +1,292 @@
+#!/usr/bin/python
+
+# Copyright (c) Facebook, Inc. and its affiliates. All Rights Reserved
+#
+# This source code is licensed under the MIT license found in the
+# LICENSE file in the root directory of this source tree.
+
+import os
+import struct
+import time
+
+import fbchisellldbbase as fb
+import fbchisellldbprofile as profile
+import lldb
+
+
+# Memory is read from the process in chunks of this size, which bounds how much
+# of a large buffer is held in Python at any time.
+CHUNK_SIZE = 4 * 1024 * 1024
+
+# Smallest read attempted when retrying a chunk that failed to read.
+MIN_CHUNK_SIZE = 4096
+
+# Number of times a failed chunk is retried, halving its size each time.
+MAX_RETRIES = 3
+
+# Progress is only reported for reads at least this large.
+PROGRESS_THRESHOLD = 32 * 1024 * 1024
+
+# Number of addresses classified per expression by classifyHeapAddresses.
+CLASSIFY_BATCH_SIZE = 4096
+
+
+class FBMemoryReadError(Exception):
+    """
+    Raised when a chunk can't be read even after retrying. `offset` is the
+    number of bytes read successfully, which is where a resumed read starts.
+    """
+
+    def __init__(self, address, offset, error):
+        super().__init__(
+            "Failed to read memory at 0x{:x} ({} bytes in): {}".format(
+                address + offset, offset, error
+            )
+        )
+        self.address = address
+        self.offset = offset
+        self.error = error
+
+
+class FBReadProgress:
+    """
+    Prints the progress of a read every `step` of its length, and its
+    throughput when finished.
+    """
+
+    def __init__(self, length, offset=0, label="Read", step=0.25):
+        self.length = length
+        self.start = offset
+        self.label = label
+        self.step = step
+        self.enabled = length - offset >= PROGRESS_THRESHOLD
+        self.startTime = time.time()
+        self.nextReport = step
+
+    def update(self, offset):
+        if not self.enabled or not self.length:
+            return
+        fraction = float(offset) / self.length
+        if fraction >= self.nextReport and offset < self.length:
+            print(
+                "{}: {:.0f}% ({})".format(
+                    self.label, 100 * fraction, formatByteCount(offset)
+                )
+            )
+            while self.nextReport <= fraction:
+                self.nextReport += self.step
+
+    def finish(self, offset):
+        if not self.enabled:
+            return
+        count = offset - self.start
+        elapsed = max(time.time() - self.startTime, 1e-6)
+        print(
+            "{}: {} in {:.2f}s ({}/s)".format(
+                self.label,
+                formatByteCount(count),
+                elapsed,
+                formatByteCount(count / elapsed),
+            )
+        )
+
+
+def formatByteCount(count):
+    if count < 1024:
+        return "{} B".format(int(count))
+    for unit in ["KB", "MB", "GB"]:
+        count /= 1024.0
+        if count < 1024 or unit == "GB":
+            return "{:.1f} {}".format(count, unit)
+
+
+def currentProcess():
+    return lldb.debugger.GetSelectedTarget().GetProcess()
+
+
+def bytesAndLengthOfData(data):
+    """
+    Returns the address and length of the bytes of an NSData, fetched in a
+    single round trip.
+    """
+    with fb.batch() as batch:
+        address = batch.add("(void *)[(id){} bytes]".format(data), kind="pointer")
+        length = batch.add("(NSUInteger)[(id){} length]".format(data), kind="integer")
+    return int(address.result() or "0", 16), int(length.result() or 0)
+
+
+def _readChunk(process, address, size, retries):
+    error = lldb.SBError()
+    for _ in range(retries + 1):
+        error = lldb.SBError()
+        chunk = profile.readMemory(process, address, size, error)
+        if error.Success() and chunk:
+            return chunk, error
+        size = max(size // 2, MIN_CHUNK_SIZE)
+    return None, error
+
+
+def readMemoryChunks(
+    address, length, offset=0, chunkSize=CHUNK_SIZE, retries=MAX_RETRIES
+):
+    """
+    Yields (offset, bytes) pairs covering `length` bytes at `address`, starting
+    `offset` bytes in. Raises FBMemoryReadError if a chunk can't be read.
+    """
+    process = currentProcess()
+    while offset < length:
+        size = min(chunkSize, length - offset)
+        chunk, error = _readChunk(process, address + offset, size, retries)
+        if chunk is None:
+            raise FBMemoryReadError(address, offset, error)
+        yield offset, chunk
+        offset += len(chunk)
+
+
+def readMemory(address, length, label="Read"):
+    """
+    Reads `length` bytes at `address` into a single preallocated bytearray.
+    """
+    buffer = bytearray(length)
+    view = memoryview(buffer)
+    progress = FBReadProgress(length, label=label)
+    for offset, chunk in readMemoryChunks(address, length):
+        view[offset : offset + len(chunk)] = chunk
+        progress.update(offset + len(chunk))
+    progress.finish(length)
+    return buffer
+
+
+def copyMemoryToFile(address, length, path, resume=False, label="Copy"):
+    """
+    Streams `length` bytes at `address` to the file at `path`, chunk by chunk.
+
+    With `resume`, an existing shorter file at `path` is assumed to hold the
+    beginning of the bytes (from an earlier read that failed) and only the
+    remainder is read. On failure the partial file is kept so the copy can be
+    resumed, and FBMemoryReadError is raised.
+    """
+    offset = 0
+    if resume and os.path.exists(path):
+        offset = min(os.path.getsize(path), length)
+
+    progress = FBReadProgress(length, offset, label)
+    with open(path, "ab" if offset else "wb") as file:
+        file.truncate(offset)
+        for chunkOffset, chunk in readMemoryChunks(address, length, offset):
+            file.write(chunk)
+            progress.update(chunkOffset + len(chunk))
+    progress.finish(length)
+    return length - offset
+
+
+def copyDataToFile(data, path, resume=False, label="Copy"):
+    """
+    Streams the bytes of an NSData to the file at `path`. Returns False if
+    the data couldn't be found.
+    """
+    address, length = bytesAndLengthOfData(data)
+    if not (address or length):
+        return False
+    copyMemoryToFile(address, length, path, resume, label)
+    return True
+
+
+class FBHeapAllocation:
+    def __init__(self, address, size, zone):
+        self.address = address
+        self.size = size
+        self.zone = zone
+
+
+def _wordSize():
+    return lldb.debugger.GetSelectedTarget().GetAddressByteSize()
+
+
+def _unpackWords(data, count):
+    target = lldb.debugger.GetSelectedTarget()
+    byteOrder = ">" if target.GetByteOrder() == lldb.eByteOrderBig else "<"
+    wordFormat = "Q" if target.GetAddressByteSize() == 8 else "I"
+    return struct.unpack("{}{}{}".format(byteOrder, count, wordFormat), data)
+
+
+def _classifyAddressBatch(frame, addresses, zoneNames):
+    options = lldb.SBExpressionOptions()
+    options.SetLanguage(lldb.eLanguageTypeC)
+
+    # For each address the inferior fills two words: its malloc size, and the
+    # name of its zone (both zero for pointers outside of the heap).
+    expression = """
+        unsigned long __addresses[] = {{ {addresses} }};
+        unsigned long __count = {count};
+        unsigned long *__results = (unsigned long *)malloc(__count * 2 * sizeof(unsigned long));
+        for (unsigned long __i = 0; __results && __i < __count; __i++) {{
+            void *__pointer = (void *)__addresses[__i];
+            unsigned long __size = (unsigned long)malloc_size(__pointer);
+            __results[2 * __i] = __size;
+            __results[2 * __i + 1] = __size ? (unsigned long)malloc_get_zone_name((void *)malloc_zone_from_ptr(__pointer)) : 0;
+        }}
+        (unsigned long)__results;
+    """.format(
+        addresses=", ".join("0x{:x}".format(address) for address in addresses),
+        count=len(addresses),
+    )
+    value = profile.evaluateExpression(frame, expression, options)
+    if value.GetError().Fail():
+        print(value.GetError())
+        return None
+    if not value.unsigned:
+        print("Couldn't allocate the results of {} addresses".format(len(addresses)))
+        return None
+
+    results = value.unsigned
+    try:
+        chunks = readMemoryChunks(results, len(addresses) * 2 * _wordSize())
+        words = _unpackWords(b"".join(chunk for _, chunk in chunks), len(addresses) * 2)
+    finally:
+        profile.evaluateExpression(
+            frame, "(void)free((void *)0x{:x})".format(results), options
+        )
+
+    process = frame.GetThread().GetProcess()
+    allocations = []
+    for index, address in enumerate(addresses):
+        size, zoneName = words[2 * index], words[2 * index + 1]
+        if not size:
+            continue
+        if zoneName not in zoneNames:
+            error = lldb.SBError()
+            name = (
+                profile.readMemory(process, zoneName, 256, error, cString=True)
+                if zoneName
+                else ""
+            )
+            zoneNames[zoneName] = name if error.Success() else ""
+        allocations.append(FBHeapAllocation(address, size, zoneNames[zoneName]))
+    return allocations
+
+
+def classifyHeapAddresses(addresses, frame=None):
+    """
+    Returns an FBHeapAllocation, with its malloc size and zone name, for each
+    of the given addresses that points to the start of a heap allocation.
+    Duplicate addresses are classified once, and the addresses are sent to the
+    process in batches of CLASSIFY_BATCH_SIZE instead of one expression each.
+    Returns None if the addresses couldn't be classified.
+    """
+    frame = frame or (
+        lldb.debugger.GetSelectedTarget()
+        .GetProcess()
+        .GetSelectedThread()
+        .GetSelectedFrame()
+    )
+    uniqueAddresses = list(dict.fromkeys(addresses))
+    zoneNames = {}
+    allocations = []
+    for start in range(0, len(uniqueAddresses), CLASSIFY_BATCH_SIZE):
+        batch = uniqueAddresses[start : start + CLASSIFY_BATCH_SIZE]
+        batchAllocations = _classifyAddressBatch(frame, batch, zoneNames)
+        if batchAllocations is None:
+            return None
+        allocations += batchAllocations
+    return allocations
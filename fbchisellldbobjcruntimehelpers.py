@@ -7,10 +7,13 @@
 
 import re
 
+import fbchisellldbargumenthelpers as argumentHelpers
 import fbchisellldbbase as fb
+import fbchisellldbcache as cache
 import lldb
 
 
+@cache.memoize("objc_getClass")
 def objc_getClass(className):
     command = '(void*)objc_getClass("{}")'.format(className)
     value = fb.evaluateExpression(command)
@@ -23,18 +26,21 @@ def object_getClass(object):
     return value
 
 
+@cache.memoize("class_getName")
 def class_getName(klass):
     command = "(const char*)class_getName((Class){})".format(klass)
     value = fb.evaluateExpressionValue(command).GetSummary().strip('"')
     return value
 
 
+@cache.memoize("class_getSuperclass")
 def class_getSuperclass(klass):
     command = "(void*)class_getSuperclass((Class){})".format(klass)
     value = fb.evaluateExpression(command)
     return value
 
 
+@cache.memoize("class_isMetaClass")
 def class_isMetaClass(klass):
     command = "class_isMetaClass((Class){})".format(klass)
     return fb.evaluateBooleanExpression(command)
@@ -48,6 +54,7 @@ def class_getInstanceMethod(klass, selector):
     return value
 
 
+@cache.memoize("currentArch")
 def currentArch():
     targetTriple = lldb.debugger.GetSelectedTarget().GetTriple()
     arch = targetTriple.split("-")[0]
@@ -75,30 +82,21 @@ def functionPreambleExpressionForSelf():
 def functionPreambleExpressionForObjectParameterAtIndex(parameterIndex):
     arch = currentArch()
     expresssion = None
+    abi = argumentHelpers.ABIS.get(arch)
     if arch == "i386":
         expresssion = "*(id*)($esp + " + str(12 + parameterIndex * 4) + ")"
-    elif arch == "x86_64":
-        if parameterIndex > 3:
-            raise Exception(
-                "Current implementation can not return object at index greater than 3 for x86_64"
-            )
-        registersList = ["rdx", "rcx", "r8", "r9"]
-        expresssion = "(id)$" + registersList[parameterIndex]
-    elif arch == "arm64":
-        if parameterIndex > 5:
-            raise Exception(
-                "Current implementation can not return object at index greater than 5 for arm64"
-            )
-        expresssion = "(id)$x" + str(parameterIndex + 2)
+    elif abi:
+        # Parameters after the ones passed in registers are read from the stack.
+        expresssion = argumentHelpers.entryArgumentExpression(abi, parameterIndex + 2)
     elif re.match(r"^armv.*$", arch):
         if parameterIndex > 1:
-            raise Exception(
-                "Current implementation can not return object at index greater than 1 for arm32"
-            )
-        expresssion = "(id)$r" + str(parameterIndex + 2)
+            expresssion = "*(id*)($sp + " + str((parameterIndex - 2) * 4) + ")"
+        else:
+            expresssion = "(id)$r" + str(parameterIndex + 2)
     return expresssion
 
 
+@cache.memoize("isMacintoshArch")
 def isMacintoshArch():
     arch = currentArch()
     if not arch == "x86_64":
@@ -8,12 +8,20 @@
 import fbchisellldbbase as fb
 
 
-def isKindOfClass(obj, className):
+# Both helpers accept an optional FBExpressionBatch. When given, the lookup is
+# queued on the batch and a future is returned instead of the result.
+def isKindOfClass(obj, className, batch=None):
     isKindOfClassStr = "[(id)" + obj + " isKindOfClass:[{} class]]"
+    if batch is not None:
+        return batch.add(isKindOfClassStr.format(className), "boolean")
     return fb.evaluateBooleanExpression(isKindOfClassStr.format(className))
 
 
-def className(obj):
+def className(obj, batch=None):
+    if batch is not None:
+        return batch.add(
+            "(id)NSStringFromClass((Class)[(" + obj + ") class])", "string"
+        )
     return fb.evaluateExpressionValue(
         "(id)[(" + obj + ") class]"
     ).GetObjectDescription()
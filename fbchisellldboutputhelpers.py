@@ -0,0 +1,58 @@
+#!/usr/bin/python
+
+# Copyright (c) Facebook, Inc. and its affiliates. All Rights Reserved
+#
+# This source code is licensed under the MIT license found in the
+# LICENSE file in the root directory of this source tree.
+
+import os
+import sys
+
+import fbchisellldbbase as fb
+
+
+# Number of lines joined into a single write to the command result. Writing
+# each line separately is slow for large outputs, and joining the whole output
+# first holds it all in memory.
+WRITE_BATCH_SIZE = 256
+
+
+def outputOption():
+    return fb.FBCommandArgument(
+        arg="out",
+        short="-o",
+        long="--out",
+        type="string",
+        default=None,
+        help="Write the output to a file instead of the console.",
+    )
+
+
+# Writes the lines produced by a generator as they come, to the file at path
+# if given, otherwise to result (the command result object, or stdout). Returns
+# the number of lines written.
+def writeLines(lines, result=None, path=None):
+    out = result if result is not None else sys.stdout
+    if path:
+        path = os.path.expanduser(path)
+        count = 0
+        with open(path, "w") as f:
+            for line in lines:
+                f.write(line)
+                f.write("\n")
+                count += 1
+        print("Wrote {} lines to {}".format(count, path), file=out)
+        return count
+
+    count = 0
+    pending = []
+    for line in lines:
+        pending.append(line)
+        if len(pending) == WRITE_BATCH_SIZE:
+            out.write("\n".join(pending) + "\n")
+            count += len(pending)
+            pending = []
+    if pending:
+        out.write("\n".join(pending) + "\n")
+        count += len(pending)
+    return count
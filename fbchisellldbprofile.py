@@ -0,0 +1,187 @@
+#!/usr/bin/python
+
+# Copyright (c) Facebook, Inc. and its affiliates. All Rights Reserved
+#
+# This source code is licensed under the MIT license found in the
+# LICENSE file in the root directory of this source tree.
+
+import collections
+import json
+import os
+import time
+
+
+# One record per command module, in the order they were loaded. Modules
+# that were registered from the manifest are only imported when one of
+# their commands first runs, at which point their record is updated.
+moduleLoads = []
+
+
+class FBModuleLoad(object):
+    def __init__(self, moduleName, commandCount):
+        self.moduleName = moduleName
+        self.commandCount = commandCount
+        self.registerSeconds = 0.0
+        self.importSeconds = None
+        self.lazy = False
+
+    @property
+    def imported(self):
+        return self.importSeconds is not None
+
+
+def recordModuleLoad(moduleName, commandCount=0):
+    load = FBModuleLoad(moduleName, commandCount)
+    moduleLoads.append(load)
+    return load
+
+
+def moduleLoadNamed(moduleName):
+    for load in moduleLoads:
+        if load.moduleName == moduleName:
+            return load
+    return None
+
+
+class timer(object):
+    """Context manager measuring wall clock time, in seconds, as `elapsed`."""
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        self.elapsed = 0.0
+        return self
+
+    def __exit__(self, *exc):
+        self.elapsed = time.perf_counter() - self.start
+        return False
+
+
+# Number of command runs and of expressions kept for `chiselprofile`.
+COMMAND_HISTORY_SIZE = 1000
+EXPRESSION_HISTORY_SIZE = 5000
+
+# Appending each command run to a JSON lines file lets runs be compared across
+# sessions (and app releases):
+#   script os.environ['CHISEL_PROFILE_LOG'] = '/tmp/chisel-profile.jsonl'
+PROFILE_LOG_VARIABLE = "CHISEL_PROFILE_LOG"
+
+commandRuns = collections.deque(maxlen=COMMAND_HISTORY_SIZE)
+expressionRuns = collections.deque(maxlen=EXPRESSION_HISTORY_SIZE)
+
+# The runs in progress; commands can run other commands, for example through
+# `sequence`.
+_activeRuns = []
+
+
+class FBCommandRun(object):
+    """
+    The cost of one run of a command: its wall time, and how much of it was
+    spent evaluating expressions and reading memory in the process.
+    """
+
+    def __init__(self, name, arguments):
+        self.name = name
+        self.arguments = arguments
+        self.startTime = time.time()
+        self.seconds = 0.0
+        self.expressionCount = 0
+        self.expressionSeconds = 0.0
+        self.readCount = 0
+        self.readBytes = 0
+        self.readSeconds = 0.0
+
+    @property
+    def pythonSeconds(self):
+        return max(self.seconds - self.expressionSeconds - self.readSeconds, 0.0)
+
+    def toDict(self):
+        return {
+            "command": self.name,
+            "arguments": self.arguments,
+            "start": self.startTime,
+            "seconds": self.seconds,
+            "expressions": self.expressionCount,
+            "expressionSeconds": self.expressionSeconds,
+            "reads": self.readCount,
+            "readBytes": self.readBytes,
+            "readSeconds": self.readSeconds,
+            "pythonSeconds": self.pythonSeconds,
+        }
+
+
+class FBExpressionRun(object):
+    def __init__(self, expression, seconds, command):
+        self.expression = expression
+        self.seconds = seconds
+        self.command = command
+
+
+class commandRun(object):
+    """Context manager recording a run of the named command."""
+
+    def __init__(self, name, arguments=""):
+        self.run = FBCommandRun(name, arguments)
+
+    def __enter__(self):
+        _activeRuns.append(self.run)
+        return self.run
+
+    def __exit__(self, *exc):
+        self.run.seconds = time.time() - self.run.startTime
+        _activeRuns.remove(self.run)
+        commandRuns.append(self.run)
+        _appendToLog(self.run)
+        return False
+
+
+def _appendToLog(run):
+    path = os.environ.get(PROFILE_LOG_VARIABLE)
+    if not path:
+        return
+    try:
+        with open(os.path.expanduser(path), "a") as log:
+            log.write(json.dumps(run.toDict()) + "\n")
+    except OSError:
+        pass
+
+
+def evaluateExpression(frame, expression, options):
+    """frame.EvaluateExpression, recorded for the commands running."""
+    start = time.time()
+    value = frame.EvaluateExpression(expression, options)
+    seconds = time.time() - start
+
+    for run in _activeRuns:
+        run.expressionCount += 1
+        run.expressionSeconds += seconds
+    expressionRuns.append(
+        FBExpressionRun(
+            expression, seconds, _activeRuns[-1].name if _activeRuns else None
+        )
+    )
+    return value
+
+
+def readMemory(process, address, size, error, cString=False):
+    """
+    process.ReadMemory (or ReadCStringFromMemory), recorded for the commands
+    running.
+    """
+    start = time.time()
+    if cString:
+        data = process.ReadCStringFromMemory(address, size, error)
+    else:
+        data = process.ReadMemory(address, size, error)
+    seconds = time.time() - start
+
+    count = len(data) if data else 0
+    for run in _activeRuns:
+        run.readCount += 1
+        run.readBytes += count
+        run.readSeconds += seconds
+    return data
+
+
+def clear():
+    commandRuns.clear()
+    expressionRuns.clear()
@@ -6,7 +6,7 @@
 # LICENSE file in the root directory of this source tree.
 
 import fbchisellldbbase as fb
-import fbchisellldbobjcruntimehelpers as runtimeHelpers
+import fbchisellldbviewqueryhelpers as queryHelpers
 
 
 def presentViewController(viewController):
@@ -54,69 +54,145 @@ def dismissViewController(viewController):
 
 
 def viewControllerRecursiveDescription(vc):
-    return _recursiveViewControllerDescriptionWithPrefixAndChildPrefix(
-        fb.evaluateObjectExpression(vc), "", "", ""
+    return "".join(line + "\n" for line in viewControllerRecursiveDescriptionLines(vc))
+
+
+# Yields the lines of the view controller hierarchy, rendered from a single
+# snapshot of the tree.
+def viewControllerRecursiveDescriptionLines(vc):
+    root = viewControllerTree(vc)
+    if root is None:
+        return iter(["[Error getting description.]"])
+    return _viewControllerDescriptionLines(root, "", "")
+
+
+# Walks the view controller tree, children first and then the view controller
+# presented modally, and returns a node per view controller in that order.
+VIEW_CONTROLLER_TREE_EXPRESSION = """
+Class __navigationClass = (Class)NSClassFromString(@"UINavigationController");
+Class __tabBarClass = (Class)NSClassFromString(@"UITabBarController");
+NSMutableArray *__nodes = (id)[NSMutableArray array];
+NSMutableArray *__stack = (id)[NSMutableArray array];
+id __root = (id)(%(vc)s);
+if (__root != nil) {
+    [__stack addObject:@[__root, [NSNumber numberWithInteger:-1], [NSNumber numberWithBool:NO]]];
+}
+while ((NSUInteger)[__stack count] > 0) {
+    NSArray *__entry = (id)[__stack lastObject];
+    [__stack removeLastObject];
+    id __vc = (id)[__entry objectAtIndex:0];
+
+    NSMutableDictionary *__node = (id)[NSMutableDictionary dictionary];
+    __node[@"address"] = (id)[NSString stringWithFormat:@"%%p", __vc];
+    __node[@"class"] = (id)NSStringFromClass((Class)[__vc class]);
+    __node[@"parent"] = (id)[__entry objectAtIndex:1];
+    __node[@"modal"] = (id)[__entry objectAtIndex:2];
+    BOOL __loaded = (BOOL)[__vc isViewLoaded];
+    __node[@"viewLoaded"] = [NSNumber numberWithBool:__loaded];
+    if (__loaded) {
+        id __view = (id)[__vc view];
+        CGRect __frame = (CGRect)[__view frame];
+        __node[@"view"] = @{
+            @"address": (id)[NSString stringWithFormat:@"%%p", __view],
+            @"class": (id)NSStringFromClass((Class)[__view class]),
+            @"frame": @[[NSNumber numberWithDouble:__frame.origin.x],
+                        [NSNumber numberWithDouble:__frame.origin.y],
+                        [NSNumber numberWithDouble:__frame.size.width],
+                        [NSNumber numberWithDouble:__frame.size.height]]
+        };
+    }
+    if (__navigationClass != nil && (BOOL)[__vc isKindOfClass:__navigationClass]) {
+        __node[@"container"] = @"navigation";
+        __node[@"topViewController"] = (id)[NSString stringWithFormat:@"%%p", (id)[__vc topViewController]];
+    } else if (__tabBarClass != nil && (BOOL)[__vc isKindOfClass:__tabBarClass]) {
+        __node[@"container"] = @"tab";
+        __node[@"selectedViewController"] = (id)[NSString stringWithFormat:@"%%p", (id)[__vc selectedViewController]];
+    }
+
+    NSNumber *__index = [NSNumber numberWithInteger:(NSInteger)[__nodes count]];
+    [__nodes addObject:__node];
+
+    if ((BOOL)[__vc respondsToSelector:@selector(presentedViewController)]) {
+        id __presented = (id)[__vc presentedViewController];
+        if (__presented != nil && (id)[__presented presentingViewController] == __vc) {
+            [__stack addObject:@[__presented, __index, [NSNumber numberWithBool:YES]]];
+        }
+    }
+    NSArray *__children = (id)[__vc childViewControllers];
+    for (NSInteger __i = (NSInteger)[__children count] - 1; __i >= 0; --__i) {
+        [__stack addObject:@[(id)[__children objectAtIndex:__i], __index, [NSNumber numberWithBool:NO]]];
+    }
+}
+RETURN(__nodes);
+"""
+
+
+# Returns the view controller tree of vc as nested dictionaries, each with the
+# address, class, view (when loaded), container details, `children` and the
+# `presented` view controller. Returns None if the tree couldn't be fetched.
+def viewControllerTree(vc):
+    nodes = fb.evaluate(VIEW_CONTROLLER_TREE_EXPRESSION % {"vc": vc})
+    if not nodes:
+        return None
+    for node in nodes:
+        node["children"] = []
+        node["presented"] = None
+        parent = node.pop("parent")
+        if node.pop("modal"):
+            nodes[parent]["presented"] = node
+        elif parent >= 0:
+            nodes[parent]["children"].append(node)
+        if not node["viewLoaded"]:
+            node["view"] = None
+    return nodes[0]
+
+
+def _viewControllerDescription(node):
+    view = node["view"]
+    if view is None:
+        return "<{}: {}; view not loaded>".format(node["class"], node["address"])
+    return "<{}: {}; view = <{}; {}>; frame = ({:g}, {:g}; {:g}, {:g})>".format(
+        node["class"], node["address"], view["class"], view["address"], *view["frame"]
     )
 
 
-def _viewControllerDescription(viewController):
-    vc = "(%s)" % (viewController)
-
-    if fb.evaluateBooleanExpression("[(id)%s isViewLoaded]" % (vc)):
-        result = fb.evaluateExpressionValue(
-            '(id)[[NSString alloc] initWithFormat:@"<%%@: %%p; view = <%%@; %%p>; frame = (%%g, %%g; %%g, %%g)>", (id)NSStringFromClass((id)[(id)%s class]), %s, (id)[(id)[(id)%s view] class], (id)[(id)%s view], ((CGRect)[(id)[(id)%s view] frame]).origin.x, ((CGRect)[(id)[(id)%s view] frame]).origin.y, ((CGRect)[(id)[(id)%s view] frame]).size.width, ((CGRect)[(id)[(id)%s view] frame]).size.height]'
-            % (vc, vc, vc, vc, vc, vc, vc, vc)
-        )
-    else:
-        result = fb.evaluateExpressionValue(
-            '(id)[[NSString alloc] initWithFormat:@"<%%@: %%p; view not loaded>", (id)NSStringFromClass((id)[(id)%s class]), %s]'
-            % (vc, vc)
-        )
-
-    if result.GetError() is not None and str(result.GetError()) != "success":
-        return "[Error getting description.]"
-    else:
-        return result.GetObjectDescription()
-
-
-def _recursiveViewControllerDescriptionWithPrefixAndChildPrefix(
-    vc, string, prefix, childPrefix
-):
-    isMac = runtimeHelpers.isMacintoshArch()
-
-    s = "%s%s%s\n" % (
+def _viewControllerDescriptionLines(node, prefix, childPrefix):
+    yield "%s%s%s" % (
         prefix,
         "" if prefix == "" else " ",
-        _viewControllerDescription(vc),
+        _viewControllerDescription(node),
     )
 
     nextPrefix = childPrefix + "   |"
 
-    numChildViewControllers = fb.evaluateIntegerExpression(
-        "(int)[(id)[%s childViewControllers] count]" % (vc)
-    )
+    for child in node["children"]:
+        yield from _viewControllerDescriptionLines(child, nextPrefix, nextPrefix)
 
-    for i in range(0, numChildViewControllers):
-        viewController = fb.evaluateExpression(
-            "(id)[(id)[%s childViewControllers] objectAtIndex:%d]" % (vc, i)
-        )
-        s += _recursiveViewControllerDescriptionWithPrefixAndChildPrefix(
-            viewController, string, nextPrefix, nextPrefix
+    if node["presented"] is not None:
+        yield from _viewControllerDescriptionLines(
+            node["presented"], childPrefix + "  *M", nextPrefix
         )
-
-    if not isMac:
-        isModal = fb.evaluateBooleanExpression(
-            "%s != nil && ((id)[(id)[(id)%s presentedViewController] presentingViewController]) == %s"
-            % (vc, vc, vc)
-        )
-
-        if isModal:
-            modalVC = fb.evaluateObjectExpression(
-                "(id)[(id)%s presentedViewController]" % (vc)
-            )
-            s += _recursiveViewControllerDescriptionWithPrefixAndChildPrefix(
-                modalVC, string, childPrefix + "  *M", nextPrefix
-            )
-            s += "\n// '*M' means the view controller is presented modally."
-
-    return string + s
+        yield ""
+        yield "// '*M' means the view controller is presented modally."
+
+
+# The child view controllers of `__object`, followed by the one it presents
+# modally, if any.
+VIEW_CONTROLLER_CHILDREN = """({
+    NSMutableArray *__c = (id)[NSMutableArray arrayWithArray:(id)[__object childViewControllers]];
+    if ((BOOL)[__object respondsToSelector:@selector(presentedViewController)]) {
+        id __presented = (id)[__object presentedViewController];
+        if (__presented != nil && (id)[__presented presentingViewController] == __object) {
+            [__c addObject:__presented];
+        }
+    }
+    __c;
+})"""
+
+
+# Returns the ObjectMatch of each view controller in the hierarchy of vc whose
+# class name matches regex, searching inside the process.
+def findViewControllersOfClassMatching(regex, vc, limit=None):
+    return queryHelpers.findObjectsOfClassMatching(
+        regex, "@[(id)({})]".format(vc), VIEW_CONTROLLER_CHILDREN, limit
+    )
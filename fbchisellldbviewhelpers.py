@@ -63,7 +63,16 @@ def convertPoint(x, y, fromViewOrLayer, toViewOrLayer):
     )
 
 
-def convertToLayer(viewOrLayer):
+def convertToLayer(viewOrLayer, batch=None):
+    if batch is not None:
+        # Same checks as below, folded into one expression so that it can be
+        # queued on the batch.
+        layerExpression = (
+            "[(id){0} isKindOfClass:(Class)[CALayer class]] ? (id){0} : "
+            "([(id){0} respondsToSelector:(SEL)@selector(layer)] ? (id)[(id){0} layer] : (id)nil)"
+        ).format(viewOrLayer)
+        return batch.add(layerExpression, "object", transform=_checkedLayer)
+
     if fb.evaluateBooleanExpression(
         "[(id)%s isKindOfClass:(Class)[CALayer class]]" % viewOrLayer
     ):
@@ -76,6 +85,12 @@ def convertToLayer(viewOrLayer):
         raise Exception("Argument must be a CALayer, UIView, or NSView.")
 
 
+def _checkedLayer(layer):
+    if not layer or int(layer, 16) == 0:
+        raise Exception("Argument must be a CALayer, UIView, or NSView.")
+    return layer
+
+
 def isUIView(obj):
     return not runtimeHelpers.isMacintoshArch() and fb.evaluateBooleanExpression(
         "[(id)%s isKindOfClass:(Class)[UIView class]]" % obj
@@ -94,17 +109,183 @@ def isView(obj):
 
 # Generates a BFS of the views tree starting at the given view as root.
 # Yields a tuple of the current view in the tree and its level (view, level)
-def subviewsOfView(view):
-    views = [(view, 0)]
-    yield views[0]
-    while views:
-        (view, level) = views.pop(0)
-        subviews = fb.evaluateExpression("(id)[%s subviews]" % view)
-        subviewsCount = int(fb.evaluateExpression("(int)[(id)%s count]" % subviews))
-        for i in range(subviewsCount):
-            subview = fb.evaluateExpression("(id)[%s objectAtIndex:%i]" % (subviews, i))
-            views.append((subview, level + 1))
-            yield (subview, level + 1)
+# The tree is fetched with a single snapshot, see snapshotViewHierarchy.
+def subviewsOfView(view, maxDepth=None):
+    tree = snapshotViewHierarchy(view, maxDepth=maxDepth)
+    if tree is None:
+        return
+    # Nodes are stored in depth-first order, a stable sort by depth turns that
+    # into breadth-first order.
+    for node in sorted(tree, key=lambda node: node.depth):
+        yield (node.address, node.depth)
+
+
+class ViewNode:
+    """
+    A view captured by snapshotViewHierarchy.
+
+    `frame` is a tuple of (x, y, width, height) in the superview's coordinates,
+    `parent` is the index of the parent node (-1 for the root) and `properties`
+    holds the values of any extra properties requested for the snapshot.
+    """
+
+    __slots__ = (
+        "index",
+        "address",
+        "className",
+        "frame",
+        "hidden",
+        "alpha",
+        "depth",
+        "parent",
+        "children",
+        "properties",
+    )
+
+    def __init__(self, index, values, propertyNames):
+        self.index = index
+        self.address = values[0]
+        self.className = values[1]
+        self.frame = tuple(values[2])
+        self.hidden = bool(values[3])
+        self.alpha = values[4]
+        self.depth = values[5]
+        self.parent = values[6]
+        self.children = []
+        self.properties = dict(zip(propertyNames, values[7]))
+
+    def __repr__(self):
+        return "<{}: {}>".format(self.className, self.address)
+
+
+class ViewTree:
+    """
+    A view hierarchy fetched in one expression. Nodes are stored in depth-first
+    order, so the subtree of a node is a contiguous range starting at the node.
+    """
+
+    def __init__(self, nodes):
+        self.nodes = nodes
+        self.nodesByAddress = {}
+        for node in nodes:
+            self.nodesByAddress[int(node.address, 16)] = node
+            if node.parent >= 0:
+                nodes[node.parent].children.append(node.index)
+
+    def __len__(self):
+        return len(self.nodes)
+
+    def __iter__(self):
+        return iter(self.nodes)
+
+    def __getitem__(self, index):
+        return self.nodes[index]
+
+    @property
+    def root(self):
+        return self.nodes[0] if self.nodes else None
+
+    def nodeForAddress(self, address):
+        if isinstance(address, str):
+            try:
+                address = int(address, 0)
+            except ValueError:
+                return None
+        return self.nodesByAddress.get(address)
+
+    def parentOf(self, node):
+        return self.nodes[node.parent] if node.parent >= 0 else None
+
+    def childrenOf(self, node):
+        return [self.nodes[index] for index in node.children]
+
+    def subtree(self, node):
+        yield node
+        for other in self.nodes[node.index + 1 :]:
+            if other.depth <= node.depth:
+                break
+            yield other
+
+    def nodesOfClass(self, className):
+        return [node for node in self.nodes if node.className == className]
+
+
+def snapshotViewHierarchy(view, maxDepth=None, properties=None, fromRoot=False):
+    """
+    Walks the hierarchy of `view` inside the inferior, in a single expression,
+    and returns a ViewTree (or None if the expression failed).
+
+    :param str view: Expression for a UIView or NSView
+    :param int maxDepth: Depth to stop at, None walks the whole tree
+    :param dict[str, str] properties: Extra values to capture, mapping a name to
+        an ObjC expression of `__view` that returns an object (or nil)
+    :param bool fromRoot: Start from the top of the hierarchy containing `view`
+    """
+    properties = properties or {}
+    propertyNames = sorted(properties)
+    propertyValues = ", ".join(
+        "({{ id __value = nil; @try {{ __value = (id)({}); }} "
+        "@catch (NSException *__e) {{}} __value ?: (id)[NSNull null]; }})".format(
+            properties[name]
+        )
+        for name in propertyNames
+    )
+    alphaKey = "alphaValue" if runtimeHelpers.isMacintoshArch() else "alpha"
+
+    command = """
+id __root = (id)(%(view)s);
+if (%(fromRoot)d) {
+    while ((id)[__root superview] != nil) {
+        __root = (id)[__root superview];
+    }
+}
+NSMutableArray *__nodes = (id)[NSMutableArray array];
+NSMutableArray *__stack = (id)[NSMutableArray array];
+[__stack addObject:@[__root, [NSNumber numberWithInteger:-1], [NSNumber numberWithInteger:0]]];
+while ((NSUInteger)[__stack count] > 0) {
+    NSArray *__entry = (id)[__stack lastObject];
+    [__stack removeLastObject];
+    id __view = (id)[__entry objectAtIndex:0];
+    NSInteger __depth = (NSInteger)[[__entry objectAtIndex:2] integerValue];
+    NSInteger __index = (NSInteger)[__nodes count];
+    CGRect __frame = (CGRect)[__view frame];
+    [__nodes addObject:@[
+        (id)[NSString stringWithFormat:@"%%p", __view],
+        (id)NSStringFromClass((Class)[__view class]),
+        @[[NSNumber numberWithDouble:__frame.origin.x],
+          [NSNumber numberWithDouble:__frame.origin.y],
+          [NSNumber numberWithDouble:__frame.size.width],
+          [NSNumber numberWithDouble:__frame.size.height]],
+        [NSNumber numberWithBool:(BOOL)[__view isHidden]],
+        [NSNumber numberWithDouble:(double)[[__view valueForKey:@"%(alphaKey)s"] doubleValue]],
+        [NSNumber numberWithInteger:__depth],
+        (id)[__entry objectAtIndex:1],
+        @[%(propertyValues)s]
+    ]];
+    if (%(maxDepth)d < 0 || __depth < %(maxDepth)d) {
+        NSArray *__subviews = (id)[__view subviews];
+        for (NSInteger __i = (NSInteger)[__subviews count] - 1; __i >= 0; --__i) {
+            [__stack addObject:@[(id)[__subviews objectAtIndex:__i],
+                                 [NSNumber numberWithInteger:__index],
+                                 [NSNumber numberWithInteger:__depth + 1]]];
+        }
+    }
+}
+RETURN(__nodes);
+""" % {
+        "view": view,
+        "fromRoot": int(fromRoot),
+        "alphaKey": alphaKey,
+        "maxDepth": -1 if maxDepth is None else int(maxDepth),
+        "propertyValues": propertyValues,
+    }
+
+    values = fb.evaluate(command)
+    if values is None:
+        return None
+    return ViewTree(
+        [ViewNode(index, node, propertyNames) for index, node in enumerate(values)]
+    )
 
 
 def upwardsRecursiveDescription(view, maxDepth=0):
@@ -0,0 +1,427 @@
+#!/usr/bin/python
+
+# Copyright (c) Facebook, Inc. and its affiliates. All Rights Reserved
+#
+# This source code is licensed under the MIT license found in the
+# LICENSE file in the root directory of this source tree.
+
+import collections
+import json
+import re
+
+import fbchisellldbbase as fb
+import fbchisellldbcache as cache
+import fbchisellldbobjcruntimehelpers as runtimeHelpers
+import fbchisellldbviewhelpers as viewHelpers
+
+
+# Extra values captured for every view, see snapshotViewHierarchy.
+QUERY_PROPERTIES = {
+    "identifier": "[__view accessibilityIdentifier]",
+    "label": "[__view accessibilityLabel]",
+    "tag": "[NSNumber numberWithInteger:(NSInteger)[__view tag]]",
+    "window": '[NSString stringWithFormat:@"%p", (id)[__view window]]',
+    "windowFrame": "({ CGRect __r = (CGRect)[__view convertRect:(CGRect)[__view bounds] "
+    "toView:nil]; @[[NSNumber numberWithDouble:__r.origin.x], "
+    "[NSNumber numberWithDouble:__r.origin.y], "
+    "[NSNumber numberWithDouble:__r.size.width], "
+    "[NSNumber numberWithDouble:__r.size.height]]; })",
+}
+
+# The values of each field that can be queried, by field name.
+FIELDS = {
+    "address": lambda node: node.address,
+    "class": lambda node: node.className,
+    "identifier": lambda node: node.properties["identifier"],
+    "label": lambda node: node.properties["label"],
+    "tag": lambda node: node.properties["tag"],
+    "window": lambda node: node.properties["window"],
+    "hidden": lambda node: node.hidden,
+    "alpha": lambda node: node.alpha,
+    "depth": lambda node: node.depth,
+    "frame": lambda node: node.properties["windowFrame"],
+}
+
+FIELD_ALIASES = {"id": "identifier", "a11y": "label"}
+
+# Fields with an index from value to views.
+INDEXED_FIELDS = ("class", "identifier", "label", "tag", "window")
+
+STRING_FIELDS = ("address", "class", "identifier", "label", "window")
+BOOLEAN_FIELDS = ("hidden",)
+
+OPERATORS = ("==", "!=", "~", "<", ">", "<=", ">=", "intersects", "contains")
+
+TOKEN = re.compile(r"""'[^']*'|"[^"]*"|==|!=|<=|>=|~|<|>|[=!]|[^\s=!<>~'"]+""")
+
+BOOLEANS = {
+    "yes": True,
+    "true": True,
+    "1": True,
+    "no": False,
+    "false": False,
+    "0": False,
+}
+
+
+# Walks a hierarchy of objects inside the process and returns the address and
+# class name of those whose class name matches a regex, without sending the rest
+# of the hierarchy back. Stops after `limit` matches (0 for no limit).
+CLASS_SEARCH_EXPRESSION = """
+NSError *__error = nil;
+NSRegularExpression *__regex = (id)[NSRegularExpression regularExpressionWithPattern:{pattern} options:1 error:&__error];
+NSMutableArray *__matches = (id)[NSMutableArray array];
+NSMutableArray *__stack = (id)[NSMutableArray array];
+NSArray *__roots = (id)({roots});
+for (NSInteger __i = (NSInteger)[__roots count] - 1; __i >= 0; --__i) {{
+    [__stack addObject:(id)[__roots objectAtIndex:__i]];
+}}
+while (__regex != nil && (NSUInteger)[__stack count] > 0 &&
+       ({limit} <= 0 || (NSInteger)[__matches count] < {limit})) {{
+    id __object = (id)[__stack lastObject];
+    [__stack removeLastObject];
+    NSString *__name = (id)NSStringFromClass((Class)[__object class]);
+    if ((id)[__regex firstMatchInString:__name options:0 range:((NSRange){{0, (NSUInteger)[__name length]}})] != nil) {{
+        [__matches addObject:@[(id)[NSString stringWithFormat:@"%p", __object], __name]];
+    }}
+    NSArray *__children = (id)({children});
+    for (NSInteger __i = (NSInteger)[__children count] - 1; __i >= 0; --__i) {{
+        [__stack addObject:(id)[__children objectAtIndex:__i]];
+    }}
+}}
+RETURN(@{{@"matches": __matches, @"error": __error ? (id)[__error localizedDescription] : @""}});
+"""
+
+ObjectMatch = collections.namedtuple("ObjectMatch", ["address", "className"])
+
+
+class ViewQueryError(Exception):
+    pass
+
+
+class ViewQueryClause:
+    """
+    One `field operator value` condition of a query.
+    """
+
+    __slots__ = ("field", "operator", "value")
+
+    def __init__(self, field, operator, value):
+        self.field = field
+        self.operator = operator
+        self.value = value
+
+    def __repr__(self):
+        return "{} {} {!r}".format(self.field, self.operator, self.value)
+
+    def matches(self, node):
+        value = FIELDS[self.field](node)
+        operator = self.operator
+        if operator == "~":
+            return value is not None and self.value.search(str(value)) is not None
+        if operator == "intersects":
+            return value is not None and _intersects(value, self.value)
+        if operator == "contains":
+            return value is not None and _contains(value, self.value)
+        if self.field == "address" or self.field == "window":
+            value = int(value, 16)
+        if operator == "==":
+            return value == self.value
+        if operator == "!=":
+            return value != self.value
+        if value is None:
+            return False
+        if operator == "<":
+            return value < self.value
+        if operator == ">":
+            return value > self.value
+        if operator == "<=":
+            return value <= self.value
+        return value >= self.value
+
+
+def _intersects(frame, other):
+    x, y, width, height = frame
+    otherX, otherY, otherWidth, otherHeight = other
+    return (
+        x < otherX + otherWidth
+        and otherX < x + width
+        and y < otherY + otherHeight
+        and otherY < y + height
+    )
+
+
+def _contains(frame, point):
+    x, y, width, height = frame
+    pointX, pointY = point
+    return x <= pointX < x + width and y <= pointY < y + height
+
+
+def _unquote(token):
+    if len(token) >= 2 and token[0] == token[-1] and token[0] in "'\"":
+        return token[1:-1]
+    return token
+
+
+def _parseNumbers(token, count):
+    try:
+        numbers = [float(part) for part in _unquote(token).split(",")]
+    except ValueError:
+        numbers = []
+    if len(numbers) != count:
+        raise ViewQueryError(
+            "Expected {} comma separated numbers, got {}".format(count, token)
+        )
+    return tuple(numbers)
+
+
+def _parseValue(field, operator, token):
+    if operator == "~":
+        try:
+            return re.compile(_unquote(token), re.IGNORECASE)
+        except re.error as e:
+            raise ViewQueryError("Invalid regex {}: {}".format(token, e))
+    if field == "frame":
+        if operator == "intersects":
+            return _parseNumbers(token, 4)
+        if operator == "contains":
+            return _parseNumbers(token, 2)
+        raise ViewQueryError("frame only supports intersects and contains")
+    if operator in ("intersects", "contains"):
+        raise ViewQueryError("{} only applies to frame".format(operator))
+
+    value = _unquote(token)
+    if field in STRING_FIELDS:
+        if operator not in ("==", "!="):
+            raise ViewQueryError("{} only supports ==, != and ~".format(field))
+        if field == "address" or field == "window":
+            # Views without a window are indexed under 0, the address of nil.
+            if value.lower() in ("nil", "null"):
+                return 0
+            try:
+                return int(value, 16)
+            except ValueError:
+                raise ViewQueryError("Invalid address {}".format(token))
+        if value.lower() in ("nil", "null"):
+            return None
+        return value
+    if field in BOOLEAN_FIELDS:
+        if operator not in ("==", "!=") or value.lower() not in BOOLEANS:
+            raise ViewQueryError("{} only supports == YES and == NO".format(field))
+        return BOOLEANS[value.lower()]
+    try:
+        return float(value)
+    except ValueError:
+        raise ViewQueryError("Expected a number for {}, got {}".format(field, token))
+
+
+def parseQuery(query):
+    """
+    Parses a query made of clauses joined by `and` (or `&&`), for example:
+
+        class ~ Button and label ~ '^Log' and frame intersects 0,0,320,100 and hidden == NO
+
+    Returns the list of ViewQueryClause, raises ViewQueryError if the query is
+    invalid.
+    """
+    tokens = TOKEN.findall(query)
+    clauses = []
+    while tokens:
+        if len(tokens) < 3:
+            raise ViewQueryError("Incomplete clause: {}".format(" ".join(tokens)))
+        field, operator, value = tokens[:3]
+        tokens = tokens[3:]
+
+        field = FIELD_ALIASES.get(field.lower(), field.lower())
+        if field not in FIELDS:
+            raise ViewQueryError(
+                "Unknown field {}, expected one of: {}".format(
+                    field, ", ".join(sorted(FIELDS))
+                )
+            )
+        operator = operator.lower()
+        if operator not in OPERATORS:
+            raise ViewQueryError("Unknown operator {}".format(operator))
+        clauses.append(
+            ViewQueryClause(field, operator, _parseValue(field, operator, value))
+        )
+
+        if tokens:
+            if tokens[0].lower() not in ("and", "&&"):
+                raise ViewQueryError("Expected `and`, got {}".format(tokens[0]))
+            tokens = tokens[1:]
+            if not tokens:
+                raise ViewQueryError("Expected a clause after `and`")
+
+    if not clauses:
+        raise ViewQueryError("Empty query")
+    return clauses
+
+
+class ViewIndex:
+    """
+    The views of one or more ViewTree, indexed by class, accessibility
+    identifier, accessibility label, tag and window.
+    """
+
+    def __init__(self, trees):
+        self.nodes = [node for tree in trees for node in tree]
+        self.indexes = {field: {} for field in INDEXED_FIELDS}
+        for node in self.nodes:
+            for field in INDEXED_FIELDS:
+                value = FIELDS[field](node)
+                if field == "window":
+                    value = int(value, 16)
+                self.indexes[field].setdefault(value, []).append(node)
+
+    def __len__(self):
+        return len(self.nodes)
+
+    def _candidates(self, clause):
+        # Returns the views that can match the clause, using an index, or None
+        # when the clause isn't indexed.
+        index = self.indexes.get(clause.field)
+        if index is None:
+            return None
+        if clause.operator == "==":
+            return index.get(clause.value, [])
+        if clause.operator == "~":
+            # Windows are indexed by address, match them in hex like
+            # ViewQueryClause.matches does.
+            keyFormat = "0x{:x}" if clause.field == "window" else "{}"
+            return [
+                node
+                for key, nodes in index.items()
+                if key is not None and clause.value.search(keyFormat.format(key))
+                for node in nodes
+            ]
+        return None
+
+    def query(self, query, limit=None):
+        """
+        Returns the views matching every clause of the query (a string or a
+        list of ViewQueryClause), in hierarchy order.
+        """
+        clauses = parseQuery(query) if isinstance(query, str) else query
+
+        # Start from the smallest set of candidates an index gives, and check
+        # the other clauses on those only.
+        candidates = None
+        seed = None
+        for clause in clauses:
+            nodes = self._candidates(clause)
+            if nodes is not None and (
+                candidates is None or len(nodes) < len(candidates)
+            ):
+                candidates = nodes
+                seed = clause
+        if candidates is None:
+            candidates = self.nodes
+        else:
+            order = {id(node): position for position, node in enumerate(self.nodes)}
+            candidates = sorted(set(candidates), key=lambda node: order[id(node)])
+
+        matches = []
+        for node in candidates:
+            if all(clause.matches(node) for clause in clauses if clause is not seed):
+                matches.append(node)
+                if limit and len(matches) >= limit:
+                    break
+        return matches
+
+
+_indexes = cache.FBStopCache("viewIndexes", maxSize=4)
+
+
+def windowExpressions():
+    if runtimeHelpers.isMacintoshArch():
+        command = (
+            "NSMutableArray *__windows = [NSMutableArray array];"
+            "for (id __window in (id)[[NSApplication sharedApplication] windows]) {"
+            '    [__windows addObject:[NSString stringWithFormat:@"%p", (id)[__window contentView]]];'
+            "}"
+            "RETURN(__windows);"
+        )
+    else:
+        command = (
+            "NSMutableArray *__windows = [NSMutableArray array];"
+            "for (id __window in (id)[[UIApplication sharedApplication] windows]) {"
+            '    [__windows addObject:[NSString stringWithFormat:@"%p", __window]];'
+            "}"
+            "RETURN(__windows);"
+        )
+    windows = fb.evaluate(command) or []
+    return ["(id){}".format(window) for window in windows if int(window, 16)]
+
+
+# Returns a ViewIndex of the hierarchy of each root view expression, or of
+# every window when roots is None. Indexes are kept until the process resumes.
+def viewIndex(roots=None, refresh=False):
+    key = tuple(roots) if roots is not None else None
+
+    def build():
+        trees = []
+        for root in roots if roots is not None else windowExpressions():
+            tree = viewHelpers.snapshotViewHierarchy(root, properties=QUERY_PROPERTIES)
+            if tree is not None:
+                trees.append(tree)
+        return ViewIndex(trees)
+
+    if refresh:
+        index = build()
+        _indexes.put(key, index)
+        return index
+    return _indexes.get(key, build)
+
+
+def findViews(query, roots=None, limit=None, refresh=False):
+    return viewIndex(roots, refresh).query(query, limit)
+
+
+def describeView(node):
+    parts = ["{} {}".format(node.address, node.className)]
+    frame = node.properties["windowFrame"]
+    if frame is not None:
+        parts.append("frame: ({:g}, {:g}; {:g}, {:g})".format(*frame))
+    if node.properties["identifier"]:
+        parts.append("identifier: '{}'".format(node.properties["identifier"]))
+    if node.properties["label"]:
+        parts.append("label: '{}'".format(node.properties["label"]))
+    if node.properties["tag"]:
+        parts.append("tag: {}".format(node.properties["tag"]))
+    if node.hidden:
+        parts.append("hidden")
+    return " ".join(parts)
+
+
+def _objcStringLiteral(string):
+    return "@" + json.dumps(string, ensure_ascii=False)
+
+
+# Returns the ObjectMatch of each object in the hierarchy whose class name
+# matches regex (case insensitive, NSRegularExpression syntax). `roots` is an
+# expression for an NSArray of the root objects and `children` an expression
+# for the NSArray of children of `__object`. Raises ViewQueryError if the regex
+# is invalid.
+def findObjectsOfClassMatching(regex, roots, children, limit=None):
+    result = fb.evaluate(
+        CLASS_SEARCH_EXPRESSION.format(
+            pattern=_objcStringLiteral(regex),
+            roots=roots,
+            children=children,
+            limit=int(limit or 0),
+        )
+    )
+    if result is None:
+        return []
+    if result["error"]:
+        raise ViewQueryError("Invalid regex {}: {}".format(regex, result["error"]))
+    return [ObjectMatch(address, className) for address, className in result["matches"]]
+
+
+# Returns the ObjectMatch of each view under root (an expression) whose class
+# name matches regex.
+def findViewsOfClassMatching(regex, root, limit=None):
+    return findObjectsOfClassMatching(
+        regex, "@[(id)({})]".format(root), "(id)[__object subviews]", limit
+    )